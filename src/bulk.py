@@ -0,0 +1,251 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from io import StringIO
+from typing import Iterable, Iterator
+
+from sqlalchemy import Connection, MetaData, exists, func, select, text
+from sqlalchemy.schema import AddConstraint, CreateIndex, DropConstraint, DropIndex
+
+from .database import Base, System
+from .prices import refresh_prices
+from .upsert import system_rows
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# flush a table's buffered rows to the database once they exceed this
+# many characters
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+# PostgreSQL COPY text format escapes; cf.
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.2
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    return str(value).translate(_ESCAPES)
+
+
+@contextmanager
+def deferred_constraints(connection: Connection) -> Iterator[None]:
+    """Drop primary keys, foreign key constraints, and secondary
+    indexes, then re-create them on exit, so that PostgreSQL checks and
+    builds them once for the whole table instead of once per row.  Run
+    this inside a transaction; PostgreSQL rolls back DDL along with the
+    data.  Since nothing stops duplicate rows from going in meanwhile,
+    call remove_duplicates() before leaving."""
+    metadata = MetaData()
+    metadata.reflect(connection, only=list(Base.metadata.tables))
+    foreign_keys = [
+        fk for table in metadata.tables.values() for fk in table.foreign_key_constraints
+    ]
+    indexes = [index for table in metadata.tables.values() for index in table.indexes]
+    primary_keys = [
+        table.primary_key for table in metadata.tables.values() if table.primary_key
+    ]
+    for fk in foreign_keys:
+        connection.execute(DropConstraint(fk))
+    for index in indexes:
+        connection.execute(DropIndex(index))
+    for pk in primary_keys:
+        connection.execute(DropConstraint(pk))
+    yield
+    logger.info("Re-creating primary keys, indexes, and foreign key constraints")
+    for pk in primary_keys:
+        connection.execute(AddConstraint(pk))
+    for index in indexes:
+        connection.execute(CreateIndex(index))
+    for fk in foreign_keys:
+        connection.execute(AddConstraint(fk))
+
+
+def remove_duplicates(connection: Connection) -> dict[str, int]:
+    """Delete all but the first copy of each row, by primary key, from
+    every table, e.g., when a data dump lists a system or body twice.
+    Rows go in in dump order, so their physical order (ctid) tells
+    which came first.  Returns the number of rows deleted by table."""
+    removed = {}
+    for table in Base.metadata.sorted_tables:
+        key = ", ".join(f'"{column.name}"' for column in table.primary_key)
+        result = connection.execute(
+            text(
+                f"DELETE FROM {table.name} WHERE ctid IN ("
+                + "SELECT ctid FROM ("
+                + f"SELECT ctid, row_number() OVER (PARTITION BY {key} "
+                + f"ORDER BY ctid) AS copy FROM {table.name}"
+                + ") AS copies WHERE copy > 1)"
+            )
+        )
+        if result.rowcount:
+            logger.warning(
+                f"Removed {result.rowcount} duplicate rows from {table.name}"
+            )
+            removed[table.name] = result.rowcount
+    return removed
+
+
+class CopyLoader:
+    """Stream flattened Spansh systems into PostgreSQL via `COPY ...
+    FROM STDIN`, buffering each table's rows in the COPY text format.
+    Meant for empty databases: rows are never checked against what's
+    already stored."""
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.buffers = {}
+        self.columns = {}
+        self.factions = set()
+        self.stations = set()
+        self.count = 0
+        self.next_signals_id = (
+            connection.scalar(
+                select(func.coalesce(func.max(Base.metadata.tables["signals"].c.id), 0))
+            )
+            + 1
+        )
+
+    def _write(self, table: str, rows: list[dict]) -> None:
+        if not rows:
+            return
+        if table not in self.buffers:
+            self.buffers[table] = StringIO()
+            self.columns[table] = list(rows[0])
+        buffer = self.buffers[table]
+        for row in rows:
+            buffer.write("\t".join(_copy_value(v) for v in row.values()))
+            buffer.write("\n")
+        if buffer.tell() > COPY_BUFFER_SIZE:
+            self._flush(table)
+
+    def _flush(self, table: str) -> None:
+        buffer = self.buffers[table]
+        if not buffer.tell():
+            return
+        buffer.seek(0)
+        columns = ", ".join(f'"{column}"' for column in self.columns[table])
+        cursor = self.connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+        finally:
+            cursor.close()
+        buffer.seek(0)
+        buffer.truncate()
+
+    def add(self, in_data: dict) -> None:
+        """Buffer one system from a Spansh data dump."""
+        rows = system_rows(in_data)
+
+        # de-duplicate factions and stations (e.g., fleet carriers)
+        # across the whole load
+        factions = []
+        for faction in rows["faction"]:
+            if faction["name"] not in self.factions:
+                self.factions.add(faction["name"])
+                factions.append(faction)
+        rows["faction"] = factions
+        stations = {row["id"] for row in rows["station"]} & self.stations
+        if stations:
+            logger.warning(f"Skipping duplicate stations {sorted(stations)}")
+            for table, fk in [
+                ("station", "id"),
+                ("station_economy", "station_id"),
+                ("station_service", "station_id"),
+                ("market", "station_id"),
+                ("market_order", "market_id"),
+                ("prohibited_commodity", "market_id"),
+                ("shipyard", "station_id"),
+                ("shipyard_stock", "shipyard_id"),
+                ("outfitting", "station_id"),
+                ("outfitting_stock", "outfitting_id"),
+            ]:
+                rows[table] = [row for row in rows[table] if row[fk] not in stations]
+        self.stations.update(row["id"] for row in rows["station"])
+
+        # assign the signals' surrogate keys here
+        detected_signals = []
+        detected_genuses = []
+        for row in rows["signals"]:
+            row["id"] = self.next_signals_id
+            self.next_signals_id += 1
+            detected_signals.extend(
+                {**signal, "signals_id": row["id"]} for signal in row.pop("signals")
+            )
+            detected_genuses.extend(
+                {**genus, "signals_id": row["id"]} for genus in row.pop("genuses")
+            )
+        rows["detected_signal"] = detected_signals
+        rows["detected_genus"] = detected_genuses
+
+        for table, table_rows in rows.items():
+            self._write(table, table_rows)
+        self.count += 1
+
+    def finish(self) -> None:
+        """Send any remaining buffered rows and advance the signals
+        table's ID sequence past the IDs assigned during the load."""
+        for table in self.buffers:
+            self._flush(table)
+        self.connection.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('signals', 'id'), "
+                + "(SELECT coalesce(max(id), 0) + 1 FROM signals), false)"
+            )
+        )
+
+
+def copy_systems(
+    connection: Connection, records: Iterable[dict], history: bool = False
+) -> int:
+    """Bulk-load systems from a Spansh data dump into an empty
+    PostgreSQL database using `COPY ... FROM STDIN`, deferring primary
+    key and foreign key checks and secondary indexes until the end.
+    Returns the number of systems loaded.  Records that fail validation
+    are logged and skipped, and only the first copy of a system, body,
+    or other row listed more than once is kept.
+
+    Even though the database starts out empty, recording history isn't
+    moot: the loaded prices become the first entry in each market
+    order's history, just as the first ORM import of a market records
+    them, so later imports have something to compare against."""
+    if connection.dialect.name != "postgresql":
+        raise NotImplementedError("Bulk copy requires PostgreSQL")
+    if connection.scalar(select(exists().select_from(System))):
+        raise ValueError("Bulk copy requires an empty database")
+    with deferred_constraints(connection):
+        loader = CopyLoader(connection)
+        for in_data in records:
+            try:
+                loader.add(in_data)
+            except Exception as e:
+                logger.error(e)
+                continue
+            if not loader.count % 10000:
+                logger.info(f"Buffered {loader.count} systems")
+        loader.finish()
+        duplicates = remove_duplicates(connection).get("system", 0)
+        refresh_prices(connection, history=history)
+    return loader.count - duplicates
@@ -0,0 +1,144 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Annotated, List, Optional, Tuple
+
+import typer
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base
+from ..export import PAGE_SIZE, export_systems, write_systems
+from ..streams import create_dataset
+from .route import find_system
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# create the CLI
+app = typer.Typer()
+help = "Export data to other formats."
+
+
+@app.command()
+def spansh(
+    ctx: typer.Context,
+    output: Annotated[
+        Path,
+        typer.Argument(
+            help="Write the data dump to this file, compressed according to its "
+            + "extension (.gz, .bz2, .xz, or .zst).",
+            dir_okay=False,
+        ),
+    ],
+    since: Annotated[
+        Optional[datetime],
+        typer.Option(
+            "--since", help="Only export systems updated at or after this time (UTC)."
+        ),
+    ] = None,
+    within: Annotated[
+        Optional[Tuple[str, float]],
+        typer.Option(
+            "--within",
+            help="Only export systems within this many light years of the given "
+            + "system (by name or id64), e.g., `--within Sol 100`.",
+        ),
+    ] = None,
+    page_size: Annotated[
+        int,
+        typer.Option("--page-size", help="Read this many systems per query.", min=1),
+    ] = PAGE_SIZE,
+) -> None:
+    """Export systems as a Spansh-style galaxy data dump."""
+    app_cfg = ctx.obj["app_cfg"]
+    Session = sessionmaker(create_engine(app_cfg["database"]["uri"]))
+
+    with Session.begin() as session:
+        center, radius = None, None
+        if within and within[0] is not None:
+            center, radius = find_system(session, within[0]), within[1]
+        with create_dataset(output) as out:
+            count = write_systems(
+                out,
+                export_systems(
+                    session,
+                    since=since,
+                    center=center,
+                    radius=radius,
+                    page_size=page_size,
+                ),
+            )
+    typer.secho(f"Exported {count} systems to {output}")
+    typer.secho("Export complete.", fg=typer.colors.GREEN)
+
+
+@app.command()
+def parquet(
+    ctx: typer.Context,
+    directory: Annotated[
+        Path,
+        typer.Argument(
+            help="Write one Parquet dataset per table to a subdirectory of this "
+            + "directory.",
+            file_okay=False,
+        ),
+    ],
+    table: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            "--table",
+            "-t",
+            help="Only export this table.  Repeat to export several tables.  By "
+            + "default, every galaxy table is exported.",
+        ),
+    ] = None,
+    chunk_size: Annotated[
+        int,
+        typer.Option(
+            "--chunk-size", help="Read and write this many rows at a time.", min=1
+        ),
+    ] = 100_000,
+) -> None:
+    """Export tables as Parquet datasets partitioned by sector_x,
+    replacing those from any earlier export."""
+    try:
+        from ..parquet import export_parquet
+    except ImportError as e:
+        typer.secho(str(e), fg=typer.colors.RED)
+        raise typer.Exit(-1)
+
+    for name in table or []:
+        if name not in Base.metadata.tables:
+            typer.secho(f"No such table: {name}", fg=typer.colors.RED)
+            raise typer.Exit(-1)
+    app_cfg = ctx.obj["app_cfg"]
+    engine = create_engine(app_cfg["database"]["uri"])
+    try:
+        with engine.connect() as connection:
+            counts = export_parquet(
+                connection, directory, tables=table or None, chunk_size=chunk_size
+            )
+    except (OSError, ValueError) as e:
+        typer.secho(f"Export failed: {e}", fg=typer.colors.RED)
+        raise typer.Exit(-1)
+    for name, count in counts.items():
+        typer.secho(f"Exported {count} rows from {name}")
+    typer.secho("Export complete.", fg=typer.colors.GREEN)
@@ -16,15 +16,26 @@
 # <https://www.gnu.org/licenses/>.
 
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import cache, partial
 from pathlib import Path
-from typing import Annotated, Optional
+from typing import Annotated, BinaryIO, Iterable, Iterator, Optional
 
 import simplejson as json
 import typer
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
-from ..schemas.spansh import SystemSchema
+from ..bulk import copy_systems
+from ..database import ImportCheckpoint
+from ..factions import FactionCache, keep_factions
+from ..freshness import SystemDates, peek_id64
+from ..prices import refresh_prices, stored_stations, touched_stations
+from ..schemas.spansh import SystemLoader, SystemSchema
+from ..streams import fingerprint, json_array_offsets, open_dataset
+from ..upsert import upsert_factions, upsert_systems
 
 # configure module-level logging
 logger = logging.getLogger(__name__)
@@ -34,6 +45,282 @@ app = typer.Typer()
 help = "Import data from non-EDDN sources."
 
 
+# save import checkpoints at most this often, in seconds
+CHECKPOINT_INTERVAL = 60
+
+# per-process database session factory used by the parallel importer;
+# cf. _init_worker()
+_worker_sessionmaker = None
+
+
+def _spansh_records(ds: BinaryIO, offset: int = 0) -> Iterator[tuple[int, bytes]]:
+    """Yield each system's JSON text from a Spansh dump, which is a
+    JSON array of systems, along with the offset just past it."""
+    for end, load_data in json_array_offsets(ds, offset=offset):
+        logger.debug(load_data[:50] + b"..." if len(load_data) > 50 else load_data)
+        yield end, load_data
+
+
+class _Checkpoints:
+    """Record how far an import has safely progressed, i.e., the
+    offset in the dataset before which every system has been
+    committed, along with the number of those systems."""
+
+    def __init__(self, Session: sessionmaker, dataset: str, filename: str):
+        self.Session = Session
+        self.dataset = dataset
+        self.filename = filename
+        self.saved = time.monotonic()
+
+    def load(self) -> tuple[int, int] | None:
+        with self.Session.begin() as session:
+            checkpoint = session.get(ImportCheckpoint, self.dataset)
+            if checkpoint:
+                return checkpoint.offset, checkpoint.systems
+        return None
+
+    def save(self, offset: int, systems: int, force: bool = False) -> None:
+        """Save a checkpoint if CHECKPOINT_INTERVAL seconds have passed
+        since the last one (or if forced)."""
+        now = time.monotonic()
+        if not force and now - self.saved < CHECKPOINT_INTERVAL:
+            return
+        with self.Session.begin() as session:
+            session.merge(
+                ImportCheckpoint(
+                    dataset=self.dataset,
+                    filename=self.filename,
+                    offset=offset,
+                    systems=systems,
+                    updated=datetime.now(timezone.utc),
+                )
+            )
+        self.saved = now
+        logger.info(f"Checkpoint: {systems} systems through byte {offset}")
+
+
+def _decode(records: Iterable[bytes]) -> Iterator[dict]:
+    """Decode each system's JSON text, logging and skipping any that
+    are malformed."""
+    for load_data in records:
+        try:
+            # FIXME: add session support to Schema.loads() in
+            # marshmallow-sqlalchemy
+            yield json.loads(load_data, use_decimal=True)
+        except Exception as e:
+            logger.error(e)
+
+
+@cache
+def _system_schema() -> SystemSchema:
+    """Build the system schema tree once per process."""
+    return SystemSchema()
+
+
+@cache
+def _system_loader() -> SystemLoader:
+    """Compile the fast-path system loader once per process."""
+    return SystemLoader()
+
+
+@cache
+def _faction_cache() -> FactionCache:
+    """Share known factions between the transactions of a process."""
+    return FactionCache()
+
+
+def _import_system(
+    session: Session, load_data: dict, factions: dict, fast_load: bool = False
+) -> None:
+    """De-serialize one system from the Spansh dump and add it to the
+    session.  Faction objects are memoized in the given dictionary so
+    that systems sharing a transaction also share Faction objects."""
+    if fast_load:
+        new_system = _system_loader().load(load_data, session, factions)
+    else:
+        new_system = _system_schema().load(
+            load_data, session=session, factions=factions
+        )
+    typer.secho(f"Importing {new_system!r}")
+    session.add(new_system)
+
+
+def _import_systems(
+    session: Session, batch: list[dict], fast_load: bool = False
+) -> None:
+    """Load a batch of systems via the ORM, sharing Faction objects
+    between them."""
+    factions = {}
+    for load_data in batch:
+        _import_system(session, load_data, factions, fast_load)
+
+
+def _upsert_systems(session: Session, batch: list[dict]) -> None:
+    """Load a batch of systems via native SQL upserts."""
+    count = upsert_systems(session, batch)
+    typer.secho(f"Imported {count} of {len(batch)} systems")
+
+
+def _import_batch(
+    Session: sessionmaker,
+    batch: list[bytes],
+    upsert: bool = False,
+    preinsert_factions: bool = False,
+    fast_load: bool = False,
+    history: bool = False,
+) -> None:
+    """Import a batch of systems in a single transaction, along with
+    the commodity prices of their stations, old and new (and, if
+    requested, the history of those prices).  If that fails, fall back to importing
+    each system in its own transaction so that one bad record doesn't
+    discard the rest of the batch.  The ORM paths find the factions
+    seen by earlier transactions in this process's FactionCache
+    instead of looking them up again.  If `preinsert_factions` is set,
+    the ORM paths first insert or update the batch's factions, in name
+    order, in a transaction of their own, and then leave them alone, so
+    that concurrent imports cannot deadlock on them."""
+    if upsert:
+        load = _upsert_systems
+    elif fast_load:
+        load = partial(_import_systems, fast_load=True)
+    else:
+        load = _import_systems
+    records = list(_decode(batch))
+    preinserted = False
+    if preinsert_factions and not upsert:
+        try:
+            with Session.begin() as session:
+                upsert_factions(session, records)
+            preinserted = True
+        except Exception as e:
+            logger.warning(e)
+    try:
+        with Session.begin() as session:
+            if not upsert:
+                _faction_cache().attach(session, records)
+            if preinserted:
+                keep_factions(session)
+            stations = stored_stations(session, records)
+            load(session, records)
+            stations |= touched_stations(records)
+            refresh_prices(session, stations, history)
+        return
+    except Exception as e:
+        if len(records) == 1:
+            logger.error(e)
+            return
+        logger.info(f"Batch of {len(records)} systems failed, retrying individually")
+        logger.debug(e)
+    for load_data in records:
+        try:
+            with Session.begin() as session:
+                if not upsert:
+                    _faction_cache().attach(session, [load_data])
+                if preinserted:
+                    keep_factions(session)
+                stations = stored_stations(session, [load_data])
+                load(session, [load_data])
+                stations |= touched_stations([load_data])
+                refresh_prices(session, stations, history)
+        except Exception as e:
+            logger.error(e)
+
+
+def _init_worker(db_uri: str) -> None:
+    """Give each worker process its own database engine."""
+    global _worker_sessionmaker
+    _worker_sessionmaker = sessionmaker(create_engine(db_uri))
+
+
+def _import_shard(
+    batch: list[bytes], upsert: bool, fast_load: bool, history: bool
+) -> None:
+    """Import a batch of systems in a worker process."""
+    _import_batch(
+        _worker_sessionmaker,
+        batch,
+        upsert=upsert,
+        preinsert_factions=True,
+        fast_load=fast_load,
+        history=history,
+    )
+
+
+def _import_parallel(
+    db_uri: str,
+    records: Iterator[tuple[int, bytes]],
+    batch_size: int,
+    workers: int,
+    upsert: bool,
+    checkpoints: _Checkpoints,
+    resume_point: tuple[int, int],
+    dates: SystemDates | None = None,
+    fast_load: bool = False,
+    history: bool = False,
+) -> int:
+    """Fan batches of systems out to a pool of worker processes.
+    Systems are partitioned by id64, and each partition has at most
+    one batch in flight, so no system is ever part of two concurrent
+    transactions.  Since batches finish out of order, checkpoints
+    record the resume point of the oldest system not yet committed.
+    Returns the number of systems skipped as unchanged."""
+    shards = [[] for _ in range(workers)]
+    futures = [None] * workers
+
+    # each resume point is the (offset, count) of the systems before
+    # a given system; track it for the first system buffered in each
+    # shard and for the first system of each batch in flight
+    buffered = [None] * workers
+    in_flight = [None] * workers
+    latest = resume_point
+    skipped = 0
+
+    def safe_point() -> tuple[int, int]:
+        points = [latest]
+        for shard in range(workers):
+            future = futures[shard]
+            if future and not (future.done() and future.exception() is None):
+                points.append(in_flight[shard])
+            if buffered[shard]:
+                points.append(buffered[shard])
+        return min(points)
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(db_uri,)
+    ) as executor:
+
+        def submit(shard: int) -> None:
+            if futures[shard]:
+                futures[shard].result()
+            futures[shard] = executor.submit(
+                _import_shard, shards[shard], upsert, fast_load, history
+            )
+            in_flight[shard] = buffered[shard]
+            shards[shard] = []
+            buffered[shard] = None
+            checkpoints.save(*safe_point())
+
+        for end, load_data in records:
+            if dates and dates.is_stale(load_data):
+                skipped += 1
+                latest = (end, latest[1] + 1)
+                continue
+            shard = (peek_id64(load_data) or 0) % workers
+            shards[shard].append(load_data)
+            buffered[shard] = buffered[shard] or latest
+            latest = (end, latest[1] + 1)
+            if len(shards[shard]) >= batch_size:
+                submit(shard)
+        for shard in range(workers):
+            if shards[shard]:
+                submit(shard)
+        for future in futures:
+            if future:
+                future.result()
+    checkpoints.save(*latest, force=True)
+    return skipped
+
+
 @app.command()
 def status() -> None:
     pass
@@ -48,7 +335,8 @@ def spansh(
             help="Which dataset to import, e.g., galaxy_7days.  For the list of "
             + "available datasets, refer to <https://www.spansh.co.uk/dumps>.  If this "
             + "is a valid filename or URL, the dataset will be loaded from that "
-            + "location, instead."
+            + "location, instead.  Gzip, bzip2, xz, and Zstandard-compressed files "
+            + "are decompressed on the fly."
         ),
     ],
     foreground: Annotated[
@@ -60,6 +348,75 @@ def spansh(
             + "the background.",
         ),
     ] = None,
+    batch_size: Annotated[
+        int,
+        typer.Option(
+            "--batch-size",
+            "-b",
+            min=1,
+            help="Commit this many systems per database transaction.  If a batch "
+            + "fails, its systems are retried one at a time.",
+        ),
+    ] = 1,
+    workers: Annotated[
+        int,
+        typer.Option(
+            "--workers",
+            "-w",
+            min=1,
+            help="Import using this many worker processes.  Systems are partitioned "
+            + "among the workers by id64.",
+        ),
+    ] = 1,
+    upsert: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--upsert",
+            help="Write systems using native SQL upserts instead of the ORM, letting "
+            + "the database skip outdated systems, bodies, stations, and markets.",
+        ),
+    ] = None,
+    bulk_copy: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--bulk-copy",
+            help="Load an empty PostgreSQL database using COPY, deferring foreign key "
+            + "checks and indexes until the end.",
+        ),
+    ] = None,
+    resume: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--resume",
+            help="Continue an interrupted import of this dataset from its last "
+            + "checkpoint instead of starting over.",
+        ),
+    ] = None,
+    fast_load: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--fast-load",
+            help="De-serialize systems for the ORM using a compiled loader instead "
+            + "of the Marshmallow schemas.",
+        ),
+    ] = None,
+    skip_unchanged: Annotated[
+        bool,
+        typer.Option(
+            "--skip-unchanged",
+            help="Skip systems no newer than the database's copy before "
+            + "de-serializing them, using an index of system update times loaded "
+            + "when the import starts.",
+        ),
+    ] = False,
+    history: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--history",
+            help="Record the market orders that changed since the last import in "
+            + "the market order history before replacing them.",
+        ),
+    ] = None,
 ) -> None:
     """Import galaxy or system data from a Spansh data dump."""
     if not foreground:
@@ -76,7 +433,12 @@ def spansh(
         # it's ok if we can't
         pass
     if datafile and datafile.exists():
-        ds = datafile.open()
+        try:
+            # closed along with the command's context
+            ds = ctx.with_resource(open_dataset(datafile, text=False))
+        except ImportError as e:
+            typer.secho(str(e), fg=typer.colors.RED)
+            raise typer.Exit(-1)
     elif dataset.startswith(("file:", "http:", "https:")):
         typer.secho("FIXME: Import from URLs not implemented", fg=typer.colors.RED)
         raise typer.Exit(-1)
@@ -85,27 +447,93 @@ def spansh(
         raise typer.Exit(-1)
 
     engine = create_engine(app_cfg["database"]["uri"])
-    Session = sessionmaker(engine)
-    next(ds)  # first line is an opening bracket
-    for load_data in ds:
-        if load_data[0] == "]":
-            break
-        if load_data.endswith("\n"):
-            load_data = load_data[:-1]
-        if load_data.endswith(","):
-            load_data = load_data[:-1]
-        logger.debug(load_data[:50] + "..." if len(load_data) > 50 else load_data)
+    if bulk_copy:
+        if resume:
+            typer.secho("Bulk copy cannot resume an import", fg=typer.colors.RED)
+            raise typer.Exit(-1)
+        records = (load_data for _, load_data in _spansh_records(ds))
         try:
-            with Session.begin() as session:
-                # FIXME: add session support to Schema.loads() in
-                # marshmallow-sqlalchemy
-                new_system = SystemSchema().load(
-                    json.loads(load_data, use_decimal=True), session=session
+            with engine.begin() as connection:
+                count = copy_systems(connection, _decode(records), history)
+        except (NotImplementedError, ValueError) as e:
+            typer.secho(f"Bulk copy failed: {e}", fg=typer.colors.RED)
+            raise typer.Exit(-1)
+        typer.secho(f"Imported {count} systems")
+        typer.secho("Import complete.", fg=typer.colors.GREEN)
+        return
+
+    # pick up where a previous import left off, if requested
+    Session = sessionmaker(engine)
+    checkpoints = _Checkpoints(Session, fingerprint(datafile), datafile.name)
+    resume_point = (0, 0)
+    if resume:
+        if checkpoint := checkpoints.load():
+            resume_point = checkpoint
+            typer.secho(
+                f"Resuming after {resume_point[1]} systems (byte {resume_point[0]})"
+            )
+        else:
+            typer.secho(
+                "No checkpoint found for this dataset, starting from the beginning",
+                fg=typer.colors.YELLOW,
+            )
+    records = _spansh_records(ds, offset=resume_point[0])
+
+    # look up what's already in the database so that unchanged
+    # systems can be skipped cheaply
+    dates = None
+    if skip_unchanged:
+        with Session.begin() as session:
+            dates = SystemDates.load(session)
+
+    if workers > 1:
+        skipped = _import_parallel(
+            app_cfg["database"]["uri"],
+            records,
+            batch_size,
+            workers,
+            upsert,
+            checkpoints,
+            resume_point,
+            dates,
+            fast_load,
+            history,
+        )
+    else:
+        offset, count = resume_point
+        batch = []
+        pending = 0  # systems read since the last commit, skipped or not
+        skipped = 0
+        for offset, load_data in records:
+            pending += 1
+            if dates and dates.is_stale(load_data):
+                skipped += 1
+            else:
+                batch.append(load_data)
+            if len(batch) >= batch_size:
+                _import_batch(
+                    Session,
+                    batch,
+                    upsert=upsert,
+                    fast_load=fast_load,
+                    history=history,
                 )
-                typer.secho(f"Importing {new_system!r}")
-                session.add(new_system)
-        except Exception as e:
-            logger.error(e)
+                count += pending
+                pending = 0
+                checkpoints.save(offset, count)
+                batch = []
+        if batch:
+            _import_batch(
+                Session,
+                batch,
+                upsert=upsert,
+                fast_load=fast_load,
+                history=history,
+            )
+        count += pending
+        checkpoints.save(offset, count, force=True)
+    if skipped:
+        typer.secho(f"Skipped {skipped} unchanged systems")
     typer.secho("Import complete.", fg=typer.colors.GREEN)
 
 
@@ -0,0 +1,147 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..database import System
+from ..spatial import distance
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# create the CLI
+app = typer.Typer(context_settings={"allow_interspersed_args": True})
+help = "Plot the fewest-jump route between two systems."
+
+
+def find_system(session: Session, name_or_id64: str) -> System:
+    """Look up a system by id64 or, failing that, by name, which must
+    be unambiguous."""
+    if name_or_id64.isdigit():
+        if system := session.get(System, int(name_or_id64)):
+            return system
+    systems = session.scalars(select(System).where(System.name == name_or_id64)).all()
+    if not systems:
+        typer.secho(f"No such system: {name_or_id64}", fg=typer.colors.RED)
+        raise typer.Exit(-1)
+    if len(systems) > 1:
+        typer.secho(
+            f"{name_or_id64} is ambiguous; use one of these id64s instead: "
+            + ", ".join(str(system.id64) for system in systems),
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(-1)
+    return systems[0]
+
+
+def positive(value: float) -> float:
+    """Reject zero and negative option values, e.g., a jump range,
+    which typer's min cannot exclude."""
+    if value <= 0:
+        raise typer.BadParameter("must be positive")
+    return value
+
+
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    origin: Annotated[
+        str, typer.Argument(help="The name or id64 of the starting system.")
+    ],
+    destination: Annotated[
+        str, typer.Argument(help="The name or id64 of the destination system.")
+    ],
+    jump_range: Annotated[
+        float,
+        typer.Option(
+            "--jump-range",
+            "-j",
+            help="The ship's maximum jump range in light years.",
+            callback=positive,
+        ),
+    ],
+    weight: Annotated[
+        float,
+        typer.Option(
+            "--weight",
+            help="Trade route length for planning speed: the route found takes at "
+            + "most this many times the fewest possible jumps.  Use 1 for an exact "
+            + "(but potentially very slow) search.",
+            min=1,
+        ),
+    ] = 1.5,
+    index_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--index",
+            help="Keep the galaxy index in this file, refreshing it from the "
+            + "database, instead of rebuilding it from scratch every time.",
+        ),
+    ] = None,
+) -> None:
+    try:
+        from ..galaxy import GalaxyIndex
+        from ..route import plan_route
+    except ImportError as e:
+        typer.secho(str(e), fg=typer.colors.RED)
+        raise typer.Exit(-1)
+    app_cfg = ctx.obj["app_cfg"]
+    Session = sessionmaker(create_engine(app_cfg["database"]["uri"]))
+
+    with Session.begin() as session:
+        start = find_system(session, origin)
+        goal = find_system(session, destination)
+        if index_file and index_file.exists():
+            index = GalaxyIndex.open(index_file)
+            if index.refresh(session):
+                index.save(index_file)
+        else:
+            index = GalaxyIndex.build(session)
+            if index_file:
+                index.save(index_file)
+
+        route = plan_route(index, start, goal, jump_range, weight=weight)
+        if route is None:
+            typer.secho(
+                f"No route from {start.name} to {goal.name} within "
+                + f"{jump_range} ly per jump",
+                fg=typer.colors.RED,
+            )
+            raise typer.Exit(1)
+
+        stmt = select(System).where(System.id64.in_(route))
+        systems = {system.id64: system for system in session.scalars(stmt)}
+        total = 0.0
+        previous = None
+        for jumps, id64 in enumerate(route):
+            system = systems[id64]
+            line = f"{jumps:4d}. {system.name} ({system.id64})"
+            if previous:
+                jump = distance(previous, system)
+                total += jump
+                line += f", {jump:.2f} ly"
+            typer.echo(line)
+            previous = system
+    typer.secho(
+        f"{len(route) - 1} jumps, {total:.2f} ly in total", fg=typer.colors.GREEN
+    )
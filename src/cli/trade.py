@@ -0,0 +1,149 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from datetime import timedelta
+from typing import Annotated, Optional
+
+import typer
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .route import find_system, positive
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# create the CLI
+app = typer.Typer(context_settings={"allow_interspersed_args": True})
+help = "Find profitable trades between nearby stations."
+
+
+def _hop(hop) -> str:
+    cargo = (
+        f"{hop.units} t of {hop.symbol} ({hop.buyPrice} -> {hop.sellPrice} Cr/t), "
+        + f"{hop.profit} Cr profit"
+        if hop.symbol
+        else "nothing"
+    )
+    return (
+        f"{hop.source_station} ({hop.source_system}) -> "
+        + f"{hop.destination_station} ({hop.destination_system}), "
+        + f"{hop.distance:.2f} ly: {cargo}"
+    )
+
+
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    origin: Annotated[
+        str, typer.Argument(help="The name or id64 of the system to search around.")
+    ],
+    capacity: Annotated[
+        int,
+        typer.Option(
+            "--capacity", "-c", help="The ship's cargo capacity in tons.", min=1
+        ),
+    ],
+    jump_range: Annotated[
+        float,
+        typer.Option(
+            "--jump-range",
+            "-j",
+            help="The ship's maximum jump range in light years.",
+            callback=positive,
+        ),
+    ],
+    radius: Annotated[
+        Optional[float],
+        typer.Option(
+            "--radius",
+            "-r",
+            help="Consider stations up to this many light years from the origin "
+            + "(by default, the jump range).",
+            min=0,
+        ),
+    ] = None,
+    max_station_distance: Annotated[
+        Optional[float],
+        typer.Option(
+            "--max-station-distance",
+            help="Skip stations more than this many light seconds from the arrival "
+            + "star.",
+            min=0,
+        ),
+    ] = None,
+    pad_size: Annotated[
+        Optional[str],
+        typer.Option(
+            "--pad-size",
+            help="Skip stations without a landing pad for this ship size (L, M, or S).",
+        ),
+    ] = None,
+    max_age: Annotated[
+        Optional[float],
+        typer.Option(
+            "--max-age",
+            help="Skip markets whose data is older than this many days.",
+            min=0,
+        ),
+    ] = None,
+    loops: Annotated[
+        Optional[bool],
+        typer.Option("--loops", help="Find round trips instead of single hops."),
+    ] = None,
+    limit: Annotated[
+        int, typer.Option("--limit", "-n", help="Show this many trades.", min=1)
+    ] = 10,
+) -> None:
+    try:
+        from ..trade import find_loops, find_trades
+    except ImportError as e:
+        typer.secho(str(e), fg=typer.colors.RED)
+        raise typer.Exit(-1)
+    if pad_size and pad_size.upper()[:1] not in ("L", "M", "S"):
+        typer.secho(f"Unknown pad size: {pad_size}", fg=typer.colors.RED)
+        raise typer.Exit(-1)
+    app_cfg = ctx.obj["app_cfg"]
+    Session = sessionmaker(create_engine(app_cfg["database"]["uri"]))
+
+    with Session.begin() as session:
+        center = find_system(session, origin)
+        find = find_loops if loops else find_trades
+        trades = find(
+            session,
+            center,
+            capacity,
+            jump_range,
+            radius=radius,
+            max_station_distance=max_station_distance,
+            pad_size=pad_size,
+            max_age=timedelta(days=max_age) if max_age is not None else None,
+            limit=limit,
+        )
+    if not trades:
+        typer.secho(
+            f"No profitable trades found around {origin}", fg=typer.colors.YELLOW
+        )
+        return
+    for rank, found in enumerate(trades, 1):
+        if loops:
+            typer.echo(f"{rank:3d}. {found.profit} Cr profit per round trip")
+            typer.echo(f"     {_hop(found.outbound)}")
+            typer.echo(f"     {_hop(found.inbound)}")
+        else:
+            typer.echo(f"{rank:3d}. {_hop(found)}")
@@ -18,15 +18,20 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime
+import math
+from datetime import datetime, timezone
 from decimal import Decimal
+from functools import cache
 from typing import List, Optional
 
-from sqlalchemy import BigInteger, ForeignKey
+from sqlalchemy import DDL, BigInteger, ForeignKey, Index, event, inspect
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
+    Relationship,
+    RelationshipDirection,
     mapped_column,
+    object_session,
     relationship,
     validates,
 )
@@ -34,16 +39,68 @@ from sqlalchemy.orm import (
 # configure module-level logging
 logger = logging.getLogger(__name__)
 
+# systems are bucketed into cubes this many light years on a side for
+# spatial queries, cf. lethbridge.spatial
+CELL_SIZE = 32
+
+
+def grid_cell(coordinate: Decimal | float) -> int:
+    """Find the grid cell containing a coordinate along one axis."""
+    return math.floor(coordinate / CELL_SIZE)
+
+
+# the cascade of children whose primary key includes their parent's:
+# replacing them, e.g., on re-importing a system, deletes the old rows,
+# or updates them in place where a new child has the same key
+_OWNED = "all, delete-orphan"
+
+
+def _grid_cell_default(axis: str):
+    """Make a column default that computes a system's grid cell from
+    the given coordinate at insert time."""
+
+    def default(context) -> int:
+        return grid_cell(context.get_current_parameters()[axis])
+
+    return default
+
+
+def _utc(value: datetime) -> datetime:
+    """Take naive date/times, e.g., as read back from the database, to
+    be in UTC so that they compare with incoming, tz-aware ones."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
 
 class Base(DeclarativeBase):
     """This class tracks ORM class definitions and related metadata
     for the tables created in this module."""
 
-    # FIXME: implement this constraint using a BEFORE UPDATE trigger
-    # instead of the @validates decorator?
+    def __eq__(self, other: Base) -> bool:
+        """Compare rows by identity: their primary keys and, for tables
+        with a version column (cf. MONOTONIC_COLUMNS), their versions.
+        This never loads a relationship, so the comparisons the ORM
+        and marshmallow-sqlalchemy make in passing cost the same
+        however big the object graph is.  Objects lacking a complete
+        primary key, e.g., before their first flush, only equal
+        themselves.  Cf. equivalent() for a structural comparison."""
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return NotImplemented
+        key = self.__mapper__.primary_key_from_instance(self)
+        if None in key or key != other.__mapper__.primary_key_from_instance(other):
+            return False
+        version = MONOTONIC_COLUMNS.get(self.__tablename__)
+        return version is None or getattr(self, version) == getattr(other, version)
+
+    # the database enforces this constraint, too, for writes that
+    # bypass the ORM (cf. MONOTONIC_COLUMNS); checking here as well
+    # fails fast since the ORM has already loaded the old value
     def value_must_increase(self, key, new_value):
         old_value = getattr(self, key, None)
-        if old_value and old_value >= new_value:
+        if old_value and _utc(old_value) >= _utc(new_value):
             raise ValueError(
                 f"Update uses outdated data for {self!r}: "
                 + f"old_value={old_value!r}, new_value={new_value!r}"
@@ -51,6 +108,54 @@ class Base(DeclarativeBase):
         return new_value
 
 
+def equivalent(a: Base | None, b: Base | None) -> bool:
+    """Compare two objects structurally, e.g., a system as loaded from
+    the database with one freshly de-serialized, in tests.  This
+    compares every column except foreign keys and those filled in on
+    insert; the objects each one owns (its one-to-many relationships),
+    recursively and in any order; and the objects each one refers to
+    (its many-to-one relationships other than to its owner), by
+    identity.  Unlike ==, this loads the objects' entire graphs."""
+    if a is None or b is None:
+        return a is b
+    if type(a) is not type(b):
+        return False
+    mapper = a.__mapper__
+    for column in mapper.columns:
+        if column.foreign_keys or column.default is not None:
+            continue
+        key = mapper.get_property_by_column(column).key
+        if getattr(a, key) != getattr(b, key):
+            return False
+    for prop in mapper.relationships:
+        if not prop.info.get("compare", True):
+            continue
+        many_to_one = prop.direction is RelationshipDirection.MANYTOONE
+        reverse = prop.back_populates
+        if many_to_one and reverse:
+            if prop.mapper.relationships[reverse].info.get("compare", True):
+                continue  # the owner, which compares its children
+        x, y = getattr(a, prop.key), getattr(b, prop.key)
+        if many_to_one:
+            if (x is None or y is None) and x is not y or x != y:
+                return False
+        elif not prop.uselist:
+            if not equivalent(x, y):
+                return False
+        else:
+            if len(x) != len(y):
+                return False
+            unmatched = list(y)
+            for item in x:
+                for i, candidate in enumerate(unmatched):
+                    if equivalent(item, candidate):
+                        del unmatched[i]
+                        break
+                else:
+                    return False
+    return True
+
+
 class FactionState(Base):
     """A faction's influence over and status within a given system.
 
@@ -75,6 +180,7 @@ class FactionState(Base):
     system_id64: Mapped[int] = mapped_column(
         ForeignKey("system.id64"),
         primary_key=True,
+        index=True,
     )
     system: Mapped["System"] = relationship(back_populates="factions")
 
@@ -110,15 +216,19 @@ class Faction(Base):
     allegiance: Mapped[str | None]
     government: Mapped[str | None]
 
+    # these look up the objects that refer to a faction rather than
+    # belonging to it, so equivalent() doesn't follow them
     controlledStations: Mapped[List["Station"]] = relationship(
-        back_populates="controllingFaction"
+        back_populates="controllingFaction", info={"compare": False}
     )
 
     controlledSystems: Mapped[List["System"]] = relationship(
-        back_populates="controllingFaction"
+        back_populates="controllingFaction", info={"compare": False}
     )
 
-    systems: Mapped[List["FactionState"]] = relationship(back_populates="faction")
+    systems: Mapped[List["FactionState"]] = relationship(
+        back_populates="faction", info={"compare": False}
+    )
 
     def __repr__(self):
         return f"<Faction({self.name!r})>"
@@ -153,10 +263,7 @@ class PowerPlay(Base):
         return f"<PowerPlay({self.power}, system_id64={self.system_id64}))>"
 
     def __eq__(self, other: PowerPlay) -> bool:
-        return (
-            self.power_name == other.power_name
-            and self.system_id64 == other.system_id64
-        )
+        return self.power == other.power and self.system_id64 == other.system_id64
 
 
 class ThargoidWar(Base):
@@ -185,6 +292,9 @@ class ThargoidWar(Base):
         )
 
     def __eq__(self, other: ThargoidWar) -> bool:
+        # the ORM compares the one it replaces with None
+        if not isinstance(other, ThargoidWar):
+            return NotImplemented
         return (
             self.currentState == other.currentState
             and self.successState == other.successState
@@ -323,11 +433,11 @@ class Signals(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
-    signals: Mapped[List["DetectedSignal"]] = relationship()
-    genuses: Mapped[List["DetectedGenus"]] = relationship()
-    updateTime: Mapped[datetime]
+    signals: Mapped[List["DetectedSignal"]] = relationship(cascade=_OWNED)
+    genuses: Mapped[List["DetectedGenus"]] = relationship(cascade=_OWNED)
+    updateTime: Mapped[datetime] = mapped_column(index=True)
 
-    body_id64: Mapped[int | None] = mapped_column(ForeignKey("body.id64"))
+    body_id64: Mapped[int | None] = mapped_column(ForeignKey("body.id64"), index=True)
     ring_name: Mapped[str | None] = mapped_column(ForeignKey("ring.name"))
 
     def __repr__(self):
@@ -337,13 +447,6 @@ class Signals(Base):
             + f"body_id64={self.body_id64 or 'pending'})>"
         )
 
-    def __eq__(self, other: Signals) -> bool:
-        return (
-            self.signals == other.signals
-            and self.updateTime == other.updateTime
-            and self.body_id64 == other.body_id64
-        )
-
     @validates("updateTime")
     def value_must_increase(self, key, new_value):
         return super().value_must_increase(key, new_value)
@@ -430,7 +533,6 @@ class Ring(Base):
             and self.mass == other.mass
             and self.innerRadius == other.innerRadius
             and self.outerRadius == other.outerRadius
-            and self.signals == other.signals
             and self.body_id64 == other.body_id64
         )
 
@@ -490,16 +592,18 @@ class Body(Base):
     surfacePressure: Mapped[Decimal | None]
     volcanismType: Mapped[str | None]
     atmosphereType: Mapped[str | None]
-    atmosphereComposition: Mapped[List["AtmosphereComposition"]] = relationship()
-    solidComposition: Mapped[List["SolidComposition"]] = relationship()
+    atmosphereComposition: Mapped[List["AtmosphereComposition"]] = relationship(
+        cascade=_OWNED
+    )
+    solidComposition: Mapped[List["SolidComposition"]] = relationship(cascade=_OWNED)
     terraformingState: Mapped[str | None]
-    materials: Mapped[List["Material"]] = relationship()
+    materials: Mapped[List["Material"]] = relationship(cascade=_OWNED)
     signals: Mapped[Optional["Signals"]] = relationship()
     reserveLevel: Mapped[str | None]
     rotationalPeriod: Mapped[Decimal | None]
     rotationalPeriodTidallyLocked: Mapped[bool | None]
     axialTilt: Mapped[Decimal | None]
-    parents: Mapped[List["Parent"]] = relationship()
+    parents: Mapped[List["Parent"]] = relationship(cascade=_OWNED)
     orbitalPeriod: Mapped[Decimal | None]
     semiMajorAxis: Mapped[Decimal | None]
     orbitalEccentricity: Mapped[Decimal | None]
@@ -509,22 +613,21 @@ class Body(Base):
     ascendingNode: Mapped[Decimal | None]
     belts: Mapped[List["Belt"]] = relationship(back_populates="body")
     rings: Mapped[List["Ring"]] = relationship(back_populates="body")
-    timestamps: Mapped[List["BodyTimestamp"]] = relationship()
+    timestamps: Mapped[List["BodyTimestamp"]] = relationship(cascade=_OWNED)
     stations: Mapped[List["Station"]] = relationship(back_populates="body")
-    updateTime: Mapped[datetime]
+    updateTime: Mapped[datetime] = mapped_column(index=True)
 
     # a system may contain many bodies; model this as a
     # bi-directional, nullable, many-to-one relationship
     # (bodies:system)
-    system_id64: Mapped[Optional[int]] = mapped_column(ForeignKey("system.id64"))
+    system_id64: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("system.id64"), index=True
+    )
     system: Mapped[Optional["System"]] = relationship(back_populates="bodies")
 
     def __repr__(self):
         return f"<Body(id64={self.id64!r}, {self.name!r})>"
 
-    def __eq__(self, other: Body) -> bool:
-        return self.id64 == other.id64 and self.updateTime == other.updateTime
-
     @validates("updateTime")
     def value_must_increase(self, key, new_value):
         return super().value_must_increase(key, new_value)
@@ -578,6 +681,10 @@ class MarketOrder(Base):
     relationship."""
 
     __tablename__ = "market_order"
+    __table_args__ = (
+        Index("ix_market_order_symbol_buyPrice", "symbol", "buyPrice"),
+        Index("ix_market_order_symbol_sellPrice", "symbol", "sellPrice"),
+    )
 
     # name
     symbol: Mapped[str] = mapped_column(primary_key=True)
@@ -638,23 +745,17 @@ class Market(Base):
 
     __tablename__ = "market"
 
-    commodities: Mapped[List["MarketOrder"]] = relationship()
-    prohibitedCommodities: Mapped[List["ProhibitedCommodity"]] = relationship()
-    updateTime: Mapped[datetime]
+    commodities: Mapped[List["MarketOrder"]] = relationship(cascade=_OWNED)
+    prohibitedCommodities: Mapped[List["ProhibitedCommodity"]] = relationship(
+        cascade=_OWNED
+    )
+    updateTime: Mapped[datetime] = mapped_column(index=True)
 
     station_id: Mapped[int] = mapped_column(ForeignKey("station.id"), primary_key=True)
 
     def __repr__(self):
         return f"<Market(station_id={self.station_id})>"
 
-    def __eq__(self, other: Market) -> bool:
-        return (
-            self.station_id == other.station_id
-            and self.updateTime == other.updateTime
-            and self.commodities == other.commodities
-            and self.prohibitedCommodities == other.prohibitedCommodities
-        )
-
     @validates("updateTime")
     def value_must_increase(self, key, new_value):
         return super().value_must_increase(key, new_value)
@@ -690,21 +791,14 @@ class Shipyard(Base):
 
     __tablename__ = "shipyard"
 
-    ships: Mapped[List["ShipyardStock"]] = relationship()
-    updateTime: Mapped[datetime]
+    ships: Mapped[List["ShipyardStock"]] = relationship(cascade=_OWNED)
+    updateTime: Mapped[datetime] = mapped_column(index=True)
 
     station_id: Mapped[int] = mapped_column(ForeignKey("station.id"), primary_key=True)
 
     def __repr__(self):
         return f"<Shipyard(station_id={self.station_id})>"
 
-    def __eq__(self, other: Shipyard) -> bool:
-        return (
-            self.station_id == other.station_id
-            and self.updateTime == other.updateTime
-            and self.ships == other.ships
-        )
-
     @validates("updateTime")
     def value_must_increase(self, key, new_value):
         return super().value_must_increase(key, new_value)
@@ -754,21 +848,14 @@ class Outfitting(Base):
 
     __tablename__ = "outfitting"
 
-    modules: Mapped[List["OutfittingStock"]] = relationship()
-    updateTime: Mapped[datetime]
+    modules: Mapped[List["OutfittingStock"]] = relationship(cascade=_OWNED)
+    updateTime: Mapped[datetime] = mapped_column(index=True)
 
     station_id: Mapped[int] = mapped_column(ForeignKey("station.id"), primary_key=True)
 
     def __repr__(self):
         return f"<Outfitting(station_id={self.station_id})>"
 
-    def __eq__(self, other: Outfitting) -> bool:
-        return (
-            self.station_id == other.station_id
-            and self.updateTime == other.updateTime
-            and self.modules == other.modules
-        )
-
     @validates("updateTime")
     def value_must_increase(self, key, new_value):
         return super().value_must_increase(key, new_value)
@@ -780,9 +867,9 @@ class Station(Base):
 
     __tablename__ = "station"
 
-    name: Mapped[str]
+    name: Mapped[str] = mapped_column(index=True)
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
-    updateTime: Mapped[datetime]
+    updateTime: Mapped[datetime] = mapped_column(index=True)
     controllingFaction_id: Mapped[str | None] = mapped_column(
         ForeignKey("faction.name")
     )
@@ -792,30 +879,34 @@ class Station(Base):
     controllingFactionState: Mapped[str | None]
     distanceToArrival: Mapped[Decimal | None]
     primaryEconomy: Mapped[str | None]
-    economies: Mapped[List["StationEconomy"]] = relationship()
+    economies: Mapped[List["StationEconomy"]] = relationship(cascade=_OWNED)
     allegiance: Mapped[str | None]
     government: Mapped[str | None]
-    services: Mapped[List["StationService"]] = relationship()
+    services: Mapped[List["StationService"]] = relationship(cascade=_OWNED)
     type: Mapped[str | None]
     latitude: Mapped[Decimal | None]
     longitude: Mapped[Decimal | None]
     largeLandingPads: Mapped[int | None]  # landingPads
     mediumLandingPads: Mapped[int | None]
     smallLandingPads: Mapped[int | None]
-    market: Mapped[Optional["Market"]] = relationship()
-    shipyard: Mapped[Optional["Shipyard"]] = relationship()
-    outfitting: Mapped[Optional["Outfitting"]] = relationship()
+    market: Mapped[Optional["Market"]] = relationship(cascade=_OWNED)
+    shipyard: Mapped[Optional["Shipyard"]] = relationship(cascade=_OWNED)
+    outfitting: Mapped[Optional["Outfitting"]] = relationship(cascade=_OWNED)
 
     # a body might support many surface ports; model this as a
     # bi-directional, nullable, many-to-one relationship
     # (stations:body)
-    body_id64: Mapped[Optional[int]] = mapped_column(ForeignKey("body.id64"))
+    body_id64: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("body.id64"), index=True
+    )
     body: Mapped[Optional["Body"]] = relationship(back_populates="stations")
 
     # a system may contain many space stations; model this as a
     # bi-directional, nullable, many-to-one relationship
     # (stations:system)
-    system_id64: Mapped[Optional[int]] = mapped_column(ForeignKey("system.id64"))
+    system_id64: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("system.id64"), index=True
+    )
     system: Mapped[Optional["System"]] = relationship(back_populates="stations")
 
     def __repr__(self):
@@ -825,9 +916,6 @@ class Station(Base):
             + f"body_id64={self.body_id64})>"
         )
 
-    def __eq__(self, other: Station) -> bool:
-        return self.id == other.id and self.updateTime == self.updateTime
-
     @validates("updateTime")
     def value_must_increase(self, key, new_value):
         return super().value_must_increase(key, new_value)
@@ -838,12 +926,16 @@ class System(Base):
     bodies."""
 
     __tablename__ = "system"
+    __table_args__ = (Index("ix_system_cell", "cell_x", "cell_y", "cell_z"),)
 
     id64: Mapped[int] = mapped_column(BigInteger, primary_key=True)
-    name: Mapped[str]  # not unique, e.g., AH Cancri
+    name: Mapped[str] = mapped_column(index=True)  # not unique, e.g., AH Cancri
     x: Mapped[Decimal]  # coords
     y: Mapped[Decimal]
     z: Mapped[Decimal]
+    cell_x: Mapped[int] = mapped_column(default=_grid_cell_default("x"))
+    cell_y: Mapped[int] = mapped_column(default=_grid_cell_default("y"))
+    cell_z: Mapped[int] = mapped_column(default=_grid_cell_default("z"))
     allegiance: Mapped[str | None]
     government: Mapped[str | None]
     primaryEconomy: Mapped[str | None]
@@ -857,10 +949,12 @@ class System(Base):
     controllingFaction: Mapped[Optional["Faction"]] = relationship(
         back_populates="controlledSystems"
     )
-    factions: Mapped[List["FactionState"]] = relationship(back_populates="system")
-    powers: Mapped[List["PowerPlay"]] = relationship()
+    factions: Mapped[List["FactionState"]] = relationship(
+        back_populates="system", cascade=_OWNED
+    )
+    powers: Mapped[List["PowerPlay"]] = relationship(cascade=_OWNED)
     powerState: Mapped[str | None]
-    thargoidWar: Mapped[Optional["ThargoidWar"]] = relationship()
+    thargoidWar: Mapped[Optional["ThargoidWar"]] = relationship(cascade=_OWNED)
     date: Mapped[datetime]
     bodies: Mapped[List["Body"]] = relationship(back_populates="system")
     stations: Mapped[List["Station"]] = relationship(back_populates="system")
@@ -868,29 +962,266 @@ class System(Base):
     def __repr__(self):
         return f"<System(id64={self.id64!r}, {self.name!r})>"
 
-    def __eq__(self, other: System) -> bool:
-        return (
-            self.id64 == other.id64
-            and self.name == other.name
-            and self.x == other.x  # coords
-            and self.y == other.y
-            and self.z == other.z
-            and self.allegiance == other.allegiance
-            and self.government == other.government
-            and self.primaryEconomy == other.primaryEconomy
-            and self.secondaryEconomy == other.secondaryEconomy
-            and self.security == other.security
-            and self.population == other.population
-            and self.bodyCount == other.bodyCount
-            and self.controllingFaction == other.controllingFaction
-            and self.factions == other.factions
-            and self.powers == other.powers
-            and self.powerState == other.powerState
-            and self.date == other.date
-            and self.bodies == other.bodies
-            and self.stations == other.stations
-        )
-
     @validates("date")
     def value_must_increase(self, key, new_value):
         return super().value_must_increase(key, new_value)
+
+
+class CommodityPrice(Base):
+    """The latest price of a commodity at a station, denormalized
+    along with where the station is and what it can dock, so that
+    price queries read a single table instead of joining market
+    orders to their markets, stations, bodies, and systems.  This is a
+    read model derived from the normalized tables, cf.
+    lethbridge.prices.refresh_prices(); it has no foreign keys so that
+    it can be rebuilt independently of them."""
+
+    __tablename__ = "commodity_price"
+    __table_args__ = (
+        Index("ix_commodity_price_symbol_buyPrice", "symbol", "buyPrice"),
+        Index("ix_commodity_price_symbol_sellPrice", "symbol", "sellPrice"),
+        Index("ix_commodity_price_cell", "cell_x", "cell_y", "cell_z"),
+    )
+
+    station_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    symbol: Mapped[str] = mapped_column(primary_key=True)
+    category: Mapped[str] = mapped_column(primary_key=True)
+    station_name: Mapped[str]
+    system_id64: Mapped[int] = mapped_column(BigInteger)
+    system_name: Mapped[str]
+    x: Mapped[Decimal]
+    y: Mapped[Decimal]
+    z: Mapped[Decimal]
+    cell_x: Mapped[int]
+    cell_y: Mapped[int]
+    cell_z: Mapped[int]
+    padSize: Mapped[str | None]  # largest landing pad, L/M/S
+    distanceToArrival: Mapped[Decimal | None]
+    buyPrice: Mapped[int]
+    supply: Mapped[int]
+    sellPrice: Mapped[int]
+    demand: Mapped[int]
+    updateTime: Mapped[datetime]
+
+    def __repr__(self):
+        return (
+            f"<CommodityPrice({self.symbol!r}, station_id={self.station_id}, "
+            + f"buyPrice={self.buyPrice}, sellPrice={self.sellPrice})>"
+        )
+
+
+class MarketOrderHistory(Base):
+    """An earlier value of a market order, appended whenever an import
+    changes the order's prices, supply, or demand, cf.
+    lethbridge.history.  Recording history is opt-in, and like
+    commodity_price, this table has no foreign keys, so that history
+    outlives the stations and markets it describes."""
+
+    __tablename__ = "market_order_history"
+    __table_args__ = (
+        Index("ix_market_order_history_symbol_updateTime", "symbol", "updateTime"),
+    )
+
+    market_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    symbol: Mapped[str] = mapped_column(primary_key=True)
+    category: Mapped[str] = mapped_column(primary_key=True)
+    updateTime: Mapped[datetime] = mapped_column(primary_key=True)
+    buyPrice: Mapped[int]
+    supply: Mapped[int]
+    sellPrice: Mapped[int]
+    demand: Mapped[int]
+
+    def __repr__(self):
+        return (
+            f"<MarketOrderHistory({self.symbol!r}, market_id={self.market_id}, "
+            + f"updateTime={self.updateTime!r})>"
+        )
+
+
+class ImportCheckpoint(Base):
+    """How far an import of a given data dump has progressed, so that
+    an interrupted import can pick up where it left off instead of
+    starting over."""
+
+    __tablename__ = "import_checkpoint"
+
+    dataset: Mapped[str] = mapped_column(primary_key=True)  # cf. streams.fingerprint()
+    filename: Mapped[str]
+    offset: Mapped[int] = mapped_column(BigInteger)  # in the decompressed data
+    systems: Mapped[int] = mapped_column(BigInteger)
+    updated: Mapped[datetime]
+
+    def __repr__(self):
+        return (
+            f"<ImportCheckpoint({self.filename!r}, offset={self.offset!r}, "
+            + f"systems={self.systems!r})>"
+        )
+
+
+# columns that must increase with every update, by table; BEFORE
+# UPDATE triggers skip updates that would move them backwards (or
+# leave them unchanged), so writers outside the ORM, e.g.,
+# lethbridge.upsert, can't regress stored data; the triggers only
+# fire on updates that set the column, so unlinking a station from
+# its system, say, still works
+MONOTONIC_COLUMNS = {
+    "system": "date",
+    "body": "updateTime",
+    "station": "updateTime",
+    "market": "updateTime",
+    "shipyard": "updateTime",
+    "outfitting": "updateTime",
+    "signals": "updateTime",
+    "body_timestamp": "value",
+}
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL(
+        "CREATE OR REPLACE FUNCTION skip_stale_update() RETURNS trigger "
+        + "LANGUAGE plpgsql AS $$ BEGIN RETURN NULL; END $$"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    Base.metadata,
+    "after_drop",
+    DDL("DROP FUNCTION IF EXISTS skip_stale_update()").execute_if(dialect="postgresql"),
+)
+
+
+def _monotonic_triggers(table: str, column: str) -> None:
+    """Attach the triggers guarding a column to its table's DDL."""
+    trigger = f"{table}_{column}_must_increase"
+    when = f'NEW."{column}" <= OLD."{column}"'
+    event.listen(
+        Base.metadata.tables[table],
+        "after_create",
+        DDL(
+            f'CREATE TRIGGER {trigger} BEFORE UPDATE OF "{column}" ON {table} '
+            + f"FOR EACH ROW WHEN ({when}) EXECUTE FUNCTION skip_stale_update()"
+        ).execute_if(dialect="postgresql"),
+    )
+    event.listen(
+        Base.metadata.tables[table],
+        "after_create",
+        DDL(
+            f'CREATE TRIGGER {trigger} BEFORE UPDATE OF "{column}" ON {table} '
+            + f"FOR EACH ROW WHEN {when} BEGIN SELECT RAISE(IGNORE); END"
+        ).execute_if(dialect="sqlite"),
+    )
+
+
+for table, column in MONOTONIC_COLUMNS.items():
+    _monotonic_triggers(table, column)
+
+
+@cache
+def _sibling_key_columns(prop: Relationship) -> list[tuple[str, list]]:
+    """List the attributes that tell a relationship's children apart:
+    their primary key less their parent's, along with the many-to-one
+    relationships that fill in each one, e.g., FactionState.faction,
+    for children that haven't been flushed yet."""
+    mapper = prop.mapper
+    parent = {remote for _, remote in prop.local_remote_pairs}
+    columns = []
+    for column in mapper.primary_key:
+        if column in parent:
+            continue
+        via = [
+            (rel.key, rel.mapper.get_property_by_column(remote).key)
+            for rel in mapper.relationships
+            if rel.direction is RelationshipDirection.MANYTOONE
+            for local, remote in rel.local_remote_pairs
+            if local is column
+        ]
+        columns.append((mapper.get_property_by_column(column).key, via))
+    return columns
+
+
+def _sibling_key(prop: Relationship, child: Base) -> tuple:
+    values = inspect(child).dict
+    key = []
+    for name, via in _sibling_key_columns(prop):
+        value = values.get(name)
+        for rel, remote in via:
+            if value is None and (related := values.get(rel)) is not None:
+                value = getattr(related, remote)
+        key.append(value)
+    return tuple(key)
+
+
+def _update_child(old: Base, new: Base) -> Base:
+    """Bring a stored child up to date with an incoming copy of it and
+    return the stored one, which keeps its row.  Copies no newer than
+    the stored child (cf. MONOTONIC_COLUMNS) leave it untouched."""
+    if old is new:
+        return old
+    mapper = old.__mapper__
+    values = inspect(new).dict
+    version = MONOTONIC_COLUMNS.get(old.__tablename__)
+    if (
+        version is None
+        or not getattr(old, version)
+        or values.get(version) is not None
+        and _utc(values[version]) > _utc(getattr(old, version))
+    ):
+        for prop in mapper.column_attrs:
+            if prop.key in values and not any(c.primary_key for c in prop.columns):
+                if getattr(old, prop.key) != values[prop.key]:
+                    setattr(old, prop.key, values[prop.key])
+        for prop in mapper.relationships:
+            if prop.direction is not RelationshipDirection.MANYTOONE:
+                if prop.key in values:
+                    value = values[prop.key]
+                    setattr(old, prop.key, list(value) if prop.uselist else value)
+    return old
+
+
+def _stored(target: Base, key: str):
+    session = object_session(target)
+    if session is None:
+        return getattr(target, key)
+    with session.no_autoflush:
+        return getattr(target, key)
+
+
+def _reuse_children(prop: Relationship) -> None:
+    """Match the children assigned to an owned relationship (cf.
+    _OWNED) against the stored ones by primary key, e.g., when
+    re-importing a system, updating the stored children in place
+    instead of deleting them and inserting new ones with the same
+    keys."""
+
+    def bulk_replace(target, values, initiator):
+        stored = {
+            _sibling_key(prop, child): child for child in _stored(target, prop.key)
+        }
+        reused = set()
+        for i, child in enumerate(values):
+            old = stored.get(_sibling_key(prop, child))
+            if old is not None and id(old) not in reused:
+                values[i] = _update_child(old, child)
+                reused.add(id(old))
+
+    def set_(target, value, old, initiator):
+        if not isinstance(value, Base) or not isinstance(old, Base) or value is old:
+            return value
+        # the cascade into the session may have run first
+        session = object_session(value)
+        if session is not None and value in session.new:
+            session.expunge(value)
+        return _update_child(old, value)
+
+    if prop.uselist:
+        event.listen(prop.class_attribute, "bulk_replace", bulk_replace)
+    else:
+        event.listen(
+            prop.class_attribute, "set", set_, retval=True, active_history=True
+        )
+
+
+for mapper in Base.registry.mappers:
+    for prop in mapper.relationships:
+        if prop.cascade.delete_orphan:
+            _reuse_children(prop)
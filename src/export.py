@@ -0,0 +1,88 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from datetime import datetime
+from typing import Iterator, TextIO
+
+import simplejson as json
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import System
+from .loading import FULL_SYSTEM
+from .schemas.spansh import SystemSchema
+from .spatial import Coords, cell_filters, coords, distance
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# export this many systems per query; each page's relationships load
+# per the FULL_SYSTEM profile, and the page is dropped from the
+# session before the next one loads
+PAGE_SIZE = 1000
+
+
+def export_systems(
+    session: Session,
+    since: datetime | None = None,
+    center: System | Coords | None = None,
+    radius: float | None = None,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[dict]:
+    """Dump systems in the Spansh data dump format, in id64 order,
+    optionally only those updated since the given time and those
+    within the given radius (in light years) of a system or point in
+    space.  Systems are read a page at a time, paginated by id64 and
+    not by offset, so memory use stays flat however big the galaxy."""
+    schema = SystemSchema()
+    stmt = select(System).options(*FULL_SYSTEM).order_by(System.id64).limit(page_size)
+    if since is not None:
+        stmt = stmt.where(System.date >= since)
+    if radius is not None:
+        if center is None:
+            raise ValueError("Exporting within a radius requires a center")
+        center = coords(center)
+        stmt = stmt.where(*cell_filters(center, radius))
+
+    last = None
+    while True:
+        page = stmt if last is None else stmt.where(System.id64 > last)
+        systems = session.scalars(page).all()
+        if not systems:
+            return
+        for system in systems:
+            if radius is None or distance(center, system) <= radius:
+                yield schema.dump(system)
+        last = systems[-1].id64
+        session.expunge_all()
+
+
+def write_systems(out: TextIO, systems: Iterator[dict]) -> int:
+    """Write dumped systems as a JSON array with one system per line,
+    like Spansh's data dumps.  Returns the number of systems written."""
+    count = 0
+    out.write("[\n")
+    for system in systems:
+        if count:
+            out.write(",\n")
+        out.write(json.dumps(system, use_decimal=True))
+        count += 1
+        if not count % 10000:
+            logger.info(f"Exported {count} systems")
+    out.write("\n]\n" if count else "]\n")
+    return count
@@ -0,0 +1,150 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from .database import Faction
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# remember at most this many factions per process, about as many as
+# are active in the galaxy
+FACTION_CACHE_SIZE = 100_000
+
+
+def faction_names(records: Iterable[dict]) -> Iterator[str]:
+    """Find the names of the factions systems from a Spansh data dump
+    refer to, repeats and all.  Unlike systems, stations give only
+    their controlling faction's name."""
+    for in_data in records:
+        for faction in in_data.get("factions") or []:
+            yield faction["name"]
+        if faction := in_data.get("controllingFaction"):
+            yield faction["name"]
+        stations = list(in_data.get("stations") or [])
+        for body in in_data.get("bodies") or []:
+            stations.extend(body.get("stations") or [])
+        for station in stations:
+            if name := station.get("controllingFaction"):
+                yield name
+
+
+def keep_factions(session: Session) -> None:
+    """Keep the session from updating factions already in the
+    database, e.g., once lethbridge.upsert.upsert_factions() has
+    written them in name order, since the ORM would otherwise update
+    them in the order systems refer to them, which can deadlock with
+    concurrent imports.  New factions still get inserted."""
+
+    @event.listens_for(session, "before_flush")
+    def discard(session: Session, flush_context, instances) -> None:
+        for faction in session.dirty:
+            if not isinstance(faction, Faction):
+                continue
+            state = inspect(faction)
+            for column in state.mapper.column_attrs:
+                attr = state.attrs[column.key]
+                if attr.history.has_changes():
+                    set_committed_value(faction, column.key, attr.value)
+
+
+class FactionCache:
+    """A bounded, process-local, least recently used cache of the
+    factions known to be in the database, by name.  Since nearly every
+    system in a data dump repeats a faction seen before, seeding each
+    import transaction from this cache saves looking them up.
+
+    Only factions from committed transactions are cached, and a
+    rollback empties the cache, since it may have undone a faction's
+    insert or update.  Concurrent imports may still change a cached
+    faction's allegiance or government; as with any other faction
+    update, the last write wins."""
+
+    def __init__(self, maxsize: int = FACTION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._factions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._factions)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._factions
+
+    def attach(self, session: Session, records: Iterable[dict]) -> None:
+        """Add the cached factions the given systems refer to to the
+        session as persistent objects without querying the database,
+        so that loading the systems finds them in the session's
+        identity map, and update the cache once the session commits."""
+        for name in set(faction_names(records)):
+            values = self._factions.get(name)
+            if values is None:
+                self.misses += 1
+                continue
+            self.hits += 1
+            self._factions.move_to_end(name)
+            if identity_key(Faction, name) in session.identity_map:
+                continue
+            allegiance, government = values
+            faction = Faction(name=name, allegiance=allegiance, government=government)
+            make_transient_to_detached(faction)
+            session.add(faction)
+            # the identity map only holds weak references to unmodified
+            # objects, so keep these alive until the session is done
+            session.info.setdefault("factions", []).append(faction)
+
+        staged = {}
+
+        @event.listens_for(session, "before_commit")
+        def stage(session: Session) -> None:
+            # read the values now, before the commit expires them
+            for faction in list(session.identity_map.values()) + list(session.new):
+                if isinstance(faction, Faction):
+                    staged[faction.name] = (faction.allegiance, faction.government)
+
+        @event.listens_for(session, "after_commit")
+        def commit(session: Session) -> None:
+            self.update(staged)
+            staged.clear()
+
+        @event.listens_for(session, "after_rollback")
+        def rollback(session: Session) -> None:
+            staged.clear()
+            self.clear()
+
+    def update(self, factions: dict[str, tuple[str | None, str | None]]) -> None:
+        """Remember the allegiances and governments of the given
+        factions, evicting the least recently used if need be."""
+        for name, values in factions.items():
+            self._factions[name] = values
+            self._factions.move_to_end(name)
+        while len(self._factions) > self.maxsize:
+            self._factions.popitem(last=False)
+
+    def clear(self) -> None:
+        if self._factions:
+            logger.debug(f"Forgetting {len(self._factions)} cached factions")
+        self._factions.clear()
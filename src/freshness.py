@@ -0,0 +1,128 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+import re
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+from marshmallow.fields import DateTime
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import System
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# fetch this many rows at a time when loading the index
+LOAD_BATCH_SIZE = 100_000
+
+# the system's id64 is the first key in each Spansh dump record, so
+# this matches before any body or station id64; only systems have a
+# date (bodies and stations have an updateTime)
+_ID64 = re.compile(rb'"id64"\s*:\s*(\d+)')
+_DATE = re.compile(rb'"date"\s*:\s*"([^"]+)"')
+
+_DATETIME = DateTime()
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _microseconds(value: datetime) -> int:
+    """Convert a date/time to microseconds since the epoch.  Naive
+    values, e.g., as read back from the database, are taken to be in
+    UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def peek_id64(load_data: bytes) -> int | None:
+    """Find a system's id64 in its raw JSON text without parsing it."""
+    match = _ID64.search(load_data)
+    return int(match.group(1)) if match else None
+
+
+def peek_date(load_data: bytes) -> datetime | None:
+    """Find a system's last update time in its raw JSON text without
+    parsing it."""
+    match = _DATE.search(load_data)
+    if not match:
+        return None
+    try:
+        return _DATETIME.deserialize(match.group(1).decode())
+    except Exception as e:
+        logger.debug(e)
+        return None
+
+
+class SystemDates:
+    """A compact, read-only snapshot of every system's last update
+    time, keyed by id64.  Both are stored in parallel, sorted arrays
+    of 64-bit integers (dates in microseconds since the epoch) instead
+    of a dictionary of ORM objects, so even the full galaxy fits in
+    about 16 bytes per system."""
+
+    def __init__(self, id64s: array, dates: array):
+        self.id64s = id64s
+        self.dates = dates
+
+    def __len__(self) -> int:
+        return len(self.id64s)
+
+    @classmethod
+    def load(cls, session: Session) -> "SystemDates":
+        """Read the id64 and date of every system in the database."""
+        id64s = array("q")
+        dates = array("q")
+        stmt = (
+            select(System.id64, System.date)
+            .order_by(System.id64)
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        for id64, date in session.execute(stmt):
+            id64s.append(id64)
+            dates.append(_microseconds(date))
+        logger.info(f"Loaded the update times of {len(id64s)} systems")
+        return cls(id64s, dates)
+
+    def get(self, id64: int) -> int | None:
+        """Look up a system's last update time in microseconds since
+        the epoch."""
+        i = bisect_left(self.id64s, id64)
+        if i < len(self.id64s) and self.id64s[i] == id64:
+            return self.dates[i]
+        return None
+
+    def is_stale(self, load_data: bytes) -> bool:
+        """Check whether a system's raw JSON text is no newer than
+        what's in the database, the same test that
+        Base.value_must_increase() applies, but without de-serializing
+        the system.  Systems lacking an id64 or date aren't stale, so
+        that the full de-serialization can report the problem."""
+        id64 = peek_id64(load_data)
+        if id64 is None:
+            return False
+        old_date = self.get(id64)
+        if old_date is None:
+            return False
+        new_date = peek_date(load_data)
+        if new_date is None:
+            return False
+        return old_date >= _microseconds(new_date)
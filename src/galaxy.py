@@ -0,0 +1,323 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import struct
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import System
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "The galaxy index requires the numpy package, e.g., "
+        + "`pip install lethbridge[numpy]`"
+    ) from e
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# fetch this many rows at a time when scanning the systems table
+LOAD_BATCH_SIZE = 100_000
+
+# stop splitting the tree once a node holds this many systems; the
+# leaves are searched by brute force, which numpy does quickly
+LEAF_SIZE = 64
+
+# fold refreshed systems into the tree once they exceed this fraction
+# of it
+REBUILD_FRACTION = 0.05
+
+# file layout: a fixed-size header (magic, version, system count, leaf
+# size, and build time in microseconds since the epoch), then the
+# id64s as little-endian int64, then the coordinates as little-endian
+# float64 x/y/z triples
+_MAGIC = b"LBGI"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIQIq")
+_HEADER_SIZE = 64
+_NEVER = -(2**63)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+Point = tuple[float, float, float]
+
+
+def _point(center: System | Point) -> "np.ndarray":
+    if isinstance(center, System):
+        center = (center.x, center.y, center.z)
+    return np.array([float(v) for v in center], dtype=np.float64)
+
+
+def _naive(value: datetime) -> datetime:
+    """Convert a date/time to naive UTC, as the database stores it."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _scan(session: Session, since: datetime | None = None):
+    """Stream the id64s and coordinates of every system, or of every
+    system updated after the given time, into contiguous arrays.
+    Returns them and the latest update time seen."""
+    id64s = array("q")
+    coords = array("d")
+    latest = None
+    stmt = select(
+        System.id64, System.x, System.y, System.z, System.date
+    ).execution_options(yield_per=LOAD_BATCH_SIZE)
+    if since is not None:
+        stmt = stmt.where(System.date > since)
+    for id64, x, y, z, date in session.execute(stmt):
+        id64s.append(id64)
+        coords.extend((float(x), float(y), float(z)))
+        date = _naive(date)
+        if latest is None or latest < date:
+            latest = date
+    return (
+        np.frombuffer(id64s, dtype=np.int64).copy(),
+        np.frombuffer(coords, dtype=np.float64).reshape(-1, 3).copy(),
+        latest,
+    )
+
+
+def _build(id64s: "np.ndarray", coords: "np.ndarray", leaf_size: int) -> None:
+    """Arrange the systems, in place, into an implicit k-d tree: each
+    node spanning more than leaf_size systems keeps its median along
+    the x, y, or z axis (in turn) in the middle, with the systems
+    below it on the left and those above it on the right.  The tree's
+    shape follows from the number of systems and the leaf size alone,
+    so only the re-ordered arrays need to be stored."""
+    stack = [(0, len(id64s), 0)]
+    while stack:
+        lo, hi, depth = stack.pop()
+        if hi - lo <= leaf_size:
+            continue
+        mid = (lo + hi) // 2
+        order = np.argpartition(coords[lo:hi, depth % 3], mid - lo)
+        coords[lo:hi] = coords[lo:hi][order]
+        id64s[lo:hi] = id64s[lo:hi][order]
+        stack.append((lo, mid, depth + 1))
+        stack.append((mid + 1, hi, depth + 1))
+
+
+class GalaxyIndex:
+    """An in-memory k-d tree of every system's coordinates, for fast
+    nearest-neighbor and radius queries without a database round trip
+    per query.  The tree is stored implicitly in contiguous id64 and
+    coordinate arrays, which can be saved to and memory-mapped from a
+    single file.
+
+    Systems updated since the tree was built are kept in a small side
+    table that shadows their old entries (if any) until the tree is
+    rebuilt.  Deleted systems are only dropped by a full rebuild."""
+
+    def __init__(
+        self,
+        id64s: "np.ndarray",
+        coords: "np.ndarray",
+        built: datetime | None = None,
+        leaf_size: int = LEAF_SIZE,
+    ):
+        self.id64s = id64s
+        self.coords = coords
+        self.built = built
+        self.leaf_size = leaf_size
+        self.extra_id64s = np.empty(0, dtype=np.int64)
+        self.extra_coords = np.empty((0, 3), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.id64s) - self._shadowed() + len(self.extra_id64s)
+
+    def _shadowed(self) -> int:
+        if not len(self.extra_id64s):
+            return 0
+        return int(np.isin(self.id64s, self.extra_id64s).sum())
+
+    @classmethod
+    def build(cls, session: Session, leaf_size: int = LEAF_SIZE) -> "GalaxyIndex":
+        """Scan every system in the database and build the tree."""
+        id64s, coords, built = _scan(session)
+        _build(id64s, coords, leaf_size)
+        logger.info(f"Indexed the coordinates of {len(id64s)} systems")
+        return cls(id64s, coords, built, leaf_size)
+
+    def refresh(self, session: Session) -> int:
+        """Pick up systems added or updated since the last build or
+        refresh.  Returns how many were found."""
+        id64s, coords, built = _scan(session, self.built)
+        if len(id64s):
+            keep = ~np.isin(self.extra_id64s, id64s)
+            self.extra_id64s = np.concatenate([self.extra_id64s[keep], id64s])
+            self.extra_coords = np.concatenate([self.extra_coords[keep], coords])
+        if built is not None and (self.built is None or self.built < built):
+            self.built = built
+        logger.info(f"Refreshed the coordinates of {len(id64s)} systems")
+        if len(self.extra_id64s) > REBUILD_FRACTION * len(self.id64s):
+            self.compact()
+        return len(id64s)
+
+    def compact(self) -> None:
+        """Fold refreshed systems into the tree by rebuilding it."""
+        if not len(self.extra_id64s):
+            return
+        keep = ~np.isin(self.id64s, self.extra_id64s)
+        id64s = np.concatenate([self.id64s[keep], self.extra_id64s])
+        coords = np.concatenate([self.coords[keep], self.extra_coords])
+        _build(id64s, coords, self.leaf_size)
+        self.id64s, self.coords = id64s, coords
+        self.extra_id64s = np.empty(0, dtype=np.int64)
+        self.extra_coords = np.empty((0, 3), dtype=np.float64)
+
+    def save(self, path: str | Path) -> None:
+        """Write the tree to a file that open() can memory-map,
+        folding in any refreshed systems first.  The file is replaced
+        atomically, so it's safe to overwrite one that's still mapped."""
+        self.compact()
+        built = (_naive(self.built) - _EPOCH) // _MICROSECOND if self.built else _NEVER
+        path = Path(path)
+        temp = path.with_name(path.name + ".tmp")
+        with open(temp, "wb") as f:
+            header = _HEADER.pack(
+                _MAGIC, _VERSION, len(self.id64s), self.leaf_size, built
+            )
+            f.write(header.ljust(_HEADER_SIZE, b"\0"))
+            self.id64s.astype("<i8", copy=False).tofile(f)
+            self.coords.astype("<f8", copy=False).tofile(f)
+        os.replace(temp, path)
+
+    @classmethod
+    def open(cls, path: str | Path) -> "GalaxyIndex":
+        """Memory-map a tree written by save().  Pages are read in
+        from disk as queries touch them, and the operating system can
+        share them between processes."""
+        with open(path, "rb") as f:
+            magic, version, count, leaf_size, built = _HEADER.unpack(
+                f.read(_HEADER.size)
+            )
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a galaxy index")
+        if count:
+            id64s = np.memmap(path, "<i8", "r", _HEADER_SIZE, (count,))
+            coords = np.memmap(path, "<f8", "r", _HEADER_SIZE + 8 * count, (count, 3))
+        else:
+            # numpy can't map an empty array
+            id64s = np.empty(0, dtype=np.int64)
+            coords = np.empty((0, 3), dtype=np.float64)
+        built = None if built == _NEVER else _EPOCH + built * _MICROSECOND
+        return cls(id64s, coords, built, leaf_size)
+
+    def _search(self, point: "np.ndarray", bound):
+        """Walk the tree nearest branch first, skipping nodes farther
+        than bound() (a squared distance) from the point, and yield
+        the id64s, coordinates, and squared distances of each leaf's
+        systems and of each node's median."""
+        stack = [(0, len(self.id64s), 0, 0.0)]
+        while stack:
+            lo, hi, depth, min_d2 = stack.pop()
+            if min_d2 > bound():
+                continue
+            if hi - lo <= self.leaf_size:
+                coords = self.coords[lo:hi]
+                yield self.id64s[lo:hi], coords, ((coords - point) ** 2).sum(axis=1)
+                continue
+            mid = (lo + hi) // 2
+            coords = self.coords[mid : mid + 1]
+            yield self.id64s[mid : mid + 1], coords, ((coords - point) ** 2).sum(axis=1)
+            axis = depth % 3
+            diff = point[axis] - self.coords[mid, axis]
+            left, right = (lo, mid), (mid + 1, hi)
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((*far, depth + 1, max(min_d2, diff * diff)))
+            stack.append((*near, depth + 1, min_d2))
+
+    def _candidates(self, point: "np.ndarray", bound):
+        """Like _search(), but swap the refreshed systems in for their
+        stale copies in the tree."""
+        if not len(self.extra_id64s):
+            yield from self._search(point, bound)
+            return
+        for id64s, coords, d2 in self._search(point, bound):
+            keep = ~np.isin(id64s, self.extra_id64s)
+            yield id64s[keep], coords[keep], d2[keep]
+        coords = self.extra_coords
+        yield self.extra_id64s, coords, ((coords - point) ** 2).sum(axis=1)
+
+    def nearest(
+        self, center: System | Point, k: int = 1
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        """Find the k systems nearest to a system or point in space.
+        Returns their id64s and distances in light years, nearest
+        first."""
+        point = _point(center)
+        best_id64s = np.empty(0, dtype=np.int64)
+        best_d2 = np.empty(0, dtype=np.float64)
+
+        def bound():
+            return best_d2.max() if len(best_d2) >= k else np.inf
+
+        for id64s, _, d2 in self._candidates(point, bound):
+            best_id64s = np.concatenate([best_id64s, id64s])
+            best_d2 = np.concatenate([best_d2, d2])
+            if len(best_d2) > k:
+                keep = np.argpartition(best_d2, k - 1)[:k]
+                best_id64s, best_d2 = best_id64s[keep], best_d2[keep]
+        order = np.lexsort((best_id64s, best_d2))
+        return best_id64s[order], np.sqrt(best_d2[order])
+
+    def within(
+        self, center: System | Point, radius: float
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        """Find the systems within the given radius (in light years)
+        of a system or point in space.  Returns their id64s and
+        distances, nearest first."""
+        found_id64s, _, found_d2 = self._within(_point(center), radius)
+        order = np.lexsort((found_id64s, found_d2))
+        return found_id64s[order], np.sqrt(found_d2[order])
+
+    def neighbors(
+        self, center: System | Point, radius: float
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        """Find the systems within the given radius (in light years)
+        of a system or point in space, in no particular order.
+        Returns their id64s and coordinates."""
+        found_id64s, found_coords, _ = self._within(_point(center), radius)
+        return found_id64s, found_coords
+
+    def _within(self, point: "np.ndarray", radius: float):
+        r2 = float(radius) ** 2
+        found_id64s = [np.empty(0, dtype=np.int64)]
+        found_coords = [np.empty((0, 3), dtype=np.float64)]
+        found_d2 = [np.empty(0, dtype=np.float64)]
+        for id64s, coords, d2 in self._candidates(point, lambda: r2):
+            keep = d2 <= r2
+            found_id64s.append(id64s[keep])
+            found_coords.append(coords[keep])
+            found_d2.append(d2[keep])
+        return (
+            np.concatenate(found_id64s),
+            np.concatenate(found_coords),
+            np.concatenate(found_d2),
+        )
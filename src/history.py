@@ -0,0 +1,209 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import Connection, and_, delete, exists, insert, or_, select
+from sqlalchemy.orm import Session
+
+from .database import CommodityPrice, Market, MarketOrder, MarketOrderHistory
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# fetch history this many rows at a time
+FETCH_BATCH_SIZE = 10_000
+
+_COLUMNS = [
+    "market_id",
+    "symbol",
+    "category",
+    "updateTime",
+    "buyPrice",
+    "supply",
+    "sellPrice",
+    "demand",
+]
+
+_VALUES = ["buyPrice", "supply", "sellPrice", "demand"]
+
+
+class PricePoint(NamedTuple):
+    """A market order as of a given time."""
+
+    updateTime: datetime
+    station_id: int
+    buyPrice: int
+    supply: int
+    sellPrice: int
+    demand: int
+
+
+class TrendPoint(NamedTuple):
+    """The cheapest purchase and best sale price of a commodity seen
+    anywhere during an interval starting at the given time, or None if
+    nobody was selling or buying it."""
+
+    start: datetime
+    buyPrice: int | None
+    sellPrice: int | None
+
+
+def _naive(value: datetime) -> datetime:
+    """Convert a date/time to naive UTC, like those in the database."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _changes():
+    """Select the market orders that differ from their last known
+    values, i.e., the latest prices recorded in commodity_price, and
+    that aren't already in the history."""
+    last = CommodityPrice
+    history = MarketOrderHistory
+    return (
+        select(
+            MarketOrder.market_id,
+            MarketOrder.symbol,
+            MarketOrder.category,
+            Market.updateTime,
+            *[getattr(MarketOrder, column) for column in _VALUES],
+        )
+        .join(Market, MarketOrder.market_id == Market.station_id)
+        .outerjoin(
+            last,
+            and_(
+                last.station_id == MarketOrder.market_id,
+                last.symbol == MarketOrder.symbol,
+                last.category == MarketOrder.category,
+            ),
+        )
+        .where(
+            or_(
+                last.station_id.is_(None),
+                and_(
+                    Market.updateTime > last.updateTime,
+                    or_(
+                        *[
+                            getattr(MarketOrder, column) != getattr(last, column)
+                            for column in _VALUES
+                        ]
+                    ),
+                ),
+            ),
+            ~exists().where(
+                history.market_id == MarketOrder.market_id,
+                history.symbol == MarketOrder.symbol,
+                history.category == MarketOrder.category,
+                history.updateTime == Market.updateTime,
+            ),
+        )
+    )
+
+
+def record_history(
+    session: Session | Connection, station_ids: Iterable[int] | None = None
+) -> None:
+    """Append the market orders of the given stations, or of every
+    station if none are given, that changed since commodity_price was
+    last refreshed.  Call this right before refresh_prices(), which
+    does so when asked to record history."""
+    stmt = _changes()
+    if station_ids is not None:
+        stmt = stmt.where(Market.station_id.in_(list(station_ids)))
+    session.execute(insert(MarketOrderHistory).from_select(_COLUMNS, stmt))
+
+
+def price_history(
+    session: Session,
+    symbol: str,
+    station_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> list[PricePoint]:
+    """Look up the recorded prices of a commodity, at one station or
+    at all of them, optionally limited to the given period, ordered by
+    station and then by time."""
+    history = MarketOrderHistory
+    stmt = (
+        select(
+            history.updateTime,
+            history.market_id,
+            *[getattr(history, column) for column in _VALUES],
+        )
+        .where(history.symbol == symbol)
+        .order_by(history.market_id, history.updateTime)
+    )
+    if station_id is not None:
+        stmt = stmt.where(history.market_id == station_id)
+    if since is not None:
+        stmt = stmt.where(history.updateTime >= _naive(since))
+    if until is not None:
+        stmt = stmt.where(history.updateTime < _naive(until))
+    return [PricePoint(*row) for row in session.execute(stmt)]
+
+
+def price_trend(
+    session: Session,
+    symbol: str,
+    interval: timedelta,
+    since: datetime,
+    until: datetime,
+) -> list[TrendPoint]:
+    """Summarize the recorded prices of a commodity across every
+    station as a series of fixed intervals between the given times.
+    Stations with no supply or demand don't count towards the buy or
+    sell price, respectively."""
+    if interval <= timedelta(0):
+        raise ValueError("The interval must be positive")
+    since, until = _naive(since), _naive(until)
+    history = MarketOrderHistory
+    stmt = (
+        select(
+            history.updateTime,
+            *[getattr(history, column) for column in _VALUES],
+        )
+        .where(
+            history.symbol == symbol,
+            history.updateTime >= since,
+            history.updateTime < until,
+        )
+        .execution_options(yield_per=FETCH_BATCH_SIZE)
+    )
+    buckets = (until - since) // interval + bool((until - since) % interval)
+    low = [None] * buckets
+    high = [None] * buckets
+    for updateTime, buyPrice, supply, sellPrice, demand in session.execute(stmt):
+        i = (updateTime - since) // interval
+        if buyPrice > 0 and supply > 0 and (low[i] is None or buyPrice < low[i]):
+            low[i] = buyPrice
+        if sellPrice > 0 and demand > 0 and (high[i] is None or sellPrice > high[i]):
+            high[i] = sellPrice
+    return [TrendPoint(since + i * interval, low[i], high[i]) for i in range(buckets)]
+
+
+def prune_history(session: Session, before: datetime) -> int:
+    """Delete the history recorded before the given time.  Returns the
+    number of rows deleted."""
+    result = session.execute(
+        delete(MarketOrderHistory).where(MarketOrderHistory.updateTime < _naive(before))
+    )
+    logger.info(f"Pruned {result.rowcount} market order history rows")
+    return result.rowcount
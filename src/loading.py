@@ -0,0 +1,76 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from marshmallow import Schema
+from marshmallow_sqlalchemy.fields import Nested
+from sqlalchemy.orm import joinedload, selectinload
+
+from .database import Body, FactionState, Market, Station, System
+from .schemas.spansh import StationSchema, SystemSchema
+
+# Every relationship in the database module loads lazily, so walking
+# an object graph, e.g., dumping a system through SystemSchema, fires
+# one query per relationship per object.  Pass one of these profiles
+# to `select(...).options(*PROFILE)` or `session.get(...,
+# options=PROFILE)` instead: each relationship then loads for all the
+# objects in the query at once, so the number of queries depends on
+# the profile and not on how many systems, bodies, or stations there
+# are.
+
+
+def eager_options(schema: Schema, model) -> tuple:
+    """Build loader options that fetch every relationship a schema
+    dumps, recursively.  Many-to-one and one-to-one relationships
+    join into their parent's query; collections load with one `SELECT
+    ... IN` per relationship for all the parents in the query."""
+    options = []
+    for name, field in schema.fields.items():
+        if not isinstance(field, Nested) or field.load_only:
+            continue
+        attribute = getattr(model, field.attribute or name)
+        loader = selectinload if attribute.property.uselist else joinedload
+        nested = field.schema
+        options.append(
+            loader(attribute).options(*eager_options(nested, nested.opts.model))
+        )
+    return tuple(options)
+
+
+# everything SystemSchema dumps: the system's factions, bodies,
+# stations, and their markets, outfitting, and shipyards
+FULL_SYSTEM = eager_options(SystemSchema(), System)
+
+# everything StationSchema dumps
+FULL_STATION = eager_options(StationSchema(), Station)
+
+# a system's own details for listings, without its bodies or stations
+SYSTEM_SUMMARY = (
+    joinedload(System.controllingFaction),
+    selectinload(System.factions).joinedload(FactionState.faction),
+    selectinload(System.powers),
+    joinedload(System.thargoidWar),
+)
+
+# a station, where it is, and what its market trades
+STATION_MARKET = (
+    joinedload(Station.system),
+    joinedload(Station.body).joinedload(Body.system),
+    joinedload(Station.market).options(
+        selectinload(Market.commodities),
+        selectinload(Market.prohibitedCommodities),
+    ),
+)
@@ -0,0 +1,172 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import CommodityPrice, System
+from .spatial import Coords, cell_filters, distance
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# fetch candidate market orders this many at a time, best price first,
+# until enough of them pass the exact distance check
+FETCH_BATCH_SIZE = 100
+
+# the landing pads that can take each ship size
+_PAD_SIZES = {
+    "L": ["L"],
+    "M": ["L", "M"],
+    "S": ["L", "M", "S"],
+}
+
+
+def pad_filter(pad_size: str):
+    """Build a WHERE clause that selects prices at stations with
+    landing pads big enough for the given ship size (`L`, `M`, or
+    `S`)."""
+    return CommodityPrice.padSize.in_(_PAD_SIZES[pad_size.upper()[0]])
+
+
+class Offer(NamedTuple):
+    """A market order, where it is, and how far away it is (if the
+    search had a center)."""
+
+    symbol: str
+    price: int
+    quantity: int
+    updateTime: datetime
+    station_id: int
+    station_name: str
+    system_id64: int
+    system_name: str
+    distance: float | None
+
+
+def _best(
+    session: Session,
+    symbol: str,
+    price,
+    quantity,
+    descending: bool,
+    center: System | Coords | None,
+    radius: float | None,
+    pad_size: str | None,
+    max_age: timedelta | None,
+    limit: int,
+) -> list[Offer]:
+    stmt = (
+        select(
+            CommodityPrice.symbol,
+            price,
+            quantity,
+            CommodityPrice.updateTime,
+            CommodityPrice.station_id,
+            CommodityPrice.station_name,
+            CommodityPrice.system_id64,
+            CommodityPrice.system_name,
+            CommodityPrice.x,
+            CommodityPrice.y,
+            CommodityPrice.z,
+        )
+        .where(CommodityPrice.symbol == symbol, price > 0, quantity > 0)
+        .order_by(price.desc() if descending else price, CommodityPrice.station_id)
+    )
+    if pad_size:
+        stmt = stmt.where(pad_filter(pad_size))
+    if max_age is not None:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        stmt = stmt.where(CommodityPrice.updateTime >= now - max_age)
+    if radius is not None:
+        if center is None:
+            raise ValueError("Searching within a radius requires a center")
+        stmt = stmt.where(*cell_filters(center, radius, CommodityPrice))
+    else:
+        stmt = stmt.limit(limit)
+
+    # the cell filter only narrows the search to a box around the
+    # sphere, so keep fetching until enough offers fall inside it
+    offers = []
+    result = session.execute(stmt.execution_options(yield_per=FETCH_BATCH_SIZE))
+    for row in result:
+        d = distance(center, row[-3:]) if center is not None else None
+        if radius is not None and d > radius:
+            continue
+        offers.append(Offer(*row[:-3], d))
+        if len(offers) >= limit:
+            break
+    result.close()
+    return offers
+
+
+def best_buy(
+    session: Session,
+    symbol: str,
+    center: System | Coords | None = None,
+    radius: float | None = None,
+    pad_size: str | None = None,
+    max_age: timedelta | None = None,
+    limit: int = 10,
+) -> list[Offer]:
+    """Find the cheapest places to buy a commodity, optionally within
+    the given radius (in light years) of a system or point in space,
+    at stations with landing pads big enough for the given ship size
+    (`L`, `M`, or `S`), and with market data no older than max_age.
+    Only stations with the commodity in stock are considered."""
+    return _best(
+        session,
+        symbol,
+        CommodityPrice.buyPrice,
+        CommodityPrice.supply,
+        False,
+        center,
+        radius,
+        pad_size,
+        max_age,
+        limit,
+    )
+
+
+def best_sell(
+    session: Session,
+    symbol: str,
+    center: System | Coords | None = None,
+    radius: float | None = None,
+    pad_size: str | None = None,
+    max_age: timedelta | None = None,
+    limit: int = 10,
+) -> list[Offer]:
+    """Find the best-paying places to sell a commodity, filtered like
+    best_buy().  Only stations with demand for the commodity are
+    considered."""
+    return _best(
+        session,
+        symbol,
+        CommodityPrice.sellPrice,
+        CommodityPrice.demand,
+        True,
+        center,
+        radius,
+        pad_size,
+        max_age,
+        limit,
+    )
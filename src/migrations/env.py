@@ -80,6 +80,9 @@ def run_migrations_online() -> None:
 
     # for the direct-to-DB use case, start a transaction on all
     # engines, then run all migrations, then commit all transactions.
+    # without two-phase commit, let Alembic run each migration in its
+    # own transaction instead, so that migrations may step outside of
+    # it via autocommit_block(), e.g., to create indexes concurrently.
 
     engines = {}
     for name in re.split(r",\s*", db_names):
@@ -96,8 +99,6 @@ def run_migrations_online() -> None:
 
         if USE_TWOPHASE:
             rec["transaction"] = conn.begin_twophase()
-        else:
-            rec["transaction"] = conn.begin()
 
     try:
         for name, rec in engines.items():
@@ -109,18 +110,20 @@ def run_migrations_online() -> None:
                 target_metadata=target_metadata.get(name),
                 compare_type=True,
                 render_as_batch=True,
+                transaction_per_migration=True,
             )
-            context.run_migrations(engine_name=name)
+            with context.begin_transaction():
+                context.run_migrations(engine_name=name)
 
         if USE_TWOPHASE:
             for rec in engines.values():
                 rec["transaction"].prepare()
-
-        for rec in engines.values():
-            rec["transaction"].commit()
+            for rec in engines.values():
+                rec["transaction"].commit()
     except:  # noqa: E722
-        for rec in engines.values():
-            rec["transaction"].rollback()
+        if USE_TWOPHASE:
+            for rec in engines.values():
+                rec["transaction"].rollback()
         raise
     finally:
         for rec in engines.values():
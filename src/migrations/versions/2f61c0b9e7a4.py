@@ -0,0 +1,65 @@
+"""index market orders by price
+
+Revision ID: 2f61c0b9e7a4
+Revises: d4a8f2b6e913
+Create Date: 2026-10-16 23:05:41.276903+00:00
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2f61c0b9e7a4"
+down_revision = "d4a8f2b6e913"
+branch_labels = None
+depends_on = None
+
+# (name, columns) of the indexes behind best-price lookups
+INDEXES = [
+    ("ix_market_order_symbol_buyPrice", ["symbol", "buyPrice"]),
+    ("ix_market_order_symbol_sellPrice", ["symbol", "sellPrice"]),
+]
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_postgresql() -> None:
+    # build the indexes without locking out writers, which PostgreSQL
+    # only allows outside of a transaction block
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(
+                name,
+                "market_order",
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade_postgresql() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name="market_order",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+
+
+def upgrade_sqlite() -> None:
+    for name, columns in INDEXES:
+        op.create_index(name, "market_order", columns, unique=False)
+
+
+def downgrade_sqlite() -> None:
+    for name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name="market_order")
@@ -0,0 +1,71 @@
+"""skip stale updates with triggers
+
+Revision ID: 3a7f0c5e2b96
+Revises: 5b9c1e7d3f08
+Create Date: 2026-10-17 05:18:52.661430+00:00
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3a7f0c5e2b96"
+down_revision = "5b9c1e7d3f08"
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs that must increase with every update, cf.
+# lethbridge.database.MONOTONIC_COLUMNS
+COLUMNS = [
+    ("system", "date"),
+    ("body", "updateTime"),
+    ("station", "updateTime"),
+    ("market", "updateTime"),
+    ("shipyard", "updateTime"),
+    ("outfitting", "updateTime"),
+    ("signals", "updateTime"),
+    ("body_timestamp", "value"),
+]
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_postgresql() -> None:
+    op.execute(
+        "CREATE OR REPLACE FUNCTION skip_stale_update() RETURNS trigger "
+        + "LANGUAGE plpgsql AS $$ BEGIN RETURN NULL; END $$"
+    )
+    for table, column in COLUMNS:
+        op.execute(
+            f"CREATE TRIGGER {table}_{column}_must_increase "
+            + f'BEFORE UPDATE OF "{column}" ON {table} FOR EACH ROW '
+            + f'WHEN (NEW."{column}" <= OLD."{column}") '
+            + "EXECUTE FUNCTION skip_stale_update()"
+        )
+
+
+def downgrade_postgresql() -> None:
+    for table, column in reversed(COLUMNS):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_{column}_must_increase ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS skip_stale_update()")
+
+
+def upgrade_sqlite() -> None:
+    for table, column in COLUMNS:
+        op.execute(
+            f"CREATE TRIGGER {table}_{column}_must_increase "
+            + f'BEFORE UPDATE OF "{column}" ON {table} FOR EACH ROW '
+            + f'WHEN NEW."{column}" <= OLD."{column}" '
+            + "BEGIN SELECT RAISE(IGNORE); END"
+        )
+
+
+def downgrade_sqlite() -> None:
+    for table, column in reversed(COLUMNS):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_{column}_must_increase")
@@ -0,0 +1,60 @@
+"""add market order history
+
+Revision ID: 5b9c1e7d3f08
+Revises: 8e2d6b4f1a57
+Create Date: 2026-10-17 03:41:26.904517+00:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b9c1e7d3f08"
+down_revision = "8e2d6b4f1a57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def _create_market_order_history() -> None:
+    op.create_table(
+        "market_order_history",
+        sa.Column("market_id", sa.BigInteger(), nullable=False),
+        sa.Column("symbol", sa.String(), nullable=False),
+        sa.Column("category", sa.String(), nullable=False),
+        sa.Column("updateTime", sa.DateTime(), nullable=False),
+        sa.Column("buyPrice", sa.Integer(), nullable=False),
+        sa.Column("supply", sa.Integer(), nullable=False),
+        sa.Column("sellPrice", sa.Integer(), nullable=False),
+        sa.Column("demand", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("market_id", "symbol", "category", "updateTime"),
+    )
+    op.create_index(
+        "ix_market_order_history_symbol_updateTime",
+        "market_order_history",
+        ["symbol", "updateTime"],
+        unique=False,
+    )
+
+
+def upgrade_postgresql() -> None:
+    _create_market_order_history()
+
+
+def downgrade_postgresql() -> None:
+    op.drop_table("market_order_history")
+
+
+def upgrade_sqlite() -> None:
+    _create_market_order_history()
+
+
+def downgrade_sqlite() -> None:
+    op.drop_table("market_order_history")
@@ -0,0 +1,78 @@
+"""index hot lookup columns
+
+Revision ID: 7c3e9a1f5d20
+Revises: 0b7e5c2d9a31
+Create Date: 2026-10-16 18:41:09.512730+00:00
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c3e9a1f5d20"
+down_revision = "0b7e5c2d9a31"
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs that name lookups, child collection loads,
+# and freshness checks filter or join on; market_order.symbol needs
+# no index of its own since it leads that table's primary key
+INDEXES = [
+    ("body", "system_id64"),
+    ("body", "updateTime"),
+    ("faction_state", "system_id64"),
+    ("market", "updateTime"),
+    ("outfitting", "updateTime"),
+    ("shipyard", "updateTime"),
+    ("signals", "body_id64"),
+    ("signals", "updateTime"),
+    ("station", "body_id64"),
+    ("station", "name"),
+    ("station", "system_id64"),
+    ("station", "updateTime"),
+    ("system", "name"),
+]
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_postgresql() -> None:
+    # build the indexes without locking out writers, which PostgreSQL
+    # only allows outside of a transaction block
+    with op.get_context().autocommit_block():
+        for table, column in INDEXES:
+            op.create_index(
+                op.f(f"ix_{table}_{column}"),
+                table,
+                [column],
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade_postgresql() -> None:
+    with op.get_context().autocommit_block():
+        for table, column in reversed(INDEXES):
+            op.drop_index(
+                op.f(f"ix_{table}_{column}"),
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+
+
+def upgrade_sqlite() -> None:
+    for table, column in INDEXES:
+        op.create_index(op.f(f"ix_{table}_{column}"), table, [column], unique=False)
+
+
+def downgrade_sqlite() -> None:
+    for table, column in reversed(INDEXES):
+        op.drop_index(op.f(f"ix_{table}_{column}"), table_name=table)
@@ -0,0 +1,106 @@
+"""add denormalized commodity prices
+
+Revision ID: 8e2d6b4f1a57
+Revises: 2f61c0b9e7a4
+Create Date: 2026-10-17 01:12:09.583114+00:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8e2d6b4f1a57"
+down_revision = "2f61c0b9e7a4"
+branch_labels = None
+depends_on = None
+
+# (name, columns) of the indexes behind price and proximity lookups
+INDEXES = [
+    ("ix_commodity_price_symbol_buyPrice", ["symbol", "buyPrice"]),
+    ("ix_commodity_price_symbol_sellPrice", ["symbol", "sellPrice"]),
+    ("ix_commodity_price_cell", ["cell_x", "cell_y", "cell_z"]),
+]
+
+# fill the new table from the existing markets, cf.
+# lethbridge.prices.refresh_prices(); surface ports belong to a body
+# rather than directly to a system
+BACKFILL = """
+INSERT INTO commodity_price (
+    station_id, symbol, category, station_name, system_id64, system_name,
+    x, y, z, cell_x, cell_y, cell_z, "padSize", "distanceToArrival",
+    "buyPrice", supply, "sellPrice", demand, "updateTime"
+)
+SELECT
+    market_order.market_id, market_order.symbol, market_order.category,
+    station.name, system.id64, system.name,
+    system.x, system.y, system.z, system.cell_x, system.cell_y, system.cell_z,
+    CASE
+        WHEN station."largeLandingPads" > 0 THEN 'L'
+        WHEN station."mediumLandingPads" > 0 THEN 'M'
+        WHEN station."smallLandingPads" > 0 THEN 'S'
+    END,
+    station."distanceToArrival",
+    market_order."buyPrice", market_order.supply,
+    market_order."sellPrice", market_order.demand,
+    market."updateTime"
+FROM market_order
+JOIN market ON market_order.market_id = market.station_id
+JOIN station ON market.station_id = station.id
+LEFT OUTER JOIN body ON station.body_id64 = body.id64
+JOIN system ON system.id64 = coalesce(station.system_id64, body.system_id64)
+"""
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def _create_commodity_price() -> None:
+    op.create_table(
+        "commodity_price",
+        sa.Column("station_id", sa.BigInteger(), nullable=False),
+        sa.Column("symbol", sa.String(), nullable=False),
+        sa.Column("category", sa.String(), nullable=False),
+        sa.Column("station_name", sa.String(), nullable=False),
+        sa.Column("system_id64", sa.BigInteger(), nullable=False),
+        sa.Column("system_name", sa.String(), nullable=False),
+        sa.Column("x", sa.Numeric(), nullable=False),
+        sa.Column("y", sa.Numeric(), nullable=False),
+        sa.Column("z", sa.Numeric(), nullable=False),
+        sa.Column("cell_x", sa.Integer(), nullable=False),
+        sa.Column("cell_y", sa.Integer(), nullable=False),
+        sa.Column("cell_z", sa.Integer(), nullable=False),
+        sa.Column("padSize", sa.String(), nullable=True),
+        sa.Column("distanceToArrival", sa.Numeric(), nullable=True),
+        sa.Column("buyPrice", sa.Integer(), nullable=False),
+        sa.Column("supply", sa.Integer(), nullable=False),
+        sa.Column("sellPrice", sa.Integer(), nullable=False),
+        sa.Column("demand", sa.Integer(), nullable=False),
+        sa.Column("updateTime", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("station_id", "symbol", "category"),
+    )
+    op.execute(BACKFILL)
+
+    # index after the backfill so that each index is built once
+    for name, columns in INDEXES:
+        op.create_index(name, "commodity_price", columns, unique=False)
+
+
+def upgrade_postgresql() -> None:
+    _create_commodity_price()
+
+
+def downgrade_postgresql() -> None:
+    op.drop_table("commodity_price")
+
+
+def upgrade_sqlite() -> None:
+    _create_commodity_price()
+
+
+def downgrade_sqlite() -> None:
+    op.drop_table("commodity_price")
@@ -0,0 +1,82 @@
+"""add system grid cells
+
+Revision ID: d4a8f2b6e913
+Revises: 7c3e9a1f5d20
+Create Date: 2026-10-16 21:17:52.903114+00:00
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d4a8f2b6e913"
+down_revision = "7c3e9a1f5d20"
+branch_labels = None
+depends_on = None
+
+# must match lethbridge.database.CELL_SIZE at the time of this
+# revision
+CELL_SIZE = 32
+
+AXES = ["x", "y", "z"]
+
+
+def upgrade(engine_name: str) -> None:
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name: str) -> None:
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_postgresql() -> None:
+    for axis in AXES:
+        op.add_column("system", sa.Column(f"cell_{axis}", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE system SET "
+        + ", ".join(f"cell_{axis} = floor({axis} / {CELL_SIZE})" for axis in AXES)
+    )
+    for axis in AXES:
+        op.alter_column("system", f"cell_{axis}", nullable=False)
+    op.create_index(
+        "ix_system_cell", "system", ["cell_x", "cell_y", "cell_z"], unique=False
+    )
+
+
+def downgrade_postgresql() -> None:
+    op.drop_index("ix_system_cell", table_name="system")
+    for axis in reversed(AXES):
+        op.drop_column("system", f"cell_{axis}")
+
+
+def upgrade_sqlite() -> None:
+    with op.batch_alter_table("system", schema=None) as batch_op:
+        for axis in AXES:
+            batch_op.add_column(sa.Column(f"cell_{axis}", sa.Integer(), nullable=True))
+
+    # SQLite may lack floor(), and casting truncates toward zero, so
+    # round negative, fractional quotients down by hand
+    op.execute(
+        "UPDATE system SET "
+        + ", ".join(
+            f"cell_{axis} = CAST({axis} / {CELL_SIZE}.0 AS INTEGER)"
+            + f" - ({axis} < 0 AND {axis} / {CELL_SIZE}.0"
+            + f" != CAST({axis} / {CELL_SIZE}.0 AS INTEGER))"
+            for axis in AXES
+        )
+    )
+
+    with op.batch_alter_table("system", schema=None) as batch_op:
+        for axis in AXES:
+            batch_op.alter_column(f"cell_{axis}", nullable=False)
+        batch_op.create_index(
+            "ix_system_cell", ["cell_x", "cell_y", "cell_z"], unique=False
+        )
+
+
+def downgrade_sqlite() -> None:
+    with op.batch_alter_table("system", schema=None) as batch_op:
+        batch_op.drop_index("ix_system_cell")
+        for axis in reversed(AXES):
+            batch_op.drop_column(f"cell_{axis}")
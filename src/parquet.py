@@ -0,0 +1,300 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Connection,
+    DateTime,
+    Float,
+    Integer,
+    Numeric,
+    Table,
+    cast,
+    func,
+    select,
+)
+
+from .database import Base
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError as e:
+    raise ImportError(
+        "Exporting Parquet datasets requires the pyarrow package, e.g., "
+        + "`pip install lethbridge[parquet]`"
+    ) from e
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# read and write this many rows at a time
+CHUNK_SIZE = 100_000
+
+# a body's id64 is its system's id64 plus the body ID in the top bits
+SYSTEM_ID64_MASK = (1 << 55) - 1
+
+# how to find the system each table's rows belong to, for locating
+# them by sector: the column holding a system id64, body id64, or
+# station ID; the remaining tables aren't partitioned
+SECTOR_KEYS = {
+    "system": ("id64", "system"),
+    "faction_state": ("system_id64", "system"),
+    "powerplay": ("system_id64", "system"),
+    "thargoid_war": ("system_id64", "system"),
+    "body": ("system_id64", "system"),
+    "atmosphere_composition": ("body_id64", "body"),
+    "solid_composition": ("body_id64", "body"),
+    "material": ("body_id64", "body"),
+    "signals": ("body_id64", "body"),
+    "parent": ("body_id64", "body"),
+    "belt": ("body_id64", "body"),
+    "ring": ("body_id64", "body"),
+    "body_timestamp": ("body_id64", "body"),
+    "station": ("id", "station"),
+    "station_economy": ("station_id", "station"),
+    "station_service": ("station_id", "station"),
+    "market": ("station_id", "station"),
+    "market_order": ("market_id", "station"),
+    "prohibited_commodity": ("market_id", "station"),
+    "shipyard": ("station_id", "station"),
+    "shipyard_stock": ("shipyard_id", "station"),
+    "outfitting": ("station_id", "station"),
+    "outfitting_stock": ("outfitting_id", "station"),
+    "commodity_price": ("system_id64", "system"),
+}
+
+# the sector columns, cf. sectors()
+SECTOR_SCHEMA = pa.schema(
+    [("sector_x", pa.int64()), ("sector_y", pa.int64()), ("sector_z", pa.int64())]
+)
+
+# the galaxy has 128 by 64 by 128 sectors, but a directory per sector
+# would scatter small tables over a million tiny files, so partition
+# by slices of the galaxy one sector thick along x instead; filtering
+# on the other two coordinates uses the row groups' statistics
+PARTITION_SCHEMA = pa.schema([("sector_x", pa.int64())])
+MAX_PARTITIONS = 128
+
+# string columns with too many distinct values to be worth dictionary
+# encoding; every other string column gets one
+PLAIN_STRINGS = {
+    ("system", "name"),
+    ("body", "name"),
+    ("station", "name"),
+    ("faction", "name"),
+    ("belt", "name"),
+    ("ring", "name"),
+    ("signals", "ring_name"),
+    ("commodity_price", "station_name"),
+    ("commodity_price", "system_name"),
+}
+
+# operational tables that aren't galaxy data
+SKIPPED_TABLES = {"import_checkpoint"}
+
+
+def sectors(id64s: "pa.Array") -> tuple["pa.Array", "pa.Array", "pa.Array"]:
+    """Decode the sector coordinates packed into system id64s.  From
+    the least significant bit, an id64 holds a 3-bit mass code, then
+    for each of z, y, and x in turn, the boxel (7 minus the mass code
+    bits) and the sector (7, 6, and 7 bits, respectively)."""
+    boxel = pc.subtract(7, pc.bit_wise_and(id64s, 7))
+    coordinates = []
+    offset = pc.add(boxel, 3)
+    for bits in [7, 6, 7]:
+        coordinates.append(
+            pc.bit_wise_and(pc.shift_right(id64s, offset), (1 << bits) - 1)
+        )
+        offset = pc.add(offset, pc.add(boxel, bits))
+    z, y, x = coordinates
+    return x, y, z
+
+
+def _arrow_type(table: Table, column: Column) -> "pa.DataType":
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Numeric):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if (table.name, column.name) in PLAIN_STRINGS:
+        return pa.string()
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def arrow_schema(table: Table) -> "pa.Schema":
+    """Map a table's columns to typed Arrow fields."""
+    fields = [
+        pa.field(column.name, _arrow_type(table, column), nullable=column.nullable)
+        for column in table.columns
+    ]
+    if table.name in SECTOR_KEYS:
+        fields.extend(SECTOR_SCHEMA)
+    return pa.schema(fields)
+
+
+def _select(table: Table):
+    """Select a table's rows, having the database convert decimals to
+    floating point and, if partitioned, find each row's system."""
+    stmt = select(
+        *[
+            (
+                cast(column, Float).label(column.name)
+                if isinstance(column.type, Numeric)
+                else column
+            )
+            for column in table.columns
+        ]
+    )
+    if table.name not in SECTOR_KEYS:
+        return stmt
+    name, kind = SECTOR_KEYS[table.name]
+    key = table.c[name]
+    match kind:
+        case "system":
+            id64 = key
+        case "body":
+            id64 = key.op("&", return_type=BigInteger)(SYSTEM_ID64_MASK)
+        case "station":
+            station = Base.metadata.tables["station"].alias("owner")
+            stmt = stmt.outerjoin(station, station.c.id == key)
+            id64 = func.coalesce(
+                station.c.system_id64,
+                station.c.body_id64.op("&", return_type=BigInteger)(SYSTEM_ID64_MASK),
+            )
+    return stmt.add_columns(id64.label("system_id64_"))
+
+
+def _array(values: tuple, type_: "pa.DataType") -> "pa.Array":
+    if pa.types.is_dictionary(type_):
+        return pa.array(values, type=type_.value_type).dictionary_encode()
+    return pa.array(values, type=type_)
+
+
+def _batches(
+    connection: Connection, table: Table, schema: "pa.Schema", chunk_size: int
+) -> Iterator["pa.RecordBatch"]:
+    """Stream a table out of the database as Arrow record batches.
+    PostgreSQL reads through a server-side cursor."""
+    result = connection.execution_options(
+        stream_results=True, yield_per=chunk_size
+    ).execute(_select(table))
+    width = len(table.columns)
+    for rows in result.partitions():
+        columns = list(zip(*rows))
+        arrays = [
+            _array(values, field.type) for values, field in zip(columns[:width], schema)
+        ]
+        if table.name in SECTOR_KEYS:
+            arrays.extend(sectors(pa.array(columns[width], type=pa.int64())))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _replace(partial: Path, path: Path) -> None:
+    """Swap a freshly written dataset in for the old one, if any."""
+    old = path.with_name(path.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old)
+    os.replace(partial, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def export_table(
+    connection: Connection,
+    table: Table,
+    directory: str | Path,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Write a table as a Parquet dataset in a subdirectory named after
+    it, partitioned by sector_x if possible.  Returns the number of
+    rows written.  The dataset goes to a temporary directory that
+    replaces any earlier export only once it's complete, so readers
+    never see a partial dataset."""
+    schema = arrow_schema(table)
+    path = Path(directory) / table.name
+    partial = path.with_name(path.name + ".tmp")
+    shutil.rmtree(partial, ignore_errors=True)  # left by a failed export
+    count = 0
+
+    def counted() -> Iterator["pa.RecordBatch"]:
+        nonlocal count
+        for batch in _batches(connection, table, schema, chunk_size):
+            count += batch.num_rows
+            yield batch
+
+    try:
+        ds.write_dataset(
+            pa.RecordBatchReader.from_batches(schema, counted()),
+            partial,
+            format="parquet",
+            partitioning=(
+                ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+                if table.name in SECTOR_KEYS
+                else None
+            ),
+            max_partitions=MAX_PARTITIONS,
+            max_rows_per_group=chunk_size,
+        )
+        if not count:
+            # leave an empty file behind so that the dataset's schema is
+            # still there for readers
+            partial.mkdir(parents=True, exist_ok=True)
+            pq.write_table(schema.empty_table(), partial / "part-0.parquet")
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    _replace(partial, path)
+    logger.info(f"Exported {count} rows from {table.name}")
+    return count
+
+
+def export_parquet(
+    connection: Connection,
+    directory: str | Path,
+    tables: Iterable[str] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> dict[str, int]:
+    """Write each of the given tables, or every galaxy table, as its
+    own Parquet dataset under the given directory, replacing those
+    from any earlier export.  Returns the number of rows written per
+    table."""
+    if tables is None:
+        tables = [
+            table.name
+            for table in Base.metadata.sorted_tables
+            if table.name not in SKIPPED_TABLES
+        ]
+    return {
+        name: export_table(
+            connection, Base.metadata.tables[name], directory, chunk_size
+        )
+        for name in tables
+    }
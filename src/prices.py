@@ -0,0 +1,166 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from typing import Iterable
+
+from sqlalchemy import Connection, case, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from .database import Body, CommodityPrice, Market, MarketOrder, Station, System
+from .history import record_history
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# replace the prices of this many stations per statement
+REFRESH_BATCH_SIZE = 1000
+
+# the columns of commodity_price, in the order _prices() selects them
+_COLUMNS = [
+    "station_id",
+    "symbol",
+    "category",
+    "station_name",
+    "system_id64",
+    "system_name",
+    "x",
+    "y",
+    "z",
+    "cell_x",
+    "cell_y",
+    "cell_z",
+    "padSize",
+    "distanceToArrival",
+    "buyPrice",
+    "supply",
+    "sellPrice",
+    "demand",
+    "updateTime",
+]
+
+
+def _prices():
+    """Select the denormalized price rows from the normalized tables.
+    Surface ports belong to a body rather than directly to a system,
+    so find their system through the body."""
+    pad_size = case(
+        (Station.largeLandingPads > 0, "L"),
+        (Station.mediumLandingPads > 0, "M"),
+        (Station.smallLandingPads > 0, "S"),
+        else_=None,
+    )
+    return (
+        select(
+            MarketOrder.market_id,
+            MarketOrder.symbol,
+            MarketOrder.category,
+            Station.name,
+            System.id64,
+            System.name,
+            System.x,
+            System.y,
+            System.z,
+            System.cell_x,
+            System.cell_y,
+            System.cell_z,
+            pad_size,
+            Station.distanceToArrival,
+            MarketOrder.buyPrice,
+            MarketOrder.supply,
+            MarketOrder.sellPrice,
+            MarketOrder.demand,
+            Market.updateTime,
+        )
+        .join(Market, MarketOrder.market_id == Market.station_id)
+        .join(Station, Market.station_id == Station.id)
+        .outerjoin(Body, Station.body_id64 == Body.id64)
+        .join(
+            System, System.id64 == func.coalesce(Station.system_id64, Body.system_id64)
+        )
+    )
+
+
+def touched_stations(records: Iterable[dict]) -> set[int]:
+    """List the stations in a batch of Spansh dump records, i.e., the
+    stations orbiting each system or landed on one of its bodies,
+    whose prices an import of those records may have changed."""
+    station_ids = set()
+    for in_data in records:
+        stations = list(in_data.get("stations") or [])
+        for body in in_data.get("bodies") or []:
+            stations.extend(body.get("stations") or [])
+        station_ids.update(
+            station["id"] for station in stations if station.get("id") is not None
+        )
+    return station_ids
+
+
+def stored_stations(session: Session, records: Iterable[dict]) -> set[int]:
+    """List the stations the database has in the systems of a batch of
+    Spansh dump records, i.e., orbiting each system or landed on one
+    of its bodies.  Importing the records may remove these stations
+    from those systems, taking their markets with them, so call this
+    beforehand and refresh their prices along with touched_stations()."""
+    id64s = {in_data["id64"] for in_data in records if in_data.get("id64")}
+    if not id64s:
+        return set()
+    bodies = select(Body.id64).where(Body.system_id64.in_(id64s))
+    return set(
+        session.scalars(
+            select(Station.id).where(
+                or_(Station.system_id64.in_(id64s), Station.body_id64.in_(bodies))
+            )
+        )
+    )
+
+
+def refresh_prices(
+    session: Session | Connection,
+    station_ids: Iterable[int] | None = None,
+    history: bool = False,
+) -> None:
+    """Bring commodity_price up to date with the markets of the given
+    stations, or of every station if none are given, by replacing
+    their rows wholesale.  Call this in the transaction that changed
+    the markets so that readers never see the two disagree.  If
+    requested, first append the orders that changed to the market
+    order history, cf. lethbridge.history."""
+    if station_ids is None:
+        if history:
+            record_history(session)
+        session.execute(delete(CommodityPrice))
+        session.execute(insert(CommodityPrice).from_select(_COLUMNS, _prices()))
+        logger.info("Rebuilt the commodity prices of every station")
+        return
+
+    # lock stations in a consistent order so that concurrent imports
+    # touching the same fleet carrier can't deadlock
+    station_ids = sorted(station_ids)
+    for i in range(0, len(station_ids), REFRESH_BATCH_SIZE):
+        batch = station_ids[i : i + REFRESH_BATCH_SIZE]
+        if history:
+            record_history(session, batch)
+        session.execute(
+            delete(CommodityPrice).where(CommodityPrice.station_id.in_(batch))
+        )
+        session.execute(
+            insert(CommodityPrice).from_select(
+                _COLUMNS, _prices().where(Market.station_id.in_(batch))
+            )
+        )
+    logger.debug(f"Refreshed the commodity prices of {len(station_ids)} stations")
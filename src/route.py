@@ -0,0 +1,111 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import heapq
+import logging
+import math
+
+from .database import System
+from .galaxy import GalaxyIndex, np
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# keep at most this many systems queued for expansion; past that, the
+# least promising half is forgotten, which bounds memory use at the
+# risk of a longer than necessary route
+MAX_OPEN = 1_000_000
+
+
+def _jumps(distance, jump_range: float):
+    """Compute the fewest jumps that could possibly cover a distance,
+    the A* heuristic.  It never overestimates and drops by at most one
+    per jump, so the first route found is a shortest one."""
+    return np.ceil(distance / jump_range)
+
+
+def plan_route(
+    index: GalaxyIndex,
+    start: System,
+    goal: System,
+    jump_range: float,
+    weight: float = 1.0,
+    max_open: int = MAX_OPEN,
+) -> list[int] | None:
+    """Find a route from one system to another that takes the fewest
+    jumps of at most jump_range light years, using A* search over the
+    systems in the galaxy index.  Among equally short candidates, the
+    search prefers those nearest the goal, so it heads straight for
+    it.  Returns the id64s of the systems along the route, start and
+    goal included, or None if the goal is out of reach.
+
+    An exact search must rule out every shorter route, which across
+    the galaxy means expanding most of the systems in between.  A
+    weight above one scales the heuristic up (weighted A*), trading
+    optimality for speed: the route found then takes at most weight
+    times the fewest possible jumps."""
+    if jump_range <= 0:
+        raise ValueError("The jump range must be positive")
+    if start.id64 == goal.id64:
+        return [start.id64]
+    target = np.array([float(goal.x), float(goal.y), float(goal.z)])
+    origin = np.array([float(start.x), float(start.y), float(start.z)])
+
+    # queue entries: (estimated jumps, distance to goal, jumps so far,
+    # id64, previous id64, coordinates)
+    d = math.dist(origin, target)
+    queue = [(weight * _jumps(d, jump_range), d, 0, start.id64, None, origin)]
+    seen = {start.id64: 0}  # fewest jumps to each queued system
+    came_from = {}  # previous hop of each expanded system
+    while queue:
+        _, _, jumps, id64, previous, point = heapq.heappop(queue)
+        if id64 in came_from:
+            continue
+        came_from[id64] = previous
+
+        neighbors, coords = index.neighbors(point, jump_range)
+        if (neighbors == goal.id64).any():
+            route = [goal.id64]
+            while id64 is not None:
+                route.append(id64)
+                id64 = came_from[id64]
+            logger.info(
+                f"Found a {len(route) - 1} jump route after expanding "
+                + f"{len(came_from)} systems"
+            )
+            return route[::-1]
+
+        distances = np.sqrt(((coords - target) ** 2).sum(axis=1))
+        estimates = jumps + 1 + weight * _jumps(distances, jump_range)
+        for neighbor, estimate, distance, coord in zip(
+            neighbors.tolist(), estimates.tolist(), distances.tolist(), coords
+        ):
+            if neighbor in came_from or seen.get(neighbor, math.inf) <= jumps + 1:
+                continue
+            seen[neighbor] = jumps + 1
+            heapq.heappush(
+                queue, (estimate, distance, jumps + 1, neighbor, id64, coord)
+            )
+
+        if len(queue) > max_open:
+            logger.debug(f"Trimming the queue of {len(queue)} systems")
+            queue = heapq.nsmallest(max_open // 2, queue)
+            heapq.heapify(queue)
+            seen = {entry[3]: entry[2] for entry in queue}
+
+    logger.info(f"No route found after expanding {len(came_from)} systems")
+    return None
@@ -17,14 +17,24 @@
 
 import logging
 from collections import ChainMap
+from collections.abc import Mapping
+from decimal import Decimal
+from functools import cache
+from typing import Callable
 
 import simplejson
-from marshmallow import EXCLUDE, post_dump, post_load, pre_load
+from marshmallow import EXCLUDE, ValidationError, fields, post_dump, post_load, pre_load
+from marshmallow.utils import is_collection
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
-from marshmallow_sqlalchemy.fields import Nested
+from marshmallow_sqlalchemy.fields import Nested, get_primary_keys
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import ObjectDeletedError
+from sqlalchemy.orm.util import identity_key
 
 from ..database import (
     AtmosphereComposition,
+    Base,
     Belt,
     Body,
     BodyTimestamp,
@@ -598,7 +608,7 @@ class BodySchema(SQLAlchemyAutoSchema):
 class SystemSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = System
-        exclude = ["controllingFaction_id"]
+        exclude = ["controllingFaction_id", "cell_x", "cell_y", "cell_z"]
         include_fk = True
         include_relationships = True
         render_module = simplejson
@@ -639,10 +649,240 @@ class SystemSchema(SQLAlchemyAutoSchema):
         in_data.update(coords)
         return in_data
 
-    @pre_load
-    def init_context(self, in_data, **kwargs):
-        """Initialize the de-serialization context if the caller
-        didn't."""
-        if "factions" not in self.context:
-            self.context["factions"] = {}
-        return in_data
+    def __init__(self, *args, **kwargs):
+        """Prepare the context so that one instance, and the nested
+        schemas it creates on first use, can be reused for many loads,
+        e.g., once per worker process.  Nested schemas only share their
+        parent's context if it isn't empty when they're created."""
+        super().__init__(*args, **kwargs)
+        self._factions = self.context.get("factions")
+        self.context.setdefault("factions", {})
+
+    def load(self, data, *, factions: dict | None = None, **kwargs):
+        """De-serialize a system, resetting the per-load context first.
+        Faction objects are memoized in the given dictionary, so that
+        systems sharing a transaction can share Faction objects, or
+        else in the one passed to the constructor via the context, or
+        else in a new one for each load."""
+        if factions is None:
+            factions = {} if self._factions is None else self._factions
+        # update the shared context in place; cf. __init__()
+        self.context["factions"] = factions
+        return super().load(data, **kwargs)
+
+
+# Fast-path loader used by the ORM import path.  It compiles the
+# schemas above into plain Python, calling each schema's
+# pre_process_input() hook and deferring to its fields only for values
+# that aren't already of the right type, so it builds the same object
+# graph as SystemSchema().load() without Marshmallow's per-field
+# dispatch or schema instantiation.  Existing rows are looked up with
+# one query per table instead of one query per object.
+
+_MISSING = object()
+
+# look up existing rows this many primary keys at a time
+PREFETCH_SIZE = 500
+
+# field types whose already-deserialized values pass through unchanged
+_PASS_THROUGH = {
+    fields.Boolean: bool,
+    fields.Decimal: Decimal,
+    fields.Integer: int,
+    fields.String: str,
+}
+
+
+def _compile_field(field: fields.Field) -> Callable:
+    kind = _PASS_THROUGH.get(type(field))
+    deserialize = field.deserialize
+    if kind is None or field.validators:
+        return deserialize
+    allow_none = field.allow_none
+
+    def convert(value):
+        # Marshmallow's Decimal field rejects NaN and infinity
+        if type(value) is kind and (kind is not Decimal or value.is_finite()):
+            return value
+        if value is None and allow_none:
+            return None
+        return deserialize(value)
+
+    return convert
+
+
+class _ModelLoader:
+    """De-serialize one model's objects the way the given schema
+    would, looking up existing rows by primary key and updating them
+    in place, or else creating new objects.
+
+    Loading happens in two passes.  convert() validates the input and
+    returns a tree of (loader, data) nodes.  build() turns that tree
+    into ORM objects, bottom up, given the existing rows found for
+    each node's primary key; cf. _prefetch()."""
+
+    def __init__(self, schema: SQLAlchemyAutoSchema):
+        self.model = schema.opts.model
+        self.pre_process_input = getattr(schema, "pre_process_input", None)
+        self.exclude_unknown = schema.opts.unknown == EXCLUDE
+        self.names = frozenset(schema.load_fields)
+        self.required = [
+            name for name, field in schema.load_fields.items() if field.required
+        ]
+        self.fields = []
+        self.nested = {}
+        for name, field in schema.load_fields.items():
+            if isinstance(field, Nested):
+                loader = _ModelLoader(field.schema)
+                self.nested[name] = (loader, field.many)
+                self.fields.append((name, field.allow_none, loader, field.many, None))
+            else:
+                convert = _compile_field(field)
+                self.fields.append((name, field.allow_none, None, False, convert))
+        keys = [prop.key for prop in get_primary_keys(self.model)]
+        self.keys = keys if self.names.issuperset(keys) else None
+        self.memoize = self.model is Faction
+
+    def convert(self, in_data) -> tuple["_ModelLoader", dict]:
+        if self.pre_process_input:
+            in_data = self.pre_process_input(in_data)
+        if not isinstance(in_data, Mapping):
+            raise ValidationError({"_schema": ["Invalid input type."]})
+        if not self.exclude_unknown and not in_data.keys() <= self.names:
+            raise ValidationError(
+                {key: ["Unknown field."] for key in in_data.keys() - self.names}
+            )
+        for name in self.required:
+            if name not in in_data:
+                raise ValidationError({name: ["Missing data for required field."]})
+
+        data = {}
+        for name, allow_none, loader, many, convert in self.fields:
+            value = in_data.get(name, _MISSING)
+            if value is _MISSING:
+                continue
+            if loader is None:
+                data[name] = convert(value)
+            elif value is None:
+                if not allow_none:
+                    raise ValidationError({name: ["Field may not be null."]})
+                data[name] = None
+            elif many:
+                if not is_collection(value):
+                    raise ValidationError({name: ["Invalid type."]})
+                data[name] = [loader.convert(item) for item in value]
+            else:
+                data[name] = loader.convert(value)
+        return self, data
+
+    def key(self, data: dict):
+        """Return the primary key of the row the given data would
+        update, if any, the same as SQLAlchemyAutoSchema.get_instance()
+        would look it up."""
+        if not self.keys:
+            return None
+        if len(self.keys) == 1:
+            return data.get(self.keys[0])
+        key = tuple(data.get(name) for name in self.keys)
+        return None if None in key else key
+
+    def build(self, data: dict, session: Session, found: dict, factions: dict):
+        values = {}
+        for name, value in data.items():
+            if name not in self.nested or value is None:
+                values[name] = value
+                continue
+            loader, many = self.nested[name]
+            if many:
+                values[name] = [
+                    loader.build(child, session, found, factions) for _, child in value
+                ]
+            else:
+                values[name] = loader.build(value[1], session, found, factions)
+
+        instance = None
+        key = self.key(values)
+        if key is not None:
+            existing = found.get(self.model)
+            if existing is not None:
+                instance = existing.get(key)
+            else:
+                try:
+                    instance = session.get(self.model, key)
+                except ObjectDeletedError:
+                    pass
+        if instance is not None:
+            for name, value in values.items():
+                setattr(instance, name, value)
+        else:
+            instance = self.model(**values)
+
+        # cf. FactionSchema.post_process_input()
+        if self.memoize:
+            return factions.setdefault(instance.name, instance)
+        return instance
+
+
+@cache
+def _prefetch_stmt(model: type[Base]):
+    [column] = model.__mapper__.primary_key
+    return (
+        select(model).where(column.in_(bindparam("keys", expanding=True))),
+        column.key,
+    )
+
+
+def _prefetch(session: Session, node: tuple[_ModelLoader, dict]) -> dict:
+    """Find the existing rows for every object with a single-column
+    primary key in a tree of (loader, data) nodes, one query per
+    table for those not already in the session, so that building the
+    objects doesn't have to look them up one at a time."""
+    keys = {}
+    stack = [node]
+    while stack:
+        loader, data = stack.pop()
+        if loader.keys and len(loader.keys) == 1:
+            keys.setdefault(loader.model, set())
+            if (key := data.get(loader.keys[0])) is not None:
+                keys[loader.model].add(key)
+        for name, (_, many) in loader.nested.items():
+            value = data.get(name)
+            if value is not None:
+                stack.extend(value if many else [value])
+    found = {}
+    for model, model_keys in keys.items():
+        stmt, key = _prefetch_stmt(model)
+        found[model] = {}
+        # skip the rows already in the session, e.g., factions shared
+        # with an earlier system or seeded from a FactionCache
+        for model_key in list(model_keys):
+            instance = session.identity_map.get(identity_key(model, model_key))
+            if instance is not None:
+                found[model][model_key] = instance
+                model_keys.discard(model_key)
+        model_keys = list(model_keys)
+        for i in range(0, len(model_keys), PREFETCH_SIZE):
+            batch = {"keys": model_keys[i : i + PREFETCH_SIZE]}
+            for instance in session.scalars(stmt, batch):
+                found[model][getattr(instance, key)] = instance
+    return found
+
+
+class SystemLoader:
+    """A compiled equivalent of SystemSchema().load() for the ORM
+    import path.  Build one per process and reuse it.  Factions are
+    memoized in the given dictionary, just like the `factions` entry
+    of SystemSchema's context, so that systems sharing a transaction
+    also share Faction objects."""
+
+    def __init__(self):
+        self._loader = _ModelLoader(SystemSchema())
+
+    def load(
+        self, in_data: dict, session: Session, factions: dict | None = None
+    ) -> System:
+        node = self._loader.convert(in_data)
+        found = _prefetch(session, node)
+        return self._loader.build(
+            node[1], session, found, {} if factions is None else factions
+        )
@@ -0,0 +1,113 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+import math
+from decimal import Decimal
+from typing import Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import CELL_SIZE, System, grid_cell
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# list the grid cells to probe along an axis individually, so that
+# the database can seek to each of them in the composite index, when
+# there are at most this many; otherwise scan the range
+MAX_CELL_PROBES = 64
+
+# the galaxy is about 100,000 light years across, so nothing is ever
+# farther away than this
+MAX_RADIUS = 2**17
+
+Coords = Sequence[Decimal | float]
+
+
+def coords(center: System | Coords) -> tuple[float, float, float]:
+    """Get the coordinates of a system or of a point in space."""
+    if isinstance(center, System):
+        return (float(center.x), float(center.y), float(center.z))
+    x, y, z = center
+    return (float(x), float(y), float(z))
+
+
+def distance(a: System | Coords, b: System | Coords) -> float:
+    """Compute the distance in light years between two systems or
+    points in space."""
+    return math.dist(coords(a), coords(b))
+
+
+def _cell_filter(column, lower: float, upper: float):
+    first, last = grid_cell(lower), grid_cell(upper)
+    if last - first < MAX_CELL_PROBES:
+        return column.in_(range(first, last + 1))
+    return column.between(first, last)
+
+
+def cell_filters(center: System | Coords, radius: float, entity=System) -> list:
+    """Build WHERE clauses that select the systems in the grid cells
+    overlapping the bounding box of a sphere, a superset of the
+    systems inside it.  The clauses apply to any mapped class with the
+    same cell_x, cell_y, and cell_z columns as System."""
+    return [
+        _cell_filter(column, value - radius, value + radius)
+        for column, value in zip(
+            [entity.cell_x, entity.cell_y, entity.cell_z], coords(center)
+        )
+    ]
+
+
+def systems_within(
+    session: Session,
+    center: System | Coords,
+    radius: float,
+    options: tuple = (),
+) -> list[System]:
+    """Find the systems within the given radius (in light years) of a
+    system or point in space, nearest first.  The database narrows
+    the search to the grid cells overlapping the sphere's bounding
+    box; only those candidates' distances are computed here.  Pass a
+    loader profile (cf. the loading module) as the options to load the
+    systems' relationships along with them."""
+    center = coords(center)
+    stmt = select(System).where(*cell_filters(center, radius)).options(*options)
+    found = []
+    for system in session.scalars(stmt):
+        d = distance(center, system)
+        if d <= radius:
+            found.append((d, system.id64, system))
+    found.sort(key=lambda t: t[:2])
+    return [system for _, _, system in found]
+
+
+def nearest_systems(
+    session: Session, center: System | Coords, k: int, options: tuple = ()
+) -> list[System]:
+    """Find the k systems nearest to a system or point in space,
+    nearest first, by searching ever larger spheres until one holds
+    at least k systems.  A system passed as the center is included in
+    the result.  The options are as for systems_within()."""
+    radius = CELL_SIZE
+    while True:
+        found = systems_within(session, center, radius, options)
+        if len(found) >= k or radius >= MAX_RADIUS:
+            return found[:k]
+        logger.debug(f"Found {len(found)} of {k} systems within {radius} ly")
+        radius *= 2
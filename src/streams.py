@@ -0,0 +1,321 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import bz2
+import gzip
+import hashlib
+import io
+import logging
+import lzma
+import os
+import re
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from typing import BinaryIO, Iterator, TextIO
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# read compressed and decompressed data in chunks of this many bytes
+STREAM_BUFFER_SIZE = 16 * 1024 * 1024
+
+# identify data dumps by a hash of this many of their leading bytes
+# plus their size; cf. fingerprint()
+FINGERPRINT_SIZE = 1024 * 1024
+
+# file signatures of the supported compression formats
+MAGIC_NUMBERS = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\xfd7zXZ\x00": "xz",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+# compression formats to write, by file name extension
+EXTENSIONS = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "xz",
+    ".zst": "zstd",
+}
+
+# the JSON tokens that affect nesting: brackets, braces, and strings
+# (which may contain brackets or braces); an unterminated string at
+# the end of the buffer leaves the "quote" group empty
+_JSON_TOKENS = re.compile(
+    rb'(?P<open>[\[{])|(?P<close>[\]}])|"[^"\\]*(?:\\.[^"\\]*)*(?P<quote>"?)',
+    re.DOTALL,
+)
+_SEPARATORS = re.compile(rb"[\s,]*")
+
+# cf. _is_one_element()
+_NOT_STRUCTURAL = bytes(b for b in range(256) if b not in b'"[]{}')
+_QUOTED = re.compile(rb'"[^"]*"')
+
+
+def fingerprint(path: str | Path) -> str:
+    """Identify a data dump by its size and a hash of its first
+    megabyte, which is cheap even for very large files and doesn't
+    depend on the file's name or location."""
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read(FINGERPRINT_SIZE)).hexdigest()
+    return f"{Path(path).stat().st_size}:{digest}"
+
+
+def detect_compression(raw: io.BufferedReader) -> str | None:
+    """Identify the compression format of a file from its first few
+    bytes without consuming them."""
+    head = raw.peek(max(len(magic) for magic in MAGIC_NUMBERS))
+    for magic, compression in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _decompressor(raw: io.BufferedReader, compression: str | None) -> BinaryIO:
+    match compression:
+        case None:
+            return raw
+        case "gzip":
+            return gzip.GzipFile(fileobj=raw)
+        case "bz2":
+            return bz2.BZ2File(raw)
+        case "xz":
+            return lzma.LZMAFile(raw)
+        case "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError(
+                    "Reading Zstandard-compressed files requires the zstandard "
+                    + "package, e.g., `pip install lethbridge[zstd]`"
+                ) from e
+            return zstandard.ZstdDecompressor().stream_reader(
+                raw, read_size=STREAM_BUFFER_SIZE, read_across_frames=True
+            )
+
+
+@contextmanager
+def open_dataset(
+    path: str | Path, buffer_size: int = STREAM_BUFFER_SIZE, text: bool = True
+) -> Iterator[TextIO | BinaryIO]:
+    """Open a possibly compressed data dump for reading as text or, if
+    `text` is false, as bytes.  Gzip, bzip2, xz, and Zstandard files
+    are decompressed on the fly, as detected by their magic numbers,
+    so the uncompressed data never touches the disk.  Both the
+    decompressor and the file itself are closed when the block exits."""
+    raw = open(path, "rb", buffering=buffer_size)
+    try:
+        compression = detect_compression(raw)
+        logger.debug(f"Reading {path} (compression: {compression})")
+        stream = _decompressor(raw, compression)
+        if compression is not None:
+            stream = io.BufferedReader(stream, buffer_size=buffer_size)
+        if text:
+            stream = io.TextIOWrapper(stream, encoding="utf-8")
+        with stream:
+            yield stream
+    finally:
+        raw.close()
+
+
+def _compressor(raw: io.BufferedWriter, compression: str | None) -> BinaryIO:
+    match compression:
+        case None:
+            return raw
+        case "gzip":
+            return gzip.GzipFile(fileobj=raw, mode="wb")
+        case "bz2":
+            return bz2.BZ2File(raw, "wb")
+        case "xz":
+            return lzma.LZMAFile(raw, "wb")
+        case "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError(
+                    "Writing Zstandard-compressed files requires the zstandard "
+                    + "package, e.g., `pip install lethbridge[zstd]`"
+                ) from e
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+
+
+@contextmanager
+def create_dataset(
+    path: str | Path, buffer_size: int = STREAM_BUFFER_SIZE
+) -> Iterator[TextIO]:
+    """Open a data dump for writing as text, compressing it on the fly
+    according to its extension (.gz, .bz2, .xz, or .zst).  The data
+    goes to a temporary file that replaces `path` only once the block
+    exits without an error, so readers never see a partial dump."""
+    path = Path(path)
+    compression = EXTENSIONS.get(path.suffix.lower())
+    logger.debug(f"Writing {path} (compression: {compression})")
+    partial = path.with_name(path.name + ".tmp")
+    raw = open(partial, "wb", buffering=buffer_size)
+    stream = None
+    try:
+        stream = io.TextIOWrapper(_compressor(raw, compression), encoding="utf-8")
+        yield stream
+        stream.close()
+        raw.close()
+    except BaseException:
+        if stream is not None:
+            with suppress(Exception):
+                stream.close()
+        raw.close()
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, path)
+
+
+def _is_one_element(text: bytes) -> bool:
+    """Check whether some text is exactly one JSON object or array
+    using only C-level string operations: drop escaped characters,
+    keep just the quotes, brackets, and braces, drop the strings, and
+    peel off matching pairs."""
+    skeleton = text.replace(b"\\\\", b"").replace(b'\\"', b"")
+    brackets = _QUOTED.sub(b"", skeleton.translate(None, _NOT_STRUCTURAL))
+    if b'"' in brackets:
+        return False
+    if brackets[:1] + brackets[-1:] not in (b"{}", b"[]"):
+        return False
+    inner = brackets[1:-1]
+    while inner:
+        reduced = inner.replace(b"{}", b"").replace(b"[]", b"")
+        if len(reduced) == len(inner):
+            return False
+        inner = reduced
+    return True
+
+
+def skip_to(stream: BinaryIO, offset: int) -> None:
+    """Move a freshly opened stream forward to the given offset,
+    seeking if possible and otherwise reading and discarding data.
+    (Python's gzip, bz2, and lzma readers emulate seeking this way,
+    too.)"""
+    try:
+        stream.seek(offset)
+        return
+    except (OSError, ValueError):
+        pass
+    remaining = offset
+    while remaining > 0:
+        skipped = len(stream.read(min(remaining, STREAM_BUFFER_SIZE)))
+        if not skipped:
+            break
+        remaining -= skipped
+
+
+def json_array_elements(
+    stream: BinaryIO, buffer_size: int = STREAM_BUFFER_SIZE
+) -> Iterator[bytes]:
+    """Yield the raw JSON text of each element of a top-level JSON
+    array read from a binary stream; cf. json_array_offsets()."""
+    for _, element in json_array_offsets(stream, buffer_size):
+        yield element
+
+
+def json_array_offsets(
+    stream: BinaryIO, buffer_size: int = STREAM_BUFFER_SIZE, offset: int = 0
+) -> Iterator[tuple[int, bytes]]:
+    """Yield the raw JSON text of each element of a top-level JSON
+    array read from a binary stream, regardless of the whitespace
+    between or within elements, along with the stream offset just
+    past that element.  Elements must be objects or arrays.  Passing
+    a previously yielded offset resumes reading from there.
+
+    Only brackets, braces, and strings are tokenized, so parsing
+    (e.g., into Decimals) is left to the caller.  While elements come
+    one per line, as in Spansh's dumps, whole lines are checked at
+    once; otherwise, the text is scanned token by token.  The stream
+    is read in chunks of `buffer_size` bytes, and data is discarded
+    once its element has been yielded, so memory use is bounded by
+    the chunk size plus the largest element."""
+    base = 0  # the stream offset of the start of the buffer
+    depth = 0
+    if offset:
+        skip_to(stream, offset)
+        base = offset
+        depth = 1
+    buffer = b""
+    pos = 0  # where to resume scanning
+    start = None  # where the current element begins
+    lines = True  # whether elements have come one per line so far
+    while chunk := stream.read(buffer_size):
+        keep = pos if start is None else start
+        buffer = buffer[keep:] + chunk
+        base += keep
+        pos -= keep
+        if start is not None:
+            start -= keep
+        while True:
+            if depth == 1 and start is None:
+                # look for the next element
+                pos = _SEPARATORS.match(buffer, pos).end()
+                if pos == len(buffer):
+                    break
+                if buffer[pos] == ord("]"):
+                    return
+                if buffer[pos] not in b"{[":
+                    logger.error("Not a JSON array of objects or arrays")
+                    return
+                if lines and (end := buffer.find(b"\n", pos)) != -1:
+                    element = buffer[pos:end].rstrip(b" \t\r,")
+                    if _is_one_element(element):
+                        pos = end
+                        yield base + pos, element
+                        continue
+                    lines = False
+            cut = False  # whether a string runs past the end of the buffer
+            for match in _JSON_TOKENS.finditer(buffer, pos):
+                if match.lastgroup == "quote":
+                    if not match.group("quote"):
+                        # read more data and re-scan this string
+                        pos = match.start()
+                        cut = True
+                        break
+                    if depth < 2:
+                        logger.error("Not a JSON array of objects or arrays")
+                        return
+                elif match.lastgroup == "open":
+                    depth += 1
+                    if depth == 1:
+                        if match.group() != b"[":
+                            logger.error("Not a JSON array")
+                            return
+                        pos = match.end()
+                        break
+                    if depth == 2:
+                        start = match.start()
+                else:
+                    depth -= 1
+                    if depth == 1:
+                        pos = match.end()
+                        yield base + pos, buffer[start:pos]
+                        start = None
+                        break
+                    if depth == 0:
+                        return
+            else:
+                pos = len(buffer)
+                break
+            if cut or start is not None or depth != 1:
+                # stopped at an unterminated string
+                break
+    if depth:
+        logger.warning("JSON array truncated")
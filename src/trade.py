@@ -0,0 +1,343 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from typing import NamedTuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from .database import CommodityPrice, System
+from .market import pad_filter
+from .spatial import Coords, cell_filters, coords
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "The trade route finder requires the numpy package, e.g., "
+        + "`pip install lethbridge[numpy]`"
+    ) from e
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# fetch market orders this many at a time
+FETCH_BATCH_SIZE = 10_000
+
+
+class Hop(NamedTuple):
+    """Carrying a load of one commodity from one station to another,
+    or nothing (no symbol and zero units) if no trade pays."""
+
+    source_station_id: int
+    source_station: str
+    source_system: str
+    destination_station_id: int
+    destination_station: str
+    destination_system: str
+    symbol: str | None
+    units: int
+    buyPrice: int
+    sellPrice: int
+    profit: int
+    distance: float
+
+
+class Loop(NamedTuple):
+    """A round trip between two stations, trading both ways."""
+
+    outbound: Hop
+    inbound: Hop
+
+    @property
+    def profit(self) -> int:
+        return self.outbound.profit + self.inbound.profit
+
+
+class _Markets:
+    """The markets of the stations around a point, as dense station by
+    commodity matrices: the price of buying from each station (inf if
+    it has no stock), the price of selling to it (zero if it has no
+    demand), and the corresponding supply and demand."""
+
+    def __init__(
+        self,
+        session: Session,
+        center: System | Coords,
+        radius: float,
+        max_station_distance: float | None,
+        pad_size: str | None,
+        max_age: timedelta | None,
+    ):
+        stmt = select(
+            CommodityPrice.station_id,
+            CommodityPrice.station_name,
+            CommodityPrice.system_name,
+            CommodityPrice.x,
+            CommodityPrice.y,
+            CommodityPrice.z,
+            CommodityPrice.symbol,
+            CommodityPrice.buyPrice,
+            CommodityPrice.supply,
+            CommodityPrice.sellPrice,
+            CommodityPrice.demand,
+        ).where(*cell_filters(center, radius, CommodityPrice))
+        if max_station_distance is not None:
+            stmt = stmt.where(
+                or_(
+                    CommodityPrice.distanceToArrival.is_(None),
+                    CommodityPrice.distanceToArrival <= max_station_distance,
+                )
+            )
+        if pad_size:
+            stmt = stmt.where(pad_filter(pad_size))
+        if max_age is not None:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            stmt = stmt.where(CommodityPrice.updateTime >= now - max_age)
+        stmt = stmt.order_by(CommodityPrice.station_id).execution_options(
+            yield_per=FETCH_BATCH_SIZE
+        )
+
+        # index the stations and commodities as they turn up, keeping
+        # only the stations inside the sphere
+        center = np.array(coords(center))
+        self.station_ids = []
+        self.station_names = []
+        self.system_names = []
+        points = []
+        symbols = {}
+        orders = []
+        station_id = None
+        for row in session.execute(stmt):
+            if row[0] != station_id:
+                station_id = row[0]
+                point = np.array([float(v) for v in row[3:6]])
+                inside = ((point - center) ** 2).sum() <= radius**2
+                if inside:
+                    self.station_ids.append(station_id)
+                    self.station_names.append(row[1])
+                    self.system_names.append(row[2])
+                    points.append(point)
+            if inside:
+                code = symbols.setdefault(row[6], len(symbols))
+                orders.append((len(self.station_ids) - 1, code, *row[7:]))
+        self.points = np.array(points).reshape(-1, 3)
+        self.symbols = list(symbols)
+
+        shape = (len(self.station_ids), len(self.symbols))
+        self.buy = np.full(shape, np.inf)
+        self.supply = np.zeros(shape)
+        self.sell = np.zeros(shape)
+        self.demand = np.zeros(shape)
+        if orders:
+            station, code, buy, supply, sell, demand = np.array(
+                orders, dtype=np.int64
+            ).T
+            stocked = (buy > 0) & (supply > 0)
+            self.buy[station[stocked], code[stocked]] = buy[stocked]
+            self.supply[station[stocked], code[stocked]] = supply[stocked]
+            wanted = (sell > 0) & (demand > 0)
+            self.sell[station[wanted], code[wanted]] = sell[wanted]
+            self.demand[station[wanted], code[wanted]] = demand[wanted]
+
+        # drop commodities that can't turn a profit anywhere here
+        profitable = self.sell.max(axis=0, initial=0) > self.buy.min(
+            axis=0, initial=np.inf
+        )
+        self.symbols = [s for s, p in zip(self.symbols, profitable) if p]
+        for name in ["buy", "supply", "sell", "demand"]:
+            setattr(self, name, getattr(self, name)[:, profitable])
+        logger.info(
+            f"Loaded the markets of {len(self.station_ids)} stations trading "
+            + f"{len(self.symbols)} profitable commodities"
+        )
+
+    def __len__(self) -> int:
+        return len(self.station_ids)
+
+    def reachable(self, source: int, jump_range: float) -> "np.ndarray":
+        """List the other stations within one jump of a station."""
+        d2 = ((self.points - self.points[source]) ** 2).sum(axis=1)
+        found = np.flatnonzero(d2 <= jump_range**2)
+        return found[found != source]
+
+    def best(
+        self, sources: "np.ndarray", destinations: "np.ndarray", capacity: int
+    ) -> tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """Find the most profitable commodity to carry between each
+        pair of source and destination stations, given as parallel
+        arrays (or a single source for many destinations).  Returns
+        the commodity, the units carried, and the profit."""
+        margin = np.maximum(self.sell[destinations] - self.buy[sources], 0)
+        units = np.minimum(
+            np.minimum(self.supply[sources], self.demand[destinations]), capacity
+        )
+        profit = margin * units
+        best = profit.argmax(axis=1)
+        rows = np.arange(len(destinations))
+        return best, units[rows, best], profit[rows, best]
+
+    def bounds(self, capacity: int) -> tuple["np.ndarray", "np.ndarray"]:
+        """Bound the profit of a full hold leaving and arriving at each
+        station, assuming the best price anywhere at the other end."""
+        best_sell = self.sell.max(axis=0, initial=0)
+        best_buy = self.buy.min(axis=0, initial=np.inf)
+        outbound = np.maximum(best_sell - self.buy, 0).max(axis=1, initial=0)
+        inbound = np.maximum(self.sell - best_buy, 0).max(axis=1, initial=0)
+        return outbound * capacity, inbound * capacity
+
+    def hop(self, source: int, destination: int, code: int, units: int) -> Hop:
+        buy = self.buy[source, code]
+        sell = self.sell[destination, code]
+        if not units or sell <= buy:
+            symbol, units, buy, sell = None, 0, 0, 0
+        else:
+            symbol, units, buy, sell = (
+                self.symbols[code],
+                int(units),
+                int(buy),
+                int(sell),
+            )
+        return Hop(
+            self.station_ids[source],
+            self.station_names[source],
+            self.system_names[source],
+            self.station_ids[destination],
+            self.station_names[destination],
+            self.system_names[destination],
+            symbol,
+            units,
+            buy,
+            sell,
+            units * (sell - buy),
+            float(np.linalg.norm(self.points[source] - self.points[destination])),
+        )
+
+
+class _TopK:
+    """A bounded min-heap that keeps the k best-scoring items."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.heap = []
+        self.counter = count()  # tie breaker, so items never compare
+
+    @property
+    def threshold(self) -> float:
+        """The score a new item must beat to make the cut."""
+        return self.heap[0][0] if len(self.heap) >= self.k else 0
+
+    def push(self, score: float, item) -> None:
+        entry = (score, -next(self.counter), item)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif score > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def items(self) -> list:
+        return [item for _, _, item in sorted(self.heap, reverse=True)]
+
+
+def _candidates(profits: "np.ndarray", threshold: float, k: int) -> "np.ndarray":
+    """Pick the (at most k) indexes of the profits that beat the
+    threshold, without sorting them all."""
+    found = np.flatnonzero(profits > threshold)
+    if len(found) > k:
+        found = found[np.argpartition(profits[found], -k)[-k:]]
+    return found
+
+
+def find_trades(
+    session: Session,
+    center: System | Coords,
+    capacity: int,
+    jump_range: float,
+    radius: float | None = None,
+    max_station_distance: float | None = None,
+    pad_size: str | None = None,
+    max_age: timedelta | None = None,
+    limit: int = 10,
+) -> list[Hop]:
+    """Find the most profitable single hops between stations that are
+    one jump apart, within radius (by default, the jump range) light
+    years of a system or point in space, carrying capacity tons of
+    one commodity.  Stations can be filtered by their distance from
+    the arrival star (in light seconds), by landing pad size, and by
+    the age of their market data, as in lethbridge.market."""
+    markets = _Markets(
+        session, center, radius or jump_range, max_station_distance, pad_size, max_age
+    )
+    top = _TopK(limit)
+    outbound, _ = markets.bounds(capacity)
+    for source in np.argsort(-outbound, kind="stable"):
+        if outbound[source] <= top.threshold:
+            break  # no remaining station can do better
+        destinations = markets.reachable(source, jump_range)
+        codes, units, profits = markets.best(source, destinations, capacity)
+        for i in _candidates(profits, top.threshold, limit):
+            top.push(
+                profits[i],
+                markets.hop(source, destinations[i], codes[i], units[i]),
+            )
+    return top.items()
+
+
+def find_loops(
+    session: Session,
+    center: System | Coords,
+    capacity: int,
+    jump_range: float,
+    radius: float | None = None,
+    max_station_distance: float | None = None,
+    pad_size: str | None = None,
+    max_age: timedelta | None = None,
+    limit: int = 10,
+) -> list[Loop]:
+    """Find the most profitable round trips between pairs of stations
+    that are one jump apart, trading both ways, subject to the same
+    options as find_trades().  Each pair appears at most once."""
+    markets = _Markets(
+        session, center, radius or jump_range, max_station_distance, pad_size, max_age
+    )
+    top = _TopK(limit)
+    outbound, inbound = markets.bounds(capacity)
+    bounds = outbound + inbound
+    done = np.zeros(len(markets), dtype=bool)
+    for source in np.argsort(-bounds, kind="stable"):
+        if bounds[source] <= top.threshold:
+            break  # no remaining station can do better
+        done[source] = True
+        destinations = markets.reachable(source, jump_range)
+        destinations = destinations[~done[destinations]]  # seen from both ends
+        codes_out, units_out, profits_out = markets.best(source, destinations, capacity)
+        codes_in, units_in, profits_in = markets.best(
+            destinations, np.full(len(destinations), source), capacity
+        )
+        profits = profits_out + profits_in
+        for i in _candidates(profits, top.threshold, limit):
+            top.push(
+                profits[i],
+                Loop(
+                    markets.hop(source, destinations[i], codes_out[i], units_out[i]),
+                    markets.hop(destinations[i], source, codes_in[i], units_in[i]),
+                ),
+            )
+    return top.items()
@@ -0,0 +1,760 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import logging
+from functools import cache
+
+from marshmallow import ValidationError
+from marshmallow.fields import DateTime
+from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
+from sqlalchemy import Table, bindparam, delete, or_, select, tuple_
+from sqlalchemy import types as sqltypes
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .database import (
+    AtmosphereComposition,
+    Base,
+    Belt,
+    Body,
+    BodyTimestamp,
+    Faction,
+    FactionState,
+    Market,
+    MarketOrder,
+    Material,
+    Outfitting,
+    OutfittingStock,
+    Parent,
+    PowerPlay,
+    ProhibitedCommodity,
+    Ring,
+    Shipyard,
+    ShipyardStock,
+    Signals,
+    SolidComposition,
+    Station,
+    StationEconomy,
+    StationService,
+    System,
+    ThargoidWar,
+    _utc,
+    grid_cell,
+)
+from .schemas.spansh import (
+    BeltSchema,
+    BodySchema,
+    MarketSchema,
+    OutfittingSchema,
+    OutfittingStockSchema,
+    RingSchema,
+    ShipyardSchema,
+    ShipyardStockSchema,
+    SignalsSchema,
+    StationSchema,
+    SystemSchema,
+    ThargoidWarSchema,
+)
+
+# configure module-level logging
+logger = logging.getLogger(__name__)
+
+# child tables synchronized with the incoming rows when their parent
+# row is accepted, listed with the child's foreign key column; each
+# child's primary key is its natural key, e.g., a market order's
+# symbol and category along with the market's station ID
+CHILD_TABLES = {
+    "system": [
+        ("faction_state", "system_id64"),
+        ("powerplay", "system_id64"),
+        ("thargoid_war", "system_id64"),
+    ],
+    "body": [
+        ("atmosphere_composition", "body_id64"),
+        ("solid_composition", "body_id64"),
+        ("material", "body_id64"),
+        ("body_timestamp", "body_id64"),
+        ("parent", "body_id64"),
+        ("belt", "body_id64"),
+        ("ring", "body_id64"),
+    ],
+    "station": [
+        ("station_economy", "station_id"),
+        ("station_service", "station_id"),
+    ],
+    "market": [
+        ("market_order", "market_id"),
+        ("prohibited_commodity", "market_id"),
+    ],
+    "shipyard": [
+        ("shipyard_stock", "shipyard_id"),
+    ],
+    "outfitting": [
+        ("outfitting_stock", "outfitting_id"),
+    ],
+}
+
+# parent tables guarded against stale data, listed with their primary
+# key column and the column that must increase
+GUARDED_TABLES = {
+    "system": ("id64", "date"),
+    "body": ("id64", "updateTime"),
+    "station": ("id", "updateTime"),
+    "market": ("station_id", "updateTime"),
+    "shipyard": ("station_id", "updateTime"),
+    "outfitting": ("station_id", "updateTime"),
+}
+
+
+# Spansh-to-table flattening used by the SQL import paths (here and in
+# lethbridge.bulk), which skip the ORM and therefore the schemas.  Each
+# helper mirrors the corresponding schema's pre-processing.
+
+_DATETIME = DateTime()
+
+
+def _columns(model: type[Base]) -> list[tuple[str, bool]]:
+    return [
+        (column.name, isinstance(column.type, sqltypes.DateTime))
+        for column in model.__table__.columns
+    ]
+
+
+_COLUMNS = {
+    model.__tablename__: _columns(model)
+    for model in [
+        AtmosphereComposition,
+        Belt,
+        Body,
+        BodyTimestamp,
+        Faction,
+        FactionState,
+        Market,
+        MarketOrder,
+        Material,
+        Outfitting,
+        OutfittingStock,
+        Parent,
+        PowerPlay,
+        ProhibitedCommodity,
+        Ring,
+        Shipyard,
+        ShipyardStock,
+        Signals,
+        SolidComposition,
+        Station,
+        StationEconomy,
+        StationService,
+        System,
+        ThargoidWar,
+    ]
+}
+
+
+def _fields(
+    schema: type[SQLAlchemyAutoSchema], add: set[str] = set(), remove: set[str] = set()
+) -> set[str]:
+    """List the input keys accepted by the given schema, accounting
+    for keys added or removed by its pre-processing hook."""
+    return (set(schema().load_fields) - remove) | add
+
+
+# input keys accepted by the schemas that reject unknown fields, by
+# table name
+_FIELDS = {
+    "system": _fields(SystemSchema, {"coords"}, {"x", "y", "z"}),
+    "thargoid_war": _fields(ThargoidWarSchema),
+    "body": _fields(BodySchema),
+    "belt": _fields(BeltSchema),
+    "ring": _fields(RingSchema),
+    "signals": _fields(SignalsSchema),
+    "station": _fields(
+        StationSchema,
+        {"landingPads"},
+        {"largeLandingPads", "mediumLandingPads", "smallLandingPads"},
+    ),
+    "market": _fields(MarketSchema),
+    "shipyard": _fields(ShipyardSchema),
+    "shipyard_stock": _fields(ShipyardStockSchema),
+    "outfitting": _fields(OutfittingSchema),
+    "outfitting_stock": _fields(OutfittingStockSchema, {"class"}, {"class_"}),
+}
+
+
+def _row(table: str, in_data: dict, **kwargs) -> dict:
+    """Select the given table's columns from the input, converting
+    date/time strings along the way.  Missing columns are null, so
+    that rows for the same table always have the same keys.  Like
+    the schemas, reject unknown fields where appropriate."""
+    if table in _FIELDS and not in_data.keys() <= _FIELDS[table]:
+        raise ValidationError(
+            {key: ["Unknown field."] for key in in_data.keys() - _FIELDS[table]}
+        )
+    row = {}
+    for name, is_datetime in _COLUMNS[table]:
+        value = kwargs[name] if name in kwargs else in_data.get(name)
+        if is_datetime and isinstance(value, str):
+            value = _DATETIME.deserialize(value)
+        row[name] = value
+    return row
+
+
+def _signals_row(in_data: dict, **kwargs) -> dict:
+    row = _row("signals", in_data, **kwargs)
+    row["signals"] = [
+        {"name": name, "quantity": quantity}
+        for name, quantity in in_data.get("signals", {}).items()
+    ]
+    row["genuses"] = [{"name": name} for name in in_data.get("genuses", [])]
+    return row
+
+
+def _station_rows(rows: dict, in_data: dict, **kwargs) -> None:
+    station_id = in_data["id"]
+    landing_pads = in_data.get("landingPads") or {}
+    rows["station"].append(
+        _row(
+            "station",
+            in_data,
+            controllingFaction_id=in_data.get("controllingFaction"),
+            largeLandingPads=landing_pads.get("large"),
+            mediumLandingPads=landing_pads.get("medium"),
+            smallLandingPads=landing_pads.get("small"),
+            **kwargs,
+        )
+    )
+    if in_data.get("controllingFaction"):
+        rows["faction"].append(
+            _row(
+                "faction",
+                {
+                    "name": in_data["controllingFaction"],
+                    "allegiance": in_data.get("allegiance"),
+                    "government": in_data.get("government"),
+                },
+            )
+        )
+    rows["station_economy"].extend(
+        {"name": name, "weight": weight, "station_id": station_id}
+        for name, weight in (in_data.get("economies") or {}).items()
+    )
+    rows["station_service"].extend(
+        {"name": name, "station_id": station_id}
+        for name in in_data.get("services") or []
+    )
+    if market := in_data.get("market"):
+        rows["market"].append(_row("market", market, station_id=station_id))
+        rows["market_order"].extend(
+            _row("market_order", commodity, market_id=station_id)
+            for commodity in market.get("commodities") or []
+        )
+        rows["prohibited_commodity"].extend(
+            {"name": name, "market_id": station_id}
+            for name in market.get("prohibitedCommodities") or []
+        )
+    if shipyard := in_data.get("shipyard"):
+        rows["shipyard"].append(_row("shipyard", shipyard, station_id=station_id))
+        rows["shipyard_stock"].extend(
+            _row("shipyard_stock", ship, shipyard_id=station_id)
+            for ship in shipyard.get("ships") or []
+        )
+    if outfitting := in_data.get("outfitting"):
+        rows["outfitting"].append(_row("outfitting", outfitting, station_id=station_id))
+        rows["outfitting_stock"].extend(
+            _row(
+                "outfitting_stock",
+                module,
+                class_=module.get("class"),
+                outfitting_id=station_id,
+            )
+            for module in outfitting.get("modules") or []
+        )
+
+
+def _body_rows(rows: dict, in_data: dict, system_id64: int) -> None:
+    body_id64 = in_data["id64"]
+    rows["body"].append(_row("body", in_data, system_id64=system_id64))
+    for table, attribute in [
+        ("atmosphere_composition", "atmosphereComposition"),
+        ("solid_composition", "solidComposition"),
+        ("material", "materials"),
+    ]:
+        rows[table].extend(
+            {"name": name, "percentage": percentage, "body_id64": body_id64}
+            for name, percentage in (in_data.get(attribute) or {}).items()
+        )
+    rows["body_timestamp"].extend(
+        _row("body_timestamp", {"name": name, "value": value}, body_id64=body_id64)
+        for name, value in (in_data.get("timestamps") or {}).items()
+    )
+    rows["parent"].extend(
+        {"name": name, "bodyId": bodyId, "body_id64": body_id64}
+        for parent in in_data.get("parents") or []
+        for name, bodyId in parent.items()
+    )
+    if signals := in_data.get("signals"):
+        rows["signals"].append(_signals_row(signals, body_id64=body_id64))
+    rows["belt"].extend(
+        _row("belt", belt, body_id64=body_id64) for belt in in_data.get("belts") or []
+    )
+    for ring in in_data.get("rings") or []:
+        rows["ring"].append(_row("ring", ring, body_id64=body_id64))
+        if signals := ring.get("signals"):
+            rows["signals"].append(_signals_row(signals, ring_name=ring["name"]))
+    for station in in_data.get("stations") or []:
+        _station_rows(rows, station, body_id64=body_id64)
+
+
+def system_rows(in_data: dict) -> dict[str, list[dict]]:
+    """Flatten a system from a Spansh data dump into rows for each
+    table, listed in foreign key dependency order.  Because the
+    signals table has a surrogate key, each signals row carries its
+    detected signals and genuses in the `signals` and `genuses` keys
+    instead of as separate tables.
+
+    The same faction may appear more than once, in the order
+    SystemSchema would have processed it, so callers should keep the
+    first row for each faction name."""
+    rows = {
+        table: []
+        for table in [
+            "faction",
+            "system",
+            "faction_state",
+            "powerplay",
+            "thargoid_war",
+            "body",
+            "atmosphere_composition",
+            "solid_composition",
+            "material",
+            "body_timestamp",
+            "parent",
+            "belt",
+            "ring",
+            "signals",
+            "station",
+            "station_economy",
+            "station_service",
+            "market",
+            "market_order",
+            "prohibited_commodity",
+            "shipyard",
+            "shipyard_stock",
+            "outfitting",
+            "outfitting_stock",
+        ]
+    }
+    system_id64 = in_data["id64"]
+    coords = in_data["coords"]
+    controlling_faction = in_data.get("controllingFaction") or {}
+    for faction in in_data.get("factions") or []:
+        rows["faction"].append(_row("faction", faction))
+        rows["faction_state"].append(
+            _row(
+                "faction_state",
+                faction,
+                faction_name=faction["name"],
+                system_id64=system_id64,
+            )
+        )
+    if controlling_faction:
+        rows["faction"].append(_row("faction", controlling_faction))
+    rows["system"].append(
+        _row(
+            "system",
+            in_data,
+            x=coords["x"],
+            y=coords["y"],
+            z=coords["z"],
+            cell_x=grid_cell(coords["x"]),
+            cell_y=grid_cell(coords["y"]),
+            cell_z=grid_cell(coords["z"]),
+            controllingFaction_id=controlling_faction.get("name"),
+        )
+    )
+    rows["powerplay"].extend(
+        {"power": power, "system_id64": system_id64}
+        for power in in_data.get("powers") or []
+    )
+    if thargoid_war := in_data.get("thargoidWar"):
+        rows["thargoid_war"].append(
+            _row("thargoid_war", thargoid_war, system_id64=system_id64)
+        )
+    for body in in_data.get("bodies") or []:
+        _body_rows(rows, body, system_id64)
+    for station in in_data.get("stations") or []:
+        _station_rows(rows, station, system_id64=system_id64)
+    return rows
+
+
+def _table(name: str) -> Table:
+    return Base.metadata.tables[name]
+
+
+def _insert(dialect: str):
+    match dialect:
+        case "postgresql":
+            return postgresql.insert
+        case "sqlite":
+            return sqlite.insert
+        case _:
+            raise NotImplementedError(f"Upserts not supported on {dialect}")
+
+
+@cache
+def _guarded_upsert(dialect: str, name: str):
+    """Build an upsert statement that only overwrites rows with newer
+    data, or rows that don't record when they were last updated, and
+    returns the primary keys of the rows it touched."""
+    table = _table(name)
+    key, guard = GUARDED_TABLES[name]
+    stmt = _insert(dialect)(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={
+            column.name: stmt.excluded[column.name]
+            for column in table.columns
+            if column.name != key
+        },
+        where=or_(stmt.excluded[guard] > table.c[guard], table.c[guard].is_(None)),
+    ).returning(table.c[key])
+
+
+@cache
+def _faction_upsert(dialect: str, overwrite: bool):
+    table = _table("faction")
+    stmt = _insert(dialect)(table)
+    if not overwrite:
+        return stmt.on_conflict_do_nothing(index_elements=["name"])
+    return stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={
+            "allegiance": stmt.excluded.allegiance,
+            "government": stmt.excluded.government,
+        },
+    )
+
+
+def _first_by(rows: list[dict], key: str) -> list[dict]:
+    """De-duplicate rows by the given key, keeping the first of each
+    and sorting by that key so that concurrent transactions lock rows
+    in the same order."""
+    unique = {}
+    for row in rows:
+        unique.setdefault(row[key], row)
+    return [unique[k] for k in sorted(unique)]
+
+
+def _upsert(session: Session, name: str, rows: list[dict]) -> set:
+    """Upsert rows into a guarded table, returning the primary keys of
+    the rows inserted or updated."""
+    if not rows:
+        return set()
+    key, _ = GUARDED_TABLES[name]
+    stmt = _guarded_upsert(session.get_bind().dialect.name, name)
+    result = session.connection().execute(stmt, _first_by(rows, key))
+    return set(result.scalars())
+
+
+@cache
+def _child_update(name: str):
+    """Build an update statement that overwrites a child row's
+    non-key columns, matching the row by its primary key."""
+    table = _table(name)
+    return (
+        update(table)
+        .where(
+            *[column == bindparam(f"key_{column.name}") for column in table.primary_key]
+        )
+        .values(
+            {
+                column.name: bindparam(f"value_{column.name}")
+                for column in table.columns
+                if not column.primary_key
+            }
+        )
+    )
+
+
+def _sync_children(
+    session: Session, parent: str, accepted: set, rows: dict[str, list[dict]]
+) -> None:
+    """Bring the child rows of accepted parent rows in line with the
+    incoming ones, matching them by primary key.  Only the rows that
+    were added, removed, or changed get written, so refreshing a
+    market where a few prices moved updates just those orders instead
+    of deleting and re-inserting all of them."""
+    if not accepted:
+        return
+    connection = session.connection()
+    for name, fk in CHILD_TABLES[parent]:
+        table = _table(name)
+        key = [column.name for column in table.primary_key]
+        values = [column.name for column in table.columns if not column.primary_key]
+        incoming = {
+            tuple(row[k] for k in key): row for row in rows[name] if row[fk] in accepted
+        }
+        stored = {
+            tuple(row[k] for k in key): row
+            for row in connection.execute(
+                select(table).where(table.c[fk].in_(accepted))
+            ).mappings()
+        }
+        removed = [k for k in stored if k not in incoming]
+        if removed:
+            connection.execute(
+                delete(table).where(tuple_(*table.primary_key).in_(removed))
+            )
+        added = [row for k, row in incoming.items() if k not in stored]
+        if added:
+            connection.execute(table.insert(), added)
+        changed = [
+            row
+            for k, row in incoming.items()
+            if k in stored and any(row[v] != stored[k][v] for v in values)
+        ]
+        if changed:
+            connection.execute(
+                _child_update(name),
+                [
+                    {
+                        **{f"key_{k}": row[k] for k in key},
+                        **{f"value_{v}": row[v] for v in values},
+                    }
+                    for row in changed
+                ],
+            )
+        logger.debug(
+            f"{name}: {len(added)} added, {len(changed)} changed, "
+            + f"{len(removed)} removed, "
+            + f"{len(incoming) - len(added) - len(changed)} unchanged"
+        )
+
+
+def _replace_signals(session: Session, bodies: set) -> None:
+    """Replace the signals of accepted bodies and their rings, along
+    with the detected signals and genuses."""
+    if not bodies:
+        return
+    connection = session.connection()
+    signals = _table("signals")
+    detected_signal = _table("detected_signal")
+    detected_genus = _table("detected_genus")
+    ring = _table("ring")
+    stale = select(signals.c.id).where(
+        or_(
+            signals.c.body_id64.in_(bodies),
+            signals.c.ring_name.in_(
+                select(ring.c.name).where(ring.c.body_id64.in_(bodies))
+            ),
+        )
+    )
+    connection.execute(
+        delete(detected_signal).where(detected_signal.c.signals_id.in_(stale))
+    )
+    connection.execute(
+        delete(detected_genus).where(detected_genus.c.signals_id.in_(stale))
+    )
+    connection.execute(delete(signals).where(signals.c.id.in_(stale)))
+
+
+def _insert_signals(session: Session, rows: list[dict]) -> None:
+    if not rows:
+        return
+    connection = session.connection()
+    signals = _table("signals")
+    ids = connection.execute(
+        signals.insert().returning(signals.c.id, sort_by_parameter_order=True),
+        [
+            {
+                "updateTime": row["updateTime"],
+                "body_id64": row["body_id64"],
+                "ring_name": row["ring_name"],
+            }
+            for row in rows
+        ],
+    ).scalars()
+    detected_signals = []
+    detected_genuses = []
+    for signals_id, row in zip(ids, rows):
+        detected_signals.extend(
+            {"signals_id": signals_id, **signal} for signal in row["signals"]
+        )
+        detected_genuses.extend(
+            {"signals_id": signals_id, **genus} for genus in row["genuses"]
+        )
+    if detected_signals:
+        connection.execute(_table("detected_signal").insert(), detected_signals)
+    if detected_genuses:
+        connection.execute(_table("detected_genus").insert(), detected_genuses)
+
+
+def _detach(
+    session: Session, name: str, key: str, fk: str, parents: set, keep: set
+) -> None:
+    """Unlink rows no longer listed by their accepted parent, the same
+    as the ORM does when replacing a collection."""
+    if not parents:
+        return
+    table = _table(name)
+    session.connection().execute(
+        update(table)
+        .where(table.c[fk].in_(parents), table.c[key].not_in(keep))
+        .values({fk: None})
+    )
+
+
+def _insert_factions(session: Session, rows: list[dict]) -> None:
+    if rows:
+        session.connection().execute(
+            _faction_upsert(session.get_bind().dialect.name, False),
+            _first_by(rows, "name"),
+        )
+
+
+def _latest(batch: list[dict]) -> dict[int, dict[str, list[dict]]]:
+    """Flatten a batch of systems, keeping the latest copy of each."""
+    latest = {}
+    for in_data in batch:
+        rows = system_rows(in_data)
+        [system] = rows["system"]
+        if (
+            system["id64"] not in latest
+            or latest[system["id64"]]["system"][0]["date"] < system["date"]
+        ):
+            latest[system["id64"]] = rows
+    return latest
+
+
+def upsert_factions(session: Session, batch: list[dict]) -> None:
+    """Insert or update the factions referenced by a batch of systems
+    from a Spansh data dump, skipping systems that are no newer than
+    what's stored, since importing those fails anyway.  Factions are
+    written in name order so that concurrent transactions lock rows in
+    the same order and cannot deadlock.  Loading the systems via the
+    ORM afterwards can then leave the faction table alone; cf.
+    lethbridge.factions.keep_factions()."""
+    latest = _latest(batch)
+    system = _table("system")
+    stored = dict(
+        session.connection()
+        .execute(
+            select(system.c.id64, system.c.date).where(system.c.id64.in_(list(latest)))
+        )
+        .all()
+    )
+    rows = [
+        faction
+        for id64, flattened in latest.items()
+        if stored.get(id64) is None
+        or _utc(stored[id64]) < _utc(flattened["system"][0]["date"])
+        for faction in flattened["faction"]
+    ]
+    if rows:
+        session.connection().execute(
+            _faction_upsert(session.get_bind().dialect.name, True),
+            _first_by(rows, "name"),
+        )
+
+
+def upsert_systems(session: Session, batch: list[dict]) -> int:
+    """Insert or update a batch of systems from a Spansh data dump
+    using native SQL upserts instead of the ORM.  Returns the number
+    of systems inserted or updated.
+
+    Each table gets one `INSERT ... ON CONFLICT DO UPDATE ... WHERE`
+    statement, so the database itself skips systems, bodies,
+    stations, markets, shipyards, and outfitting services that are no
+    newer than what's stored.  Child rows are only synchronized for
+    the rows each statement reports as inserted or updated, and then
+    only the children that differ are written.  Within the batch, only
+    the newest copy of each system is used."""
+    dialect = session.get_bind().dialect.name
+
+    # keep the latest copy of each system
+    latest = _latest(batch)
+    if not latest:
+        return 0
+
+    # make sure every referenced faction exists
+    connection = session.connection()
+    _insert_factions(session, [f for rows in latest.values() for f in rows["faction"]])
+
+    # systems, plus the factions and children of accepted systems
+    systems = _upsert(
+        session, "system", [rows["system"][0] for rows in latest.values()]
+    )
+    if not systems:
+        return 0
+    accepted = {
+        table: [row for id64 in systems for row in latest[id64][table]]
+        for table in next(iter(latest.values()))
+    }
+    if accepted["faction"]:
+        connection.execute(
+            _faction_upsert(dialect, True), _first_by(accepted["faction"], "name")
+        )
+    _sync_children(session, "system", systems, accepted)
+
+    # bodies and their children
+    bodies = _upsert(session, "body", accepted["body"])
+    _detach(
+        session,
+        "body",
+        "id64",
+        "system_id64",
+        systems,
+        {row["id64"] for row in accepted["body"]},
+    )
+    _replace_signals(session, bodies)
+    _sync_children(session, "body", bodies, accepted)
+    _insert_signals(
+        session,
+        [
+            row
+            for row in accepted["signals"]
+            if row["body_id64"] in bodies
+            or row["ring_name"]
+            in {
+                ring["name"] for ring in accepted["ring"] if ring["body_id64"] in bodies
+            }
+        ],
+    )
+
+    # stations, their children, and their services
+    stations = _upsert(session, "station", accepted["station"])
+    station_ids = {row["id"] for row in accepted["station"]}
+    _detach(session, "station", "id", "system_id64", systems, station_ids)
+    _detach(
+        session,
+        "station",
+        "id",
+        "body_id64",
+        {row["id64"] for row in accepted["body"]},
+        station_ids,
+    )
+    _sync_children(session, "station", stations, accepted)
+    for service in ["market", "shipyard", "outfitting"]:
+        services = _upsert(
+            session,
+            service,
+            [row for row in accepted[service] if row["station_id"] in stations],
+        )
+        _sync_children(session, service, services, accepted)
+
+    return len(systems)
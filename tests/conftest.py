@@ -15,12 +15,17 @@
 # License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 
+import warnings
+from collections import deque
 from decimal import Decimal
+from itertools import zip_longest
 from math import isclose
+from operator import itemgetter, methodcaller
 from pathlib import Path
 from warnings import warn
 
 import simplejson as json
+from dateutil.parser import parse
 from pytest import fixture, mark, param
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -53,6 +58,88 @@ class Utilities:
         else:
             return False
 
+    @staticmethod
+    def touch(load_data, date):
+        """Date a Spansh record's system, bodies, stations, and station
+        services as of the given time, in place, so that it passes as
+        newer than what's stored."""
+        load_data["date"] = date
+        stations = list(load_data.get("stations") or [])
+        for body in load_data.get("bodies") or []:
+            body["updateTime"] = date
+            stations.extend(body.get("stations") or [])
+        for station in stations:
+            station["updateTime"] = date
+            for service in ["market", "shipyard", "outfitting"]:
+                if station.get(service):
+                    station[service]["updateTime"] = date
+        return load_data
+
+    @staticmethod
+    def assert_spansh_equivalent(dump_data, load_data):
+        """Walk a Spansh record and its round-tripped counterpart in
+        parallel, comparing corresponding nodes."""
+        # walk source and output data in parallel, depth first,
+        # comparing each pair of source/output nodes along the way
+        stack = deque()
+        stack.append((dump_data, load_data, "top level"))
+        while stack:
+            (to, fro, ctx) = stack.pop()
+            if isinstance(to, list):
+                assert isinstance(fro, list)
+                assert len(to) == len(fro), ctx
+                if len(to):
+                    # peek at first element to figure out sorting
+                    start = next(iter(to))
+                    # default to list of strings
+                    sorter = None
+                    if isinstance(start, dict):
+                        if "symbol" in start:
+                            # list of commodities
+                            sorter = itemgetter("symbol")
+                        elif "name" in start:
+                            # list of objects
+                            sorter = itemgetter("name")
+                        else:
+                            # list of key/value pairs
+                            sorter = methodcaller("__str__")
+                    # sort to/fro and pair corresponding elements of each
+                    stack.extend(
+                        zip_longest(
+                            sorted(to, key=sorter),
+                            sorted(fro, key=sorter),
+                            [],
+                            fillvalue=ctx,
+                        )
+                    )
+            elif isinstance(to, dict):
+                assert isinstance(fro, dict)
+                assert set(to) <= set(fro), ctx
+                if "name" in to and "symbol" not in to:
+                    ctx = to["name"]
+                for k in to:
+                    stack.append((to[k], fro[k], ctx))
+            else:
+                try:
+                    # try parsing to/fro as date/time values
+                    new_to = parse(to)
+                    # try detecting which date/time format Spansh used
+                    if "T" in fro:
+                        # e.g., "2023-06-12T05:05:24"
+                        new_fro = parse(fro)
+                    else:
+                        # e.g., "2023-06-12 05:05:24+00"
+                        new_fro = parse(fro[:-3])
+                    # if we got this far, it worked
+                    to = new_to
+                    fro = new_fro
+                except:  # noqa: E722
+                    pass
+                with warnings.catch_warnings():
+                    # suppress the warning about an approximate match
+                    warnings.simplefilter("ignore")
+                    assert Utilities.approximately(to, fro), ctx
+
 
 @fixture
 def utilities():
@@ -131,11 +218,22 @@ def mock_galaxy_data_small():
     yield json.loads(data_file.read_text(), use_decimal=True)
 
 
+@fixture(scope="session")
+def mock_galaxy_data_detailed():
+    data_file = Path(__file__).parent / "mock-galaxy-data-detailed.json"
+    yield json.loads(data_file.read_text(), use_decimal=True)
+
+
 @fixture(scope="session")
 def mock_galaxy_data_file():
     yield str(Path(__file__).parent / "mock-galaxy-data.json")
 
 
+@fixture(scope="session")
+def mock_galaxy_data_detailed_file():
+    yield str(Path(__file__).parent / "mock-galaxy-data-detailed.json")
+
+
 @fixture(scope="session")
 def mock_spansh_import():
     yield str(Path(__file__).parent / "mock-spansh-import.json")
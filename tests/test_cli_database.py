@@ -23,7 +23,7 @@ from subprocess import run
 from alembic.config import Config
 from alembic.script import ScriptDirectory
 from pytest import mark, param
-from sqlalchemy import create_engine, make_url, text
+from sqlalchemy import create_engine, inspect, make_url, text
 from typer.testing import CliRunner
 
 from lethbridge import cli
@@ -91,3 +91,9 @@ def test_cli_database_upgrade(mock_cmd_prefix, revision, request):
     with engine.connect() as conn:
         result = conn.execute(text("select version_num from alembic_version"))
         assert head_revision == result.scalar_one()
+
+    # verify the hot lookup columns got indexed
+    indexes = inspect(engine).get_indexes("station")
+    assert {"ix_station_name", "ix_station_system_id64"} <= {
+        index["name"] for index in indexes
+    }
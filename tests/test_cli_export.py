@@ -0,0 +1,87 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import simplejson as json
+from pytest import importorskip
+from typer.testing import CliRunner
+
+from lethbridge import cli
+from lethbridge.schemas.spansh import SystemSchema
+from lethbridge.streams import open_dataset
+
+runner = CliRunner()
+
+
+def test_cli_export_spansh(
+    mock_cmd_prefix, mock_session, mock_galaxy_data_detailed, tmp_path
+):
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    output = tmp_path / "galaxy.json.gz"
+    for args, expected in [
+        ([], [20, 10477373803]),
+        (["--since", "2023-06-13"], [20]),
+        (["--within", "Test System 10", "10"], [10477373803]),
+        (["--within", "20", "100", "--page-size", "1"], [20, 10477373803]),
+    ]:
+        result = runner.invoke(
+            cli.app, mock_cmd_prefix + ["export", "spansh", str(output)] + args
+        )
+        assert result.exit_code == 0
+        assert f"Exported {len(expected)} systems" in result.output
+        with open_dataset(output) as ds:
+            assert expected == [system["id64"] for system in json.load(ds)]
+
+    result = runner.invoke(
+        cli.app,
+        mock_cmd_prefix
+        + ["export", "spansh", str(output), "--within", "No Such System", "10"],
+    )
+    assert result.exit_code != 0
+    assert "No such system" in result.output
+
+
+def test_cli_export_parquet(
+    mock_cmd_prefix, mock_session, mock_galaxy_data_detailed, tmp_path
+):
+    ds = importorskip("pyarrow.dataset")
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    directory = tmp_path / "parquet"
+    args = ["export", "parquet", str(directory), "-t", "system", "-t", "market_order"]
+    result = runner.invoke(cli.app, mock_cmd_prefix + args)
+    assert result.exit_code == 0
+    assert "Exported 2 rows from system" in result.output
+    assert "Exported 4 rows from market_order" in result.output
+    assert {"system", "market_order"} == {p.name for p in directory.iterdir()}
+    assert 2 == ds.dataset(directory / "system", partitioning="hive").count_rows()
+
+    # exporting again replaces the datasets
+    result = runner.invoke(cli.app, mock_cmd_prefix + args)
+    assert result.exit_code == 0
+    assert {"system", "market_order"} == {p.name for p in directory.iterdir()}
+    assert 2 == ds.dataset(directory / "system", partitioning="hive").count_rows()
+
+    result = runner.invoke(
+        cli.app, mock_cmd_prefix + ["export", "parquet", str(directory), "-t", "nope"]
+    )
+    assert result.exit_code != 0
+    assert "No such table: nope" in result.output
@@ -22,13 +22,17 @@
 # 4. Running another import with new/updated data.
 # 5. Performing some more database queries.
 
+import gzip
 import importlib
 from configparser import ConfigParser
+from copy import deepcopy
+from datetime import datetime, timezone
 
 import alembic.command
 import alembic.config
+import simplejson as json
 from pytest import fixture, mark, param
-from sqlalchemy import create_engine, func, select
+from sqlalchemy import create_engine, func, inspect, select
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 from typer import Context
@@ -36,7 +40,15 @@ from typer.core import TyperCommand
 from typer.testing import CliRunner
 
 from lethbridge import cli
-from lethbridge.database import System
+from lethbridge.database import (
+    CommodityPrice,
+    ImportCheckpoint,
+    MarketOrder,
+    MarketOrderHistory,
+    System,
+)
+from lethbridge.schemas.spansh import SystemSchema
+from lethbridge.streams import fingerprint, json_array_offsets
 
 runner = CliRunner()
 
@@ -62,23 +74,157 @@ def mock_cmd_prefix_initialized(mock_cmd_prefix):
     yield mock_cmd_prefix
 
 
+@fixture
+def mock_spansh_import_gz(mock_spansh_import, tmp_path):
+    mock_file = tmp_path / "mock-spansh-import.json.gz"
+    with open(mock_spansh_import, "rb") as f:
+        mock_file.write_bytes(gzip.compress(f.read()))
+    yield str(mock_file)
+
+
+@fixture
+def mock_spansh_import_pretty(mock_spansh_import, tmp_path):
+    # the mock dump is deliberately sloppy about commas, so re-format
+    # it line by line
+    mock_file = tmp_path / "mock-spansh-import-pretty.json"
+    with open(mock_spansh_import) as f:
+        data = [json.loads(line.rstrip(",\n")) for line in list(f)[1:-1]]
+    mock_file.write_text(json.dumps(data, indent=4))
+    yield str(mock_file)
+
+
+@mark.parametrize(
+    "import_args",
+    [
+        param([]),
+        param(["--fast-load"]),
+        param(["--upsert"]),
+    ],
+)
+def test_cli_import_spansh_stale_prices(
+    mock_cmd_prefix_initialized,
+    mock_galaxy_data_detailed_file,
+    mock_galaxy_data_detailed,
+    import_args,
+    tmp_path,
+    utilities,
+):
+    result = runner.invoke(
+        cli.app,
+        mock_cmd_prefix_initialized
+        + ["import", "spansh", mock_galaxy_data_detailed_file, "--foreground"]
+        + import_args,
+    )
+    assert result.exit_code == 0
+
+    # the orbital station leaves the first system, and the surface
+    # port's market sells out
+    first, second = deepcopy(mock_galaxy_data_detailed)
+    utilities.touch(first, "2030-01-01 00:00:00+00")
+    first["stations"] = []
+    [body] = [body for body in first["bodies"] if body.get("stations")]
+    [station] = body["stations"]
+    station["market"]["commodities"] = []
+    dump_file = tmp_path / "update.json"
+    dump_file.write_text(json.dumps([first]))
+    result = runner.invoke(
+        cli.app,
+        mock_cmd_prefix_initialized
+        + ["import", "spansh", str(dump_file), "--foreground"]
+        + import_args,
+    )
+    assert result.exit_code == 0
+
+    # neither keeps its prices
+    app_cfg = ConfigParser()
+    app_cfg.read_file(open(mock_cmd_prefix_initialized[-1]))
+    engine = create_engine(app_cfg["database"]["uri"], poolclass=NullPool)
+    Session = sessionmaker(engine)
+    with Session.begin() as session:
+        stmt = select(CommodityPrice.station_id).distinct()
+        assert [second["stations"][0]["id"]] == session.scalars(stmt).all()
+
+
+@mark.order("last")
+def test_cli_import_spansh_bulk_copy_duplicates(
+    mock_cmd_prefix_initialized, mock_galaxy_data_detailed, tmp_path
+):
+    # a dump listing the same system twice must not abort the COPY
+    first, second = mock_galaxy_data_detailed
+    dump_file = tmp_path / "duplicates.json"
+    dump_file.write_text(json.dumps([first, second, first]))
+    result = runner.invoke(
+        cli.app,
+        mock_cmd_prefix_initialized
+        + [
+            "import",
+            "spansh",
+            str(dump_file),
+            "--foreground",
+            "--bulk-copy",
+            "--history",
+        ],
+    )
+
+    app_cfg = ConfigParser()
+    app_cfg.read_file(open(mock_cmd_prefix_initialized[-1]))
+    db_uri = app_cfg["database"]["uri"]
+    if not db_uri.startswith("postgres"):
+        # bulk copy is PostgreSQL-only
+        assert result.exit_code != 0
+        return
+    assert result.exit_code == 0
+
+    engine = create_engine(db_uri, poolclass=NullPool)
+    Session = sessionmaker(engine)
+    with Session.begin() as session:
+        assert session.scalar(select(func.count()).select_from(System)) == 2
+        # the loaded prices seed each market order's history
+        orders = session.scalar(select(func.count()).select_from(MarketOrder))
+        assert orders
+        assert orders == session.scalar(
+            select(func.count()).select_from(MarketOrderHistory)
+        )
+
+
 @mark.order("last")
+@mark.parametrize(
+    "import_args",
+    [
+        param([]),
+        param(["--batch-size", "3"]),
+        param(["--batch-size", "100"]),
+        param(["--batch-size", "2", "--workers", "2"]),
+        param(["--batch-size", "100", "--upsert"]),
+        param(["--batch-size", "2", "--workers", "2", "--upsert"]),
+        param(["--batch-size", "3", "--fast-load"]),
+        param(["--batch-size", "2", "--workers", "2", "--fast-load"]),
+        param(["--batch-size", "2", "--workers", "2", "--history"]),
+    ],
+)
 @mark.parametrize(
     "mock_import_file_fixture, expected_systems",
     [
         param("mock_spansh_import", 6),
+        param("mock_spansh_import_gz", 6),
+        param("mock_spansh_import_pretty", 6),
         param("mock_galaxy_data_file", 11, marks=mark.slow),
     ],
 )
 def test_cli_import_spansh(
-    mock_cmd_prefix_initialized, mock_import_file_fixture, expected_systems, request
+    mock_cmd_prefix_initialized,
+    mock_import_file_fixture,
+    expected_systems,
+    import_args,
+    request,
 ):
     mock_import_file = request.getfixturevalue(mock_import_file_fixture)
     result = runner.invoke(
         cli.app,
         ["-v"]
         + mock_cmd_prefix_initialized
-        + ["import", "spansh", mock_import_file, "--foreground"],
+        + ["import", "spansh", mock_import_file, "--foreground"]
+        + import_args,
     )
     assert result.exit_code == 0
     assert "IntegrityError" not in result.output
@@ -94,6 +240,126 @@ def test_cli_import_spansh(
         assert expected_systems == session.scalars(stmt).first()
 
 
+@mark.order("last")
+def test_cli_import_spansh_bulk_copy(
+    mock_cmd_prefix_initialized,
+    mock_galaxy_data_detailed_file,
+    mock_galaxy_data_detailed,
+    utilities,
+):
+    result = runner.invoke(
+        cli.app,
+        ["-v"]
+        + mock_cmd_prefix_initialized
+        + [
+            "import",
+            "spansh",
+            mock_galaxy_data_detailed_file,
+            "--foreground",
+            "--bulk-copy",
+        ],
+    )
+
+    app_cfg = ConfigParser()
+    app_cfg.read_file(open(mock_cmd_prefix_initialized[-1]))
+    db_uri = app_cfg["database"]["uri"]
+    if not db_uri.startswith("postgres"):
+        # bulk copy is PostgreSQL-only
+        assert result.exit_code != 0
+        return
+    assert result.exit_code == 0
+
+    # the bulk-loaded systems must round-trip like ORM-loaded ones
+    engine = create_engine(db_uri, poolclass=NullPool)
+    Session = sessionmaker(engine)
+    for load_data in mock_galaxy_data_detailed:
+        with Session.begin() as session:
+            dump_data = SystemSchema().dump(session.get(System, load_data["id64"]))
+        utilities.assert_spansh_equivalent(dump_data, load_data)
+
+    # the foreign key constraints must be back in place
+    assert inspect(engine).get_foreign_keys("body")
+
+    # a second bulk copy must refuse to touch the now non-empty database
+    result = runner.invoke(
+        cli.app,
+        mock_cmd_prefix_initialized
+        + [
+            "import",
+            "spansh",
+            mock_galaxy_data_detailed_file,
+            "--foreground",
+            "--bulk-copy",
+        ],
+    )
+    assert result.exit_code != 0
+
+
+@mark.order("last")
+@mark.parametrize(
+    "import_args",
+    [
+        param([]),
+        param(["--batch-size", "2", "--workers", "2"]),
+    ],
+)
+def test_cli_import_spansh_resume(
+    mock_cmd_prefix_initialized,
+    mock_galaxy_data_detailed_file,
+    mock_galaxy_data_detailed,
+    import_args,
+):
+    app_cfg = ConfigParser()
+    app_cfg.read_file(open(mock_cmd_prefix_initialized[-1]))
+    db_uri = app_cfg["database"]["uri"]
+    engine = create_engine(db_uri, poolclass=NullPool)
+    Session = sessionmaker(engine)
+
+    # pretend an earlier import died right after the first system
+    with open(mock_galaxy_data_detailed_file, "rb") as f:
+        (offset, _), _ = json_array_offsets(f)
+    with Session.begin() as session:
+        session.add(
+            ImportCheckpoint(
+                dataset=fingerprint(mock_galaxy_data_detailed_file),
+                filename="mock-galaxy-data-detailed.json",
+                offset=offset,
+                systems=1,
+                updated=datetime.now(timezone.utc),
+            )
+        )
+
+    result = runner.invoke(
+        cli.app,
+        mock_cmd_prefix_initialized
+        + [
+            "import",
+            "spansh",
+            mock_galaxy_data_detailed_file,
+            "--foreground",
+            "--resume",
+        ]
+        + import_args,
+    )
+    assert result.exit_code == 0
+
+    # only the second system should have been imported, and the
+    # checkpoint should now cover both
+    first, second = mock_galaxy_data_detailed
+    with Session.begin() as session:
+        assert session.get(System, first["id64"]) is None
+        assert session.get(System, second["id64"]) is not None
+        checkpoint = session.get(
+            ImportCheckpoint, fingerprint(mock_galaxy_data_detailed_file)
+        )
+        assert checkpoint.systems == 2
+        assert checkpoint.offset > offset
+
+        # the importer keeps the commodity prices in step
+        stmt = select(CommodityPrice.station_id).distinct()
+        assert [3700000002] == session.scalars(stmt).all()
+
+
 @fixture
 def mock_cmd_prefix_imported(mock_cmd_prefix_initialized, mock_spansh_import):
     # manually load "lethbridge.cli.import" since the name is
@@ -138,9 +404,11 @@ def test_cli_import_spansh_update(
         cli.app,
         ["-v"]
         + mock_cmd_prefix_imported
-        + ["import", "spansh", mock_spansh_update, "--foreground"],
+        + ["import", "spansh", mock_spansh_update, "--foreground", "--skip-unchanged"],
     )
     assert result.exit_code == 0
+    if mock_spansh_update_fixture == "mock_spansh_import_outdated":
+        assert "Skipped 1 unchanged systems" in result.output
 
     # inspect mock database contents
     with Session.begin() as session:
@@ -0,0 +1,75 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from pytest import importorskip
+from typer.testing import CliRunner
+
+from lethbridge import cli
+from lethbridge.schemas.spansh import SystemSchema
+
+runner = CliRunner()
+
+
+def test_cli_route(mock_cmd_prefix, mock_session, tmp_path):
+    importorskip("numpy")
+
+    # four systems 10 ly apart in a line, plus a namesake of the last
+    with mock_session.begin() as session:
+        for id64, x, name in [
+            (1, 0, "Alpha"),
+            (2, 10, "Beta"),
+            (3, 20, "Gamma"),
+            (4, 30, "Delta"),
+            (5, 500, "Delta"),
+        ]:
+            load_data = {
+                "id64": id64,
+                "name": name,
+                "coords": {"x": x, "y": 0, "z": 0},
+                "date": "1970-01-01 00:00:01+00",
+                "bodies": [],
+                "stations": [],
+            }
+            session.add(SystemSchema().load(load_data, session=session))
+
+    index_file = tmp_path / "galaxy.idx"
+    for args in [["-j", "15"], ["-j", "15", "--index", str(index_file)]] * 2:
+        result = runner.invoke(
+            cli.app, mock_cmd_prefix + ["route", "Alpha", "4"] + args
+        )
+        assert result.exit_code == 0
+        assert "3. Delta (4), 10.00 ly" in result.output
+        assert "3 jumps, 30.00 ly in total" in result.output
+    assert index_file.exists()
+
+    result = runner.invoke(
+        cli.app, mock_cmd_prefix + ["route", "Alpha", "Delta", "-j", "15"]
+    )
+    assert result.exit_code != 0
+    assert "ambiguous" in result.output
+
+    result = runner.invoke(
+        cli.app, mock_cmd_prefix + ["route", "Alpha", "5", "-j", "15"]
+    )
+    assert result.exit_code != 0
+    assert "No route" in result.output
+
+    # a jump range of zero would never get anywhere
+    result = runner.invoke(
+        cli.app, mock_cmd_prefix + ["route", "Alpha", "4", "-j", "0"]
+    )
+    assert result.exit_code != 0
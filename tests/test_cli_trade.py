@@ -0,0 +1,98 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from copy import deepcopy
+
+from pytest import importorskip
+from typer.testing import CliRunner
+
+from lethbridge import cli
+from lethbridge.prices import refresh_prices
+from lethbridge.schemas.spansh import SystemSchema
+
+runner = CliRunner()
+
+
+def test_cli_trade(mock_cmd_prefix, mock_session, mock_galaxy_data_detailed):
+    importorskip("numpy")
+
+    # Palladium is cheap at one station and dear at the other; Gold the
+    # other way around
+    template = mock_galaxy_data_detailed[0]["stations"][0]
+    with mock_session.begin() as session:
+        for id64, x, palladium, gold in [
+            (1, 0, (1000, 500, 0, 0), (0, 0, 2000, 500)),
+            (2, 10, (0, 0, 1500, 500), (1500, 500, 0, 0)),
+        ]:
+            station = deepcopy(template)
+            station["id"] = id64
+            station["name"] = f"Test Station {id64}"
+            station["market"]["commodities"] = [
+                {
+                    "name": symbol,
+                    "symbol": symbol,
+                    "category": "Metals",
+                    "commodityId": commodity_id,
+                    "buyPrice": buy,
+                    "supply": supply,
+                    "sellPrice": sell,
+                    "demand": demand,
+                }
+                for symbol, commodity_id, (buy, supply, sell, demand) in [
+                    ("Palladium", 128049153, palladium),
+                    ("Gold", 128049152, gold),
+                ]
+            ]
+            for key in ["shipyard", "outfitting", "controllingFaction"]:
+                station.pop(key, None)
+            load_data = {
+                "id64": id64,
+                "name": f"Test System {id64}",
+                "coords": {"x": x, "y": 0, "z": 0},
+                "date": "2023-06-12 05:05:24+00",
+                "bodies": [],
+                "stations": [station],
+            }
+            session.add(SystemSchema().load(load_data, session=session))
+        refresh_prices(session)
+
+    result = runner.invoke(
+        cli.app, mock_cmd_prefix + ["trade", "Test System 1", "-c", "100", "-j", "15"]
+    )
+    assert result.exit_code == 0
+    assert (
+        "1. Test Station 1 (Test System 1) -> Test Station 2 (Test System 2), "
+        + "10.00 ly: 100 t of Palladium (1000 -> 1500 Cr/t), 50000 Cr profit"
+    ) in result.output
+
+    result = runner.invoke(
+        cli.app,
+        mock_cmd_prefix + ["trade", "1", "-c", "100", "-j", "15", "--loops"],
+    )
+    assert result.exit_code == 0
+    assert "1. 100000 Cr profit per round trip" in result.output
+
+    result = runner.invoke(
+        cli.app, mock_cmd_prefix + ["trade", "1", "-c", "100", "-j", "5"]
+    )
+    assert result.exit_code == 0
+    assert "No profitable trades" in result.output
+
+    result = runner.invoke(
+        cli.app, mock_cmd_prefix + ["trade", "1", "-c", "100", "-j", "0"]
+    )
+    assert result.exit_code != 0
@@ -21,6 +21,7 @@ from decimal import Decimal
 from re import search
 
 from pytest import mark, param, raises
+from sqlalchemy import event, select, update
 
 from lethbridge.database import (
     AtmosphereComposition,
@@ -44,7 +45,9 @@ from lethbridge.database import (
     StationService,
     System,
     ThargoidWar,
+    equivalent,
 )
+from lethbridge.schemas.spansh import SystemSchema
 
 
 @mark.parametrize(
@@ -265,3 +268,89 @@ def test_relationships(mock_session, thunk, expectation):
             test_system_1 = session.get(System, 1)
             thunk(test_system_1)
             session.add(test_system_1)
+
+
+def test_stale_updates_skipped(mock_session, mock_galaxy_data_detailed):
+    [load_data, _] = mock_galaxy_data_detailed
+    with mock_session.begin() as session:
+        session.add(SystemSchema().load(load_data, session=session))
+
+    # writes that bypass the ORM can't move the update times backwards
+    id64 = load_data["id64"]
+    with mock_session.begin() as session:
+        date = session.get(System, id64).date
+        [timestamp] = session.scalars(
+            select(BodyTimestamp).where(BodyTimestamp.body_id64 == id64)
+        ).all()
+        value = timestamp.value
+    hour = timedelta(hours=1)
+    for name, date_, value_, expected in [
+        ("Stale System", date - hour, value - hour, (load_data["name"], date, value)),
+        ("Same System", date, value, (load_data["name"], date, value)),
+        (
+            "Newer System",
+            date + hour,
+            value + hour,
+            ("Newer System", date + hour, value + hour),
+        ),
+    ]:
+        with mock_session.begin() as session:
+            session.execute(
+                update(System.__table__)
+                .where(System.id64 == id64)
+                .values(name=name, date=date_)
+            )
+            session.execute(
+                update(BodyTimestamp.__table__)
+                .where(BodyTimestamp.body_id64 == id64)
+                .values(value=value_)
+            )
+        with mock_session.begin() as session:
+            system = session.get(System, id64)
+            stmt = select(BodyTimestamp.value).where(BodyTimestamp.body_id64 == id64)
+            assert expected == (system.name, system.date, session.scalar(stmt))
+
+    # updates that leave the guarded column alone go through
+    with mock_session.begin() as session:
+        session.execute(
+            update(System.__table__)
+            .where(System.id64 == id64)
+            .values(name="Renamed System")
+        )
+    with mock_session.begin() as session:
+        assert "Renamed System" == session.get(System, id64).name
+
+
+def test_equality(mock_session, mock_galaxy_data_detailed):
+    [load_data, _] = mock_galaxy_data_detailed
+    with mock_session.begin() as session:
+        session.add(SystemSchema().load(load_data, session=session))
+
+    id64 = load_data["id64"]
+    with mock_session() as session_a, mock_session() as session_b:
+        a = session_a.get(System, id64)
+        b = session_b.get(System, id64)
+
+        # == compares identities and versions without loading anything
+        queries = []
+        for session in (session_a, session_b):
+            event.listen(
+                session.connection(),
+                "before_cursor_execute",
+                lambda *args: queries.append(args),
+            )
+        assert a == b
+        assert not queries
+
+        # equivalent() compares whole graphs, flushed or not
+        assert equivalent(a, b)
+        assert queries
+        assert equivalent(
+            SystemSchema().load(load_data, session=session_a, transient=True),
+            SystemSchema().load(load_data, session=session_b, transient=True),
+        )
+        b.bodies[0].materials[0].percentage += 1
+        assert a == b
+        assert not equivalent(a, b)
+        b.date += timedelta(hours=1)
+        assert a != b
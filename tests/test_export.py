@@ -0,0 +1,62 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from io import StringIO
+
+import simplejson as json
+from pytest import mark, raises
+
+from lethbridge.export import export_systems, write_systems
+from lethbridge.schemas.spansh import SystemSchema
+
+
+@mark.parametrize("page_size", [1, 1000])
+def test_export_systems(mock_session, mock_galaxy_data_detailed, utilities, page_size):
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    # everything round-trips, in id64 order
+    expected = sorted(mock_galaxy_data_detailed, key=lambda d: d["id64"])
+    with mock_session.begin() as session:
+        out = StringIO()
+        assert 2 == write_systems(out, export_systems(session, page_size=page_size))
+    exported = json.loads(out.getvalue(), use_decimal=True)
+    assert 2 == len(out.getvalue().splitlines()) - 2
+    for dump_data, load_data in zip(exported, expected):
+        utilities.assert_spansh_equivalent(dump_data, load_data)
+
+    def id64s(**kwargs):
+        with mock_session.begin() as session:
+            return [
+                system["id64"]
+                for system in export_systems(session, page_size=page_size, **kwargs)
+            ]
+
+    # filtered by update time and by distance
+    assert [20] == id64s(since=datetime(2023, 6, 13))
+    assert [] == id64s(since=datetime(2100, 1, 1))
+    center = [float(v) for v in expected[1]["coords"].values()]
+    assert [expected[1]["id64"]] == id64s(center=center, radius=1)
+    assert [20, expected[1]["id64"]] == id64s(center=center, radius=100)
+    with raises(ValueError):
+        id64s(radius=1)
+
+    out = StringIO()
+    assert 0 == write_systems(out, iter([]))
+    assert [] == json.loads(out.getvalue())
@@ -0,0 +1,121 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from copy import deepcopy
+
+from pytest import mark, raises
+from sqlalchemy import event
+
+from lethbridge.database import Faction, System
+from lethbridge.factions import FactionCache, faction_names, keep_factions
+from lethbridge.schemas.spansh import SystemLoader, SystemSchema
+from lethbridge.upsert import upsert_factions
+
+
+def test_faction_names(mock_galaxy_data_detailed):
+    first, second = mock_galaxy_data_detailed
+    assert {"Test Faction 1", "Test Faction 2"} == set(faction_names([first]))
+    assert {"Test Faction 2", "FleetCarrier"} == set(faction_names([second]))
+
+
+@mark.parametrize("fast_load", [False, True])
+def test_faction_cache(mock_session, mock_galaxy_data_detailed, fast_load):
+    first, second = mock_galaxy_data_detailed
+    cache = FactionCache()
+
+    def load(session, load_data):
+        if fast_load:
+            session.add(SystemLoader().load(load_data, session))
+        else:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    with mock_session.begin() as session:
+        cache.attach(session, [first])
+        load(session, first)
+    assert 2 == len(cache) and 0 == cache.hits
+    assert "Test Faction 1" in cache
+
+    # later transactions find known factions without querying for them
+    lookups = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().startswith("SELECT") and "FROM faction " in statement:
+            lookups.append(statement)
+
+    with mock_session.begin() as session:
+        event.listen(session.connection(), "before_cursor_execute", record)
+        cache.attach(session, [second])
+        load(session, second)
+    assert 1 == cache.hits
+    assert 1 == len(lookups)  # FleetCarrier
+    assert 3 == len(cache)
+    with mock_session.begin() as session:
+        carrier = session.get(Faction, "FleetCarrier")
+        assert carrier is not None
+
+    # the least recently used factions go first
+    cache.maxsize = 2
+    cache.update({"Test Faction 3": (None, None)})
+    assert 2 == len(cache)
+    assert "FleetCarrier" in cache and "Test Faction 3" in cache
+
+    # a rollback may have undone anything cached
+    with raises(RuntimeError):
+        with mock_session.begin() as session:
+            cache.attach(session, [second])
+            raise RuntimeError
+    assert 0 == len(cache)
+
+
+@mark.parametrize("fast_load", [False, True])
+def test_keep_factions(mock_session, mock_galaxy_data_detailed, utilities, fast_load):
+    def load(session, load_data):
+        if fast_load:
+            session.add(SystemLoader().load(load_data, session))
+        else:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    def government(load_data, value):
+        load_data = deepcopy(load_data)
+        load_data["factions"][0]["government"] = value
+        load_data["controllingFaction"]["government"] = value
+        return load_data
+
+    def stored_government():
+        with mock_session.begin() as session:
+            return session.get(Faction, "Test Faction 1").government
+
+    first, _ = mock_galaxy_data_detailed
+    with mock_session.begin() as session:
+        load(session, first)
+
+    # factions only change along with a newer copy of the system
+    with mock_session.begin() as session:
+        upsert_factions(session, [government(first, "Anarchy")])
+    assert "Cooperative" == stored_government()
+    newer = utilities.touch(deepcopy(first), "2030-01-01 00:00:00+00")
+    with mock_session.begin() as session:
+        upsert_factions(session, [government(newer, "Anarchy")])
+    assert "Anarchy" == stored_government()
+
+    # once upserted, loading systems leaves existing factions alone
+    with mock_session.begin() as session:
+        keep_factions(session)
+        load(session, government(newer, "Democracy"))
+    assert "Anarchy" == stored_government()
+    with mock_session.begin() as session:
+        assert "2030" == str(session.get(System, first["id64"]).date.year)
@@ -0,0 +1,55 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import simplejson as json
+
+from lethbridge.freshness import SystemDates, peek_date, peek_id64
+from lethbridge.schemas.spansh import SystemSchema
+
+
+def test_peek(mock_galaxy_data_detailed):
+    for load_data in mock_galaxy_data_detailed:
+        raw = json.dumps(load_data).encode()
+        assert load_data["id64"] == peek_id64(raw)
+        assert SystemSchema().fields["date"].deserialize(
+            load_data["date"]
+        ) == peek_date(raw)
+    assert peek_id64(b"{}") is None
+    assert peek_date(b'{"date": "not a date"}') is None
+
+
+def test_system_dates(mock_session, mock_galaxy_data_small):
+    with mock_session.begin() as session:
+        assert 0 == len(SystemDates.load(session))
+        for load_data in mock_galaxy_data_small:
+            session.add(SystemSchema().load(load_data, session=session))
+    with mock_session.begin() as session:
+        dates = SystemDates.load(session)
+    assert len(mock_galaxy_data_small) == len(dates)
+
+    [load_data, *_] = mock_galaxy_data_small
+    for date, stale in [
+        ("1969-12-31 23:59:59+00", True),
+        (load_data["date"], True),
+        ("1970-01-01 00:00:02+00", False),
+    ]:
+        raw = json.dumps({**load_data, "date": date}).encode()
+        assert stale == dates.is_stale(raw)
+
+    # systems not in the database aren't stale
+    raw = json.dumps({**load_data, "id64": 0}).encode()
+    assert not dates.is_stale(raw)
@@ -0,0 +1,114 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import math
+import random
+from datetime import datetime
+
+from pytest import importorskip
+from sqlalchemy import update
+
+from lethbridge.database import System
+from lethbridge.schemas.spansh import SystemSchema
+
+np = importorskip("numpy")
+galaxy = importorskip("lethbridge.galaxy")
+
+
+def _add_systems(session, points, date="1970-01-01 00:00:01+00"):
+    for id64, (x, y, z) in points.items():
+        load_data = {
+            "id64": id64,
+            "name": f"Test System {id64}",
+            "coords": {"x": x, "y": y, "z": z},
+            "date": date,
+            "bodies": [],
+            "stations": [],
+        }
+        session.add(SystemSchema().load(load_data, session=session))
+
+
+def _expected(points, center):
+    return sorted((math.dist(center, p), id64) for id64, p in points.items())
+
+
+def _check(index, points):
+    assert len(points) == len(index)
+    for center in [(0, 0, 0), (-150.5, 20, 99), (1000, 1000, 1000)]:
+        expected = _expected(points, center)
+        for k in [1, 7, len(points) + 1]:
+            id64s, distances = index.nearest(center, k)
+            assert [id64 for _, id64 in expected[:k]] == id64s.tolist()
+            assert np.allclose([d for d, _ in expected[:k]], distances)
+        for radius in [0, 25, 150]:
+            id64s, distances = index.within(center, radius)
+            assert [id64 for d, id64 in expected if d <= radius] == id64s.tolist()
+
+
+def test_galaxy_index(mock_session, tmp_path):
+    rng = random.Random(0)
+    points = {
+        id64: tuple(rng.randrange(-6400, 6400) / 32 for _ in range(3))
+        for id64 in range(1, 501)
+    }
+    with mock_session.begin() as session:
+        _add_systems(session, points)
+    with mock_session.begin() as session:
+        index = galaxy.GalaxyIndex.build(session, leaf_size=8)
+    _check(index, points)
+
+    # round-trip through a memory-mapped file
+    path = tmp_path / "galaxy.idx"
+    index.save(path)
+    index = galaxy.GalaxyIndex.open(path)
+    assert isinstance(index.coords, np.memmap)
+    assert datetime(1970, 1, 1, 0, 0, 1) == index.built
+    _check(index, points)
+
+    # add a system and move another, then pick up just those two
+    with mock_session.begin() as session:
+        _add_systems(session, {1000: (1.5, 2.5, 3.5)}, "1970-01-01 00:00:02+00")
+        session.execute(
+            update(System)
+            .where(System.id64 == 1)
+            .values(x=0, y=0, z=0, date=datetime(1970, 1, 1, 0, 0, 3))
+        )
+    points[1000] = (1.5, 2.5, 3.5)
+    points[1] = (0, 0, 0)
+    with mock_session.begin() as session:
+        assert 2 == index.refresh(session)
+        assert 0 == index.refresh(session)
+    assert datetime(1970, 1, 1, 0, 0, 3) == index.built
+    assert 2 == len(index.extra_id64s)
+    _check(index, points)
+
+    # folding them into the tree changes nothing
+    index.compact()
+    assert 0 == len(index.extra_id64s)
+    _check(index, points)
+
+
+def test_galaxy_index_empty(mock_session, tmp_path):
+    with mock_session.begin() as session:
+        index = galaxy.GalaxyIndex.build(session)
+    assert 0 == len(index)
+    assert index.built is None
+    path = tmp_path / "galaxy.idx"
+    index.save(path)
+    index = galaxy.GalaxyIndex.open(path)
+    assert [] == index.nearest((0, 0, 0), 3)[0].tolist()
+    assert [] == index.within((0, 0, 0), 100)[0].tolist()
@@ -0,0 +1,95 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+
+from pytest import raises
+from sqlalchemy import func, select
+
+from lethbridge.database import Market, MarketOrder, MarketOrderHistory
+from lethbridge.history import price_history, price_trend, prune_history
+from lethbridge.prices import refresh_prices
+from lethbridge.schemas.spansh import SystemSchema
+
+
+def _count(session):
+    return session.scalar(select(func.count()).select_from(MarketOrderHistory))
+
+
+def test_market_order_history(mock_session, mock_galaxy_data_detailed):
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    # the first refresh records every order as its baseline
+    station_id = 3700000000
+    with mock_session.begin() as session:
+        refresh_prices(session, history=True)
+        orders = session.scalar(select(func.count()).select_from(MarketOrder))
+        assert orders == _count(session)
+
+        # refreshing unchanged markets records nothing new
+        refresh_prices(session, [station_id, 3700000002], history=True)
+        assert orders == _count(session)
+
+    # only the orders that changed get recorded, and only if the
+    # market is newer
+    with mock_session.begin() as session:
+        market = session.get(Market, station_id)
+        then = market.updateTime
+        market.updateTime = then + timedelta(hours=1)
+        palladium = session.get(MarketOrder, ("Palladium", "Metals", station_id))
+        palladium.buyPrice += 100
+        session.flush()
+        refresh_prices(session, [station_id], history=True)
+        assert orders + 1 == _count(session)
+
+        palladium.buyPrice += 100
+        session.flush()
+        refresh_prices(session, [station_id], history=True)
+        assert orders + 1 == _count(session)
+
+        # without history, the prices still refresh
+        market.updateTime = then + timedelta(hours=2)
+        session.flush()
+        refresh_prices(session, [station_id])
+        assert orders + 1 == _count(session)
+
+    with mock_session.begin() as session:
+        points = price_history(session, "Palladium", station_id)
+        assert [then, then + timedelta(hours=1)] == [p.updateTime for p in points]
+        assert 100 == points[1].buyPrice - points[0].buyPrice
+        assert [] == price_history(
+            session, "Palladium", station_id, since=then, until=then
+        )
+        everywhere = price_history(session, "Palladium")
+        assert len(everywhere) > len(points)
+        assert everywhere == sorted(everywhere, key=lambda p: p[1::-1])
+
+        # one bucket per hour: the cheapest purchase (from stock) and
+        # the best sale (to demand) anywhere
+        trend = price_trend(
+            session, "Palladium", timedelta(hours=1), then, then + timedelta(hours=3)
+        )
+        assert [then + timedelta(hours=h) for h in range(3)] == [p.start for p in trend]
+        assert [(12500, 14000), (12600, None), (None, None)] == [p[1:] for p in trend]
+        with raises(ValueError):
+            price_trend(session, "Palladium", timedelta(0), then, then)
+
+        # the carrier's market is a day newer than the rest
+        assert orders - 1 == prune_history(session, then + timedelta(minutes=1))
+        assert 2 == _count(session)
@@ -0,0 +1,117 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+
+from marshmallow_sqlalchemy.fields import Nested
+from sqlalchemy import event, select
+
+from lethbridge.database import Station, System
+from lethbridge.loading import FULL_SYSTEM, STATION_MARKET, SYSTEM_SUMMARY
+from lethbridge.schemas.spansh import SystemSchema
+from lethbridge.spatial import systems_within
+
+
+@contextmanager
+def count_queries(session):
+    queries = []
+    connection = session.connection()
+
+    def record(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        yield queries
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+
+
+def collections(schema):
+    """Count the collections a schema dumps, recursively."""
+    return sum(
+        field.many + collections(field.schema)
+        for field in schema.fields.values()
+        if isinstance(field, Nested)
+    )
+
+
+def test_full_system(mock_session, mock_galaxy_data_detailed, utilities):
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    def dump(*id64s, options=()):
+        with mock_session.begin() as session:
+            with count_queries(session) as queries:
+                stmt = (
+                    select(System)
+                    .where(System.id64.in_(id64s))
+                    .order_by(System.id64)
+                    .options(*options)
+                )
+                dump_data = [SystemSchema().dump(s) for s in session.scalars(stmt)]
+        return dump_data, len(queries)
+
+    id64s = sorted(load_data["id64"] for load_data in mock_galaxy_data_detailed)
+    lazy_data, lazy = dump(*id64s)
+    eager_data, eager = dump(*id64s, options=FULL_SYSTEM)
+
+    # the profile loads the same graph in at most one query per
+    # collection, however many systems there are
+    assert lazy_data == eager_data
+    assert eager <= 1 + collections(SystemSchema()) < lazy
+    for dump_data, load_data in zip(
+        eager_data, sorted(mock_galaxy_data_detailed, key=lambda d: d["id64"])
+    ):
+        utilities.assert_spansh_equivalent(dump_data, load_data)
+
+
+def test_summary_profiles(mock_session, mock_galaxy_data_detailed):
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    with mock_session.begin() as session:
+        with count_queries(session) as queries:
+            systems = systems_within(session, (0, 0, 0), 1000, SYSTEM_SUMMARY)
+            summaries = [
+                (
+                    system.controllingFaction,
+                    [state.faction.name for state in system.factions],
+                    system.powers,
+                    system.thargoidWar,
+                )
+                for system in systems
+            ]
+        assert 2 == len(summaries)
+        assert 3 == len(queries)
+
+    with mock_session.begin() as session:
+        with count_queries(session) as queries:
+            stmt = select(Station).options(*STATION_MARKET)
+            markets = {
+                station.id: (
+                    (station.system or station.body.system).id64,
+                    sorted(order.symbol for order in station.market.commodities),
+                    station.market.prohibitedCommodities,
+                )
+                for station in session.scalars(stmt).unique()
+            }
+        assert 3 == len(queries)
+    assert 10477373803 == markets[3700000001][0]
+    assert ["gold", "palladium"] == [s.lower() for s in markets[3700000000][1]]
@@ -0,0 +1,108 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+
+from pytest import raises
+
+from lethbridge.market import best_buy, best_sell
+from lethbridge.prices import refresh_prices
+from lethbridge.schemas.spansh import SystemSchema
+
+
+def _station(template, station_id, pads, updated, buy, sell):
+    station = deepcopy(template)
+    station["id"] = station_id
+    station["name"] = f"Test Station {station_id}"
+    station["landingPads"] = pads
+    station["updateTime"] = updated
+    station["market"]["updateTime"] = updated
+    station["market"]["commodities"] = [
+        {
+            "name": "Palladium",
+            "symbol": "Palladium",
+            "category": "Metals",
+            "commodityId": 128049153,
+            "demand": 100 if sell else 0,
+            "supply": 100 if buy else 0,
+            "buyPrice": buy,
+            "sellPrice": sell,
+        }
+    ]
+    for key in ["shipyard", "outfitting", "controllingFaction"]:
+        station.pop(key, None)
+    return station
+
+
+def test_best_prices(mock_session, mock_galaxy_data_detailed):
+    template = mock_galaxy_data_detailed[0]["stations"][0]
+    large = {"large": 1, "medium": 1, "small": 1}
+    small = {"small": 2}
+    now = datetime.now(timezone.utc)
+    recent = (now - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S+00")
+    stale = (now - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S+00")
+
+    # (id64, x, [(station id, pads, updated, buy price, sell price)])
+    systems = [
+        (1, 0, [(1, large, recent, 1000, 900), (2, small, recent, 800, 1200)]),
+        (2, 40, [(3, large, stale, 500, 2000), (4, large, recent, 0, 1100)]),
+        (3, 100, [(5, large, recent, 700, 1500)]),
+    ]
+    with mock_session.begin() as session:
+        for id64, x, stations in systems:
+            load_data = {
+                "id64": id64,
+                "name": f"Test System {id64}",
+                "coords": {"x": x, "y": 0, "z": 0},
+                "date": recent,
+                "bodies": [],
+                "stations": [_station(template, *station) for station in stations],
+            }
+            session.add(SystemSchema().load(load_data, session=session))
+        refresh_prices(session)
+
+    with mock_session.begin() as session:
+
+        def stations(offers):
+            return [offer.station_id for offer in offers]
+
+        # station 4 has nothing to sell, and nobody wants Gold
+        assert [3, 5, 2, 1] == stations(best_buy(session, "Palladium"))
+        assert [3, 5, 2, 4, 1] == stations(best_sell(session, "Palladium"))
+        assert [] == best_sell(session, "Gold")
+
+        # limits
+        assert [3, 5] == stations(best_sell(session, "Palladium", limit=2))
+
+        # distance, measured from a point or a system
+        offers = best_sell(session, "Palladium", (0, 0, 0), 50)
+        assert [3, 2, 4, 1] == stations(offers)
+        assert [40.0, 0.0, 40.0, 0.0] == [offer.distance for offer in offers]
+        assert "Test System 1" == offers[1].system_name
+        assert 2000 == offers[0].price
+        assert 100 == offers[0].quantity
+        assert [5] == stations(best_buy(session, "Palladium", (99, 0, 0), 10))
+
+        # landing pads and freshness
+        assert [3, 5, 1] == stations(best_buy(session, "Palladium", pad_size="L"))
+        assert [5, 2, 1] == stations(
+            best_buy(session, "Palladium", max_age=timedelta(days=1))
+        )
+
+        with raises(ValueError):
+            best_buy(session, "Palladium", radius=10)
@@ -0,0 +1,84 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from pytest import importorskip
+from sqlalchemy import func, select
+
+from lethbridge.database import Base, System
+from lethbridge.prices import refresh_prices
+from lethbridge.schemas.spansh import SystemSchema
+
+pa = importorskip("pyarrow")
+ds = importorskip("pyarrow.dataset")
+parquet = importorskip("lethbridge.parquet")
+
+
+def test_sectors():
+    # Sol is in sector (39, 32, 18), counting from the galaxy's corner
+    x, y, z = parquet.sectors(pa.array([10477373803, None], type=pa.int64()))
+    assert [39, None] == x.to_pylist()
+    assert [32, None] == y.to_pylist()
+    assert [18, None] == z.to_pylist()
+
+
+def test_export_parquet(mock_session, mock_galaxy_data_detailed, tmp_path):
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+        refresh_prices(session)
+
+    with mock_session.begin() as session:
+        counts = parquet.export_parquet(session.connection(), tmp_path, chunk_size=1)
+        for name, count in counts.items():
+            table = Base.metadata.tables[name]
+            assert count == session.scalar(select(func.count()).select_from(table))
+    assert "import_checkpoint" not in counts
+    assert counts["market_order"] and not counts["market_order_history"]
+
+    # typed columns, partitioned by slices of sectors
+    systems = ds.dataset(tmp_path / "system", partitioning="hive").to_table()
+    assert pa.float64() == systems.schema.field("x").type
+    assert pa.timestamp("us") == systems.schema.field("date").type
+    assert pa.types.is_dictionary(systems.schema.field("allegiance").type)
+    assert pa.string() == systems.schema.field("name").type
+    rows = {row["id64"]: row for row in systems.to_pylist()}
+    assert 10.5 == rows[10477373803]["x"]
+    assert (39, 32, 18) == tuple(rows[10477373803][f"sector_{axis}"] for axis in "xyz")
+    partition = tmp_path / "system" / "sector_x=39"
+    assert partition.is_dir()
+    assert not any(p.is_dir() for p in partition.iterdir())
+    orders = ds.dataset(tmp_path / "market_order", partitioning="hive").to_table()
+    assert pa.types.is_dictionary(orders.schema.field("symbol").type)
+
+    # empty tables still have a schema, and tables without a system
+    # aren't partitioned
+    history = ds.dataset(tmp_path / "market_order_history").to_table()
+    assert 0 == history.num_rows
+    assert "buyPrice" in history.schema.names
+    assert "sector_x" not in ds.dataset(tmp_path / "faction").schema.names
+
+    # exporting again replaces the earlier datasets
+    with mock_session.begin() as session:
+        session.delete(session.get(System, 20))
+    with mock_session.begin() as session:
+        counts = parquet.export_parquet(
+            session.connection(), tmp_path, tables=["system"]
+        )
+    assert {"system": 1} == counts
+    systems = ds.dataset(tmp_path / "system", partitioning="hive").to_table()
+    assert [10477373803] == systems["id64"].to_pylist()
+    assert not list(tmp_path.glob("system.*"))
@@ -0,0 +1,117 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from sqlalchemy import delete, select
+
+from lethbridge.database import CommodityPrice, MarketOrder
+from lethbridge.prices import refresh_prices, stored_stations, touched_stations
+from lethbridge.schemas.spansh import SystemSchema
+
+
+def _expected_prices(systems):
+    # (station id, symbol, system id64, pad size, buy price, sell price)
+    prices = set()
+    for system in systems:
+        stations = system["stations"] + [
+            station for body in system["bodies"] for station in body.get("stations", [])
+        ]
+        for station in stations:
+            pads = station["landingPads"]
+            pad_size = next((p[0].upper() for p in pads if pads[p]), None)
+            for order in station["market"]["commodities"]:
+                prices.add(
+                    (
+                        station["id"],
+                        order["symbol"],
+                        system["id64"],
+                        pad_size,
+                        order["buyPrice"],
+                        order["sellPrice"],
+                    )
+                )
+    return prices
+
+
+def _prices(session):
+    return {
+        (
+            price.station_id,
+            price.symbol,
+            price.system_id64,
+            price.padSize,
+            price.buyPrice,
+            price.sellPrice,
+        )
+        for price in session.scalars(select(CommodityPrice))
+    }
+
+
+def test_touched_stations(mock_galaxy_data_detailed):
+    assert {3700000000, 3700000001, 3700000002} == touched_stations(
+        mock_galaxy_data_detailed
+    )
+    assert set() == touched_stations([{"id64": 1, "bodies": [{"id64": 2}]}])
+
+
+def test_refresh_prices(mock_session, mock_galaxy_data_detailed):
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    # a full rebuild finds the system of the surface settlement via
+    # its body
+    with mock_session.begin() as session:
+        refresh_prices(session)
+    with mock_session.begin() as session:
+        expected = _expected_prices(mock_galaxy_data_detailed)
+        assert expected == _prices(session)
+        price = session.get(CommodityPrice, (3700000000, "Gold", "Metals"))
+        assert "Test Station" == price.station_name
+        assert "Test System 10" == price.system_name
+        assert 600.5 == float(price.distanceToArrival)
+
+    # incremental refreshes only touch the given stations
+    with mock_session.begin() as session:
+        for order in session.scalars(select(MarketOrder)):
+            order.buyPrice += 1
+        session.flush()
+        refresh_prices(session, [3700000002])
+        carrier = {p for p in expected if p[0] == 3700000002}
+        assert (expected - carrier) | {
+            (*p[:4], p[4] + 1, p[5]) for p in carrier
+        } == _prices(session)
+
+        # markets that lost their orders lose their prices
+        session.execute(delete(MarketOrder).where(MarketOrder.market_id == 3700000001))
+        refresh_prices(session, [3700000001])
+        assert not [p for p in _prices(session) if p[0] == 3700000001]
+
+
+def test_stored_stations(mock_session, mock_galaxy_data_detailed):
+    with mock_session() as session:
+        assert set() == stored_stations(session, mock_galaxy_data_detailed)
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    # surface ports are found via their bodies
+    [load_data, _] = mock_galaxy_data_detailed
+    with mock_session.begin() as session:
+        assert {3700000000, 3700000001} == stored_stations(
+            session, [{"id64": load_data["id64"], "stations": []}]
+        )
+        assert set() == stored_stations(session, [{"id64": 1}])
@@ -0,0 +1,88 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import math
+import random
+
+from pytest import importorskip, raises
+
+from lethbridge.database import System
+from lethbridge.schemas.spansh import SystemSchema
+
+importorskip("numpy")
+galaxy = importorskip("lethbridge.galaxy")
+route = importorskip("lethbridge.route")
+
+
+def _fewest_jumps(points, start, goal, jump_range):
+    # breadth-first search for comparison
+    frontier = [start]
+    jumps = {start: 0}
+    while frontier:
+        current = frontier.pop(0)
+        if current == goal:
+            return jumps[current]
+        for other, point in points.items():
+            if other not in jumps and math.dist(points[current], point) <= jump_range:
+                jumps[other] = jumps[current] + 1
+                frontier.append(other)
+    return None
+
+
+def test_plan_route(mock_session):
+    rng = random.Random(0)
+    points = {
+        id64: (rng.uniform(0, 200), rng.uniform(-20, 20), rng.uniform(-20, 20))
+        for id64 in range(1, 201)
+    }
+    points[1000] = (1000, 0, 0)  # out of reach
+    with mock_session.begin() as session:
+        for id64, (x, y, z) in points.items():
+            load_data = {
+                "id64": id64,
+                "name": f"Test System {id64}",
+                "coords": {"x": x, "y": y, "z": z},
+                "date": "1970-01-01 00:00:01+00",
+                "bodies": [],
+                "stations": [],
+            }
+            session.add(SystemSchema().load(load_data, session=session))
+
+    with mock_session.begin() as session:
+        index = galaxy.GalaxyIndex.build(session, leaf_size=8)
+        start = min(session.query(System), key=lambda s: s.x)
+        goal = max(
+            (s for s in session.query(System) if s.id64 != 1000), key=lambda s: s.x
+        )
+
+        for jump_range in [15, 25, 60]:
+            expected = _fewest_jumps(points, start.id64, goal.id64, jump_range)
+            found = route.plan_route(index, start, goal, jump_range)
+            assert [start.id64, goal.id64] == [found[0], found[-1]]
+            assert expected == len(found) - 1
+            for a, b in zip(found, found[1:]):
+                assert math.dist(points[a], points[b]) <= jump_range
+
+            # a weighted search may take a longer route, but not much
+            found = route.plan_route(index, start, goal, jump_range, weight=2)
+            assert len(found) - 1 <= 2 * expected
+
+        assert [start.id64] == route.plan_route(index, start, start, 15)
+        assert route.plan_route(index, start, session.get(System, 1000), 60) is None
+        for jump_range in [0, -15]:
+            with raises(ValueError):
+                route.plan_route(index, start, goal, jump_range)
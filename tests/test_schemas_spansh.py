@@ -17,20 +17,23 @@
 
 import warnings
 from collections import deque
+from copy import deepcopy
 from itertools import zip_longest
 from operator import itemgetter, methodcaller
 
 from dateutil.parser import parse
-from pytest import mark, param
+from marshmallow import ValidationError
+from pytest import mark, param, raises
 
-from lethbridge.database import System
-from lethbridge.schemas.spansh import SystemSchema
+from lethbridge.database import Faction, System
+from lethbridge.schemas.spansh import SystemLoader, SystemSchema
 
 
 @mark.parametrize(
     "galaxy_data_fixture",
     [
         param("mock_galaxy_data_small"),
+        param("mock_galaxy_data_detailed"),
         param("mock_galaxy_data", marks=mark.slow),
     ],
 )
@@ -125,3 +128,178 @@ def test_systemschema_load_and_dump(
                     # suppress the warning about an approximate match
                     warnings.simplefilter("ignore")
                     assert utilities.approximately(to, fro), ctx
+
+
+def test_systemschema_reuse(mock_session, mock_galaxy_data_detailed):
+    schema = SystemSchema()
+
+    # every nested schema shares the root's context
+    stack = [schema]
+    while stack:
+        nested = stack.pop()
+        assert nested.context is schema.context
+        stack.extend(
+            field.schema for field in nested.fields.values() if hasattr(field, "schema")
+        )
+
+    # a reused schema loads the same graph as a fresh one, and each
+    # load gets its own Faction memo unless the caller shares one
+    with mock_session() as session, session.no_autoflush:
+        for load_data in mock_galaxy_data_detailed:
+            expected = SystemSchema().dump(
+                SystemSchema().load(load_data, session=session)
+            )
+            actual = SystemSchema().dump(schema.load(load_data, session=session))
+            assert expected == actual
+        session.rollback()
+
+        [load_data, _] = mock_galaxy_data_detailed
+        first = schema.load(load_data, session=session)
+        second = schema.load(load_data, session=session)
+        assert first.controllingFaction is not second.controllingFaction
+        factions = {}
+        first = schema.load(load_data, session=session, factions=factions)
+        second = schema.load(load_data, session=session, factions=factions)
+        assert first.controllingFaction is second.controllingFaction
+        assert factions[first.controllingFaction.name] is first.controllingFaction
+
+
+@mark.parametrize(
+    "galaxy_data_fixture",
+    [
+        param("mock_galaxy_data_small"),
+        param("mock_galaxy_data_detailed"),
+        param("mock_galaxy_data", marks=mark.slow),
+    ],
+)
+def test_systemloader_load_and_dump(
+    mock_session, utilities, galaxy_data_fixture, request
+):
+    loader = SystemLoader()
+    for load_data in request.getfixturevalue(galaxy_data_fixture):
+        # the compiled loader must build the same graph as the schema
+        with mock_session() as session:
+            expected = SystemSchema().dump(
+                SystemSchema().load(load_data, session=session)
+            )
+            session.rollback()
+            actual = SystemSchema().dump(loader.load(load_data, session))
+        assert expected == actual
+
+        with mock_session.begin() as session:
+            session.add(loader.load(load_data, session))
+        with mock_session.begin() as session:
+            dump_data = SystemSchema().dump(session.get(System, load_data["id64"]))
+        utilities.assert_spansh_equivalent(dump_data, load_data)
+
+
+def test_systemloader_update(mock_session, mock_galaxy_data_small):
+    galaxy_data = mock_galaxy_data_small
+    with mock_session.begin() as session:
+        for load_data in galaxy_data:
+            session.add(SystemSchema().load(load_data, session=session))
+
+    # updates to existing systems must match the schema's, too
+    loader = SystemLoader()
+    for load_data in galaxy_data:
+        updated = deepcopy(load_data)
+        updated["name"] = "Updated System"
+        updated["date"] = "1970-01-01 00:00:02"
+        with mock_session() as session:
+            expected = SystemSchema().dump(
+                SystemSchema().load(updated, session=session)
+            )
+            session.rollback()
+            system = loader.load(updated, session)
+            assert system is session.get(System, load_data["id64"])
+            assert expected == SystemSchema().dump(system)
+
+
+@mark.parametrize("fast_load", [param(False), param(True)])
+def test_refresh(mock_session, mock_galaxy_data_detailed, utilities, fast_load):
+    def load(load_data, session):
+        if fast_load:
+            return SystemLoader().load(load_data, session, {})
+        return SystemSchema().load(load_data, session=session, factions={})
+
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(load(load_data, session))
+
+    # re-importing an unchanged copy is rejected as outdated
+    [load_data, _] = deepcopy(mock_galaxy_data_detailed)
+    with mock_session() as session:
+        with raises(ValueError, match="Update uses outdated data"):
+            load(load_data, session)
+
+    # re-importing a newer copy updates the stored children in place,
+    # matching them by primary key, and drops those no longer listed
+    utilities.touch(load_data, "2030-01-01 00:00:00+00")
+    load_data["factions"][0]["influence"] = 0.5
+    station = load_data["stations"][0]
+    station["economies"] = {name: 100 for name in list(station["economies"])[:1]}
+    station["services"] = station["services"][1:]
+    station["market"]["commodities"] = station["market"]["commodities"][1:]
+    station["market"]["commodities"][0]["buyPrice"] = 12345
+    with mock_session.begin() as session:
+        session.add(load(load_data, session))
+    with mock_session.begin() as session:
+        dump_data = SystemSchema().dump(session.get(System, load_data["id64"]))
+        utilities.assert_spansh_equivalent(dump_data, load_data)
+
+    # children no newer than the stored ones are left alone
+    outdated = utilities.touch(deepcopy(load_data), "2031-01-01 00:00:00+00")
+    market = outdated["stations"][0]["market"]
+    market["updateTime"] = "2029-01-01 00:00:00+00"
+    market["commodities"][0]["buyPrice"] = 1
+    with mock_session.begin() as session:
+        session.add(load(outdated, session))
+    with mock_session.begin() as session:
+        dump_data = SystemSchema().dump(session.get(System, load_data["id64"]))
+        utilities.assert_spansh_equivalent(
+            dump_data["stations"][0]["market"], station["market"]
+        )
+
+
+def test_systemloader_factions(mock_session, mock_galaxy_data_detailed):
+    # systems sharing a transaction share Faction objects
+    loader = SystemLoader()
+    factions = {}
+    with mock_session.begin() as session:
+        for load_data in mock_galaxy_data_detailed:
+            session.add(loader.load(load_data, session, factions))
+        assert factions
+        assert all(isinstance(faction, Faction) for faction in factions.values())
+
+
+@mark.parametrize(
+    "path, value",
+    [
+        param([], {"noSuchField": None}, id="unknown"),
+        param(["bodies", 0], {"noSuchField": None}, id="unknown-nested"),
+        param([], {"date": "not a date"}, id="invalid"),
+        param([], {"population": "lots"}, id="invalid-integer"),
+        param([], {"name": None}, id="null"),
+        param([], {"bodies": {}}, id="not-a-list"),
+    ],
+)
+def test_systemloader_validation(mock_session, mock_galaxy_data_detailed, path, value):
+    load_data = deepcopy(mock_galaxy_data_detailed[0])
+    target = load_data
+    for key in path:
+        target = target[key]
+    target.update(value)
+    loader = SystemLoader()
+    with mock_session() as session:
+        with raises(ValidationError):
+            SystemSchema().load(load_data, session=session)
+        with raises(ValidationError):
+            loader.load(load_data, session)
+
+
+def test_systemloader_missing_field(mock_session, mock_galaxy_data_detailed):
+    load_data = deepcopy(mock_galaxy_data_detailed[0])
+    del load_data["date"]
+    with mock_session() as session:
+        with raises(ValidationError, match="date"):
+            SystemLoader().load(load_data, session)
@@ -0,0 +1,79 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import random
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from lethbridge.database import System, grid_cell
+from lethbridge.schemas.spansh import SystemSchema
+from lethbridge.spatial import distance, nearest_systems, systems_within
+
+
+def test_grid_cell():
+    assert 0 == grid_cell(Decimal("0"))
+    assert 0 == grid_cell(Decimal("31.96875"))
+    assert 1 == grid_cell(Decimal("32"))
+    assert -1 == grid_cell(Decimal("-0.03125"))
+    assert -2 == grid_cell(-33.0)
+
+
+def test_spatial_queries(mock_session):
+    # scatter some systems around the origin, both sides of each axis
+    rng = random.Random(0)
+    points = {
+        id64: tuple(Decimal(rng.randrange(-6400, 6400)) / 32 for _ in range(3))
+        for id64 in range(1, 301)
+    }
+    with mock_session.begin() as session:
+        for id64, (x, y, z) in points.items():
+            load_data = {
+                "id64": id64,
+                "name": f"Test System {id64}",
+                "coords": {"x": x, "y": y, "z": z},
+                "date": "1970-01-01 00:00:01+00",
+                "bodies": [],
+                "stations": [],
+            }
+            session.add(SystemSchema().load(load_data, session=session))
+
+    with mock_session.begin() as session:
+        # the grid cells are filled in on insert
+        for system in session.scalars(select(System)):
+            assert system.cell_x == grid_cell(system.x)
+            assert system.cell_y == grid_cell(system.y)
+            assert system.cell_z == grid_cell(system.z)
+
+        for center, radius in [
+            ((0, 0, 0), 30),
+            ((-100.5, 50, 0), 75),
+            (session.get(System, 1), 120),
+            ((0, 0, 0), 5000),
+        ]:
+            expected = sorted(
+                (d, id64)
+                for id64, point in points.items()
+                if (d := distance(center, point)) <= radius
+            )
+            found = systems_within(session, center, radius)
+            assert [id64 for _, id64 in expected] == [s.id64 for s in found]
+
+        for center, k in [((0, 0, 0), 1), ((150, -150, 150), 10), ((0, 0, 0), 500)]:
+            expected = sorted((distance(center, p), id64) for id64, p in points.items())
+            found = nearest_systems(session, center, k)
+            assert [id64 for _, id64 in expected[:k]] == [s.id64 for s in found]
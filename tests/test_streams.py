@@ -0,0 +1,171 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import bz2
+import gzip
+import lzma
+from io import BytesIO
+from pathlib import Path
+
+import simplejson as json
+from pytest import importorskip, mark, param, raises
+
+from lethbridge import streams
+from lethbridge.streams import (
+    create_dataset,
+    json_array_elements,
+    json_array_offsets,
+    open_dataset,
+)
+
+
+def _zstd_compress(data):
+    zstandard = importorskip("zstandard")
+    return zstandard.ZstdCompressor().compress(data)
+
+
+@mark.parametrize(
+    "suffix, compress",
+    [
+        param("", lambda data: data),
+        param(".gz", gzip.compress),
+        param(".bz2", bz2.compress),
+        param(".xz", lzma.compress),
+        param(".zst", _zstd_compress),
+    ],
+)
+def test_open_dataset(mock_spansh_import, tmp_path, suffix, compress, monkeypatch):
+    data = Path(mock_spansh_import).read_bytes()
+
+    # the file name deliberately lacks the usual extension
+    mock_file = tmp_path / "dataset"
+    mock_file.write_bytes(compress(data))
+
+    # the file underneath any decompressor gets closed, too
+    files = []
+
+    def tracking_open(*args, **kwargs):
+        files.append(open(*args, **kwargs))
+        return files[-1]
+
+    monkeypatch.setattr(streams, "open", tracking_open, raising=False)
+    with open_dataset(mock_file, buffer_size=64) as ds:
+        assert ds.read() == data.decode()
+    assert ds.closed
+    assert files and all(f.closed for f in files)
+
+
+@mark.parametrize("suffix", ["", ".gz", ".bz2", ".xz", ".zst"])
+def test_create_dataset(mock_spansh_import, tmp_path, suffix):
+    if suffix == ".zst":
+        importorskip("zstandard")
+    data = Path(mock_spansh_import).read_text()
+    mock_file = tmp_path / f"dataset.json{suffix}"
+    with create_dataset(mock_file, buffer_size=64) as out:
+        out.write(data)
+        assert not mock_file.exists()
+    with open_dataset(mock_file) as ds:
+        assert ds.read() == data
+
+    # a failed write leaves the old file alone
+    with raises(RuntimeError):
+        with create_dataset(mock_file) as out:
+            out.write("partial")
+            raise RuntimeError()
+    with open_dataset(mock_file) as ds:
+        assert ds.read() == data
+    assert [mock_file] == list(tmp_path.iterdir())
+
+
+def test_open_dataset_concatenated(mock_spansh_import, tmp_path):
+    # gzip streams may consist of several members, e.g., from pigz
+    lines = Path(mock_spansh_import).read_bytes().splitlines(keepends=True)
+    mock_file = tmp_path / "dataset.gz"
+    mock_file.write_bytes(b"".join(gzip.compress(line) for line in lines))
+
+    with open_dataset(mock_file) as ds:
+        assert ds.readlines() == [line.decode() for line in lines]
+
+
+@mark.parametrize(
+    "layout",
+    [
+        param(lambda data: json.dumps(data), id="compact"),
+        param(lambda data: json.dumps(data, indent="\t"), id="pretty"),
+        param(
+            lambda data: "[\r\n"
+            + ",\r\n".join(json.dumps(element) for element in data)
+            + "\r\n]",
+            id="one-per-line",
+        ),
+    ],
+)
+@mark.parametrize("buffer_size", [1, 7, 4096])
+def test_json_array_elements(mock_galaxy_data_detailed, layout, buffer_size):
+    # strings containing brackets, braces, quotes, and escapes must
+    # not confuse the tokenizer
+    data = mock_galaxy_data_detailed + [
+        {"name": 'x]}"\\', "list": [1, {"name": "{["}]},
+        [{"name": "},{"}, '\\"]'],
+    ]
+    mock_stream = BytesIO(layout(data).encode())
+    elements = list(json_array_elements(mock_stream, buffer_size=buffer_size))
+    assert [json.loads(element, use_decimal=True) for element in elements] == data
+
+
+@mark.parametrize(
+    "mock_bytes, expected_elements",
+    [
+        param(b"[]", [], id="empty"),
+        param(b'[{"a": 1}, {"b"', [b'{"a": 1}'], id="truncated"),
+        param(b'{"a": 1}', [], id="not-an-array"),
+    ],
+)
+def test_json_array_elements_malformed(mock_bytes, expected_elements):
+    assert list(json_array_elements(BytesIO(mock_bytes))) == expected_elements
+
+
+@mark.parametrize(
+    "mock_bytes, expected_elements",
+    [
+        param(b'[{"a":1}, "abcdefgh"]', [b'{"a":1}'], id="string"),
+        param(b'[{"a":1},\n"abc', [b'{"a":1}'], id="truncated-string"),
+        param(b"[1,2]", [], id="numbers"),
+    ],
+)
+@mark.parametrize("buffer_size", [4, 12, 4096])
+def test_json_array_elements_scalars(mock_bytes, expected_elements, buffer_size):
+    # top-level scalars end the scan instead of hanging it, however the
+    # buffer cuts them
+    elements = json_array_elements(BytesIO(mock_bytes), buffer_size=buffer_size)
+    assert list(elements) == expected_elements
+
+
+@mark.parametrize("suffix, compress", [param("", bytes), param(".gz", gzip.compress)])
+def test_json_array_offsets_resume(
+    mock_galaxy_data_detailed, tmp_path, suffix, compress
+):
+    mock_file = tmp_path / f"dataset.json{suffix}"
+    mock_file.write_bytes(compress(json.dumps(mock_galaxy_data_detailed).encode()))
+    with open_dataset(mock_file, text=False) as ds:
+        offsets = list(json_array_offsets(ds, buffer_size=64))
+
+    # resuming after each element yields just the elements after it
+    for i, (offset, _) in enumerate(offsets):
+        with open_dataset(mock_file, text=False) as ds:
+            resumed = list(json_array_offsets(ds, buffer_size=64, offset=offset))
+        assert resumed == offsets[i + 1 :]
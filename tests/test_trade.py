@@ -0,0 +1,163 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import math
+import random
+from copy import deepcopy
+
+from pytest import importorskip
+
+from lethbridge.prices import refresh_prices
+from lethbridge.schemas.spansh import SystemSchema
+
+importorskip("numpy")
+trade = importorskip("lethbridge.trade")
+
+SYMBOLS = ["Gold", "Palladium", "Silver", "Tea"]
+
+
+def _station(template, station_id, orders, pads, distance):
+    station = deepcopy(template)
+    station["id"] = station_id
+    station["name"] = f"Test Station {station_id}"
+    station["landingPads"] = pads
+    station["distanceToArrival"] = distance
+    station["market"]["commodities"] = [
+        {
+            "name": symbol,
+            "symbol": symbol,
+            "category": "Metals",
+            "commodityId": 128049152 + i,
+            "demand": demand,
+            "supply": supply,
+            "buyPrice": buy,
+            "sellPrice": sell,
+        }
+        for i, (symbol, (buy, supply, sell, demand)) in enumerate(orders.items())
+    ]
+    for key in ["shipyard", "outfitting", "controllingFaction"]:
+        station.pop(key, None)
+    return station
+
+
+def _best_hop(a, b, capacity):
+    # the most profitable single-commodity load from a to b, by brute
+    # force
+    best = 0
+    for symbol, (buy, supply, _, _) in a["orders"].items():
+        if symbol not in b["orders"] or not buy or not supply:
+            continue
+        _, _, sell, demand = b["orders"][symbol]
+        if sell > buy and demand:
+            best = max(best, min(capacity, supply, demand) * (sell - buy))
+    return best
+
+
+def test_find_trades(mock_session, mock_galaxy_data_detailed):
+    template = mock_galaxy_data_detailed[0]["stations"][0]
+    rng = random.Random(0)
+    stations = []
+    with mock_session.begin() as session:
+        for id64 in range(1, 9):
+            point = (rng.uniform(-30, 30), rng.uniform(-30, 30), 0)
+            system_stations = []
+            for n in range(3):
+                orders = {
+                    symbol: (
+                        rng.choice([0, rng.randrange(100, 1000)]),
+                        rng.randrange(0, 500),
+                        rng.choice([0, rng.randrange(100, 1000)]),
+                        rng.randrange(0, 500),
+                    )
+                    for symbol in rng.sample(SYMBOLS, 3)
+                }
+                pads = rng.choice([{"large": 1}, {"small": 1}])
+                distance = rng.choice([10, 5000])
+                station = {
+                    "id": id64 * 10 + n,
+                    "point": point,
+                    "orders": orders,
+                    "large": "large" in pads,
+                    "near": distance < 1000,
+                }
+                stations.append(station)
+                system_stations.append(
+                    _station(template, station["id"], orders, pads, distance)
+                )
+            load_data = {
+                "id64": id64,
+                "name": f"Test System {id64}",
+                "coords": dict(zip("xyz", point)),
+                "date": "2023-06-12 05:05:24+00",
+                "bodies": [],
+                "stations": system_stations,
+            }
+            session.add(SystemSchema().load(load_data, session=session))
+        refresh_prices(session)
+
+    capacity = 200
+    with mock_session.begin() as session:
+        for jump_range, radius, options, ok in [
+            (20, 100, {}, lambda s: True),
+            (40, 100, {}, lambda s: True),
+            (40, 25, {}, lambda s: math.dist((0, 0, 0), s["point"]) <= 25),
+            (40, 100, {"pad_size": "L"}, lambda s: s["large"]),
+            (40, 100, {"max_station_distance": 1000}, lambda s: s["near"]),
+        ]:
+            candidates = [s for s in stations if ok(s)]
+            pairs = [
+                (a, b)
+                for a in candidates
+                for b in candidates
+                if a is not b and math.dist(a["point"], b["point"]) <= jump_range
+            ]
+
+            expected = sorted(
+                (p for a, b in pairs if (p := _best_hop(a, b, capacity))),
+                reverse=True,
+            )[:5]
+            hops = trade.find_trades(
+                session, (0, 0, 0), capacity, jump_range, radius, limit=5, **options
+            )
+            assert expected == [hop.profit for hop in hops]
+            for hop in hops:
+                assert hop.distance <= jump_range
+                assert hop.units <= capacity
+                assert hop.profit == hop.units * (hop.sellPrice - hop.buyPrice)
+
+            expected = sorted(
+                (
+                    p
+                    for a, b in pairs
+                    if a["id"] < b["id"]
+                    and (p := _best_hop(a, b, capacity) + _best_hop(b, a, capacity))
+                ),
+                reverse=True,
+            )[:5]
+            loops = trade.find_loops(
+                session, (0, 0, 0), capacity, jump_range, radius, limit=5, **options
+            )
+            assert expected == [loop.profit for loop in loops]
+            for loop in loops:
+                assert (
+                    loop.outbound.source_station_id
+                    == loop.inbound.destination_station_id
+                )
+
+        # nothing around here
+        assert [] == trade.find_trades(session, (1000, 0, 0), capacity, 20)
+        assert [] == trade.find_loops(session, (1000, 0, 0), capacity, 20)
@@ -0,0 +1,166 @@
+# lethbridge, free/libre/open source client for EDDN (and more)
+# Copyright (C) 2023  Matthew X. Economou
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from copy import deepcopy
+
+from marshmallow import ValidationError
+from pytest import mark, param, raises
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from lethbridge.database import MarketOrder, Station, System
+from lethbridge.schemas.spansh import SystemSchema
+from lethbridge.upsert import GUARDED_TABLES, _guarded_upsert, upsert_systems
+
+
+@mark.parametrize(
+    "galaxy_data_fixture",
+    [
+        param("mock_galaxy_data_small"),
+        param("mock_galaxy_data_detailed"),
+        param("mock_galaxy_data", marks=mark.slow),
+    ],
+)
+def test_upsert_systems(mock_session, utilities, galaxy_data_fixture, request):
+    galaxy_data = request.getfixturevalue(galaxy_data_fixture)
+    with mock_session.begin() as session:
+        assert len(galaxy_data) == upsert_systems(session, galaxy_data)
+
+    # the upserted systems should round-trip just like ORM imports
+    for load_data in galaxy_data:
+        with mock_session.begin() as session:
+            new_system = session.get(System, load_data["id64"])
+            dump_data = SystemSchema().dump(new_system)
+        utilities.assert_spansh_equivalent(dump_data, load_data)
+
+    # re-importing the same data changes nothing
+    with mock_session.begin() as session:
+        assert 0 == upsert_systems(session, galaxy_data)
+
+
+def test_upsert_systems_updates(mock_session, mock_galaxy_data_detailed):
+    [load_data, _] = mock_galaxy_data_detailed
+    with mock_session.begin() as session:
+        upsert_systems(session, [load_data])
+
+    # outdated systems are skipped
+    outdated = deepcopy(load_data)
+    outdated["name"] = "Outdated System"
+    outdated["date"] = "2023-06-11 05:05:24+00"
+    with mock_session.begin() as session:
+        assert 0 == upsert_systems(session, [outdated])
+    with mock_session.begin() as session:
+        assert load_data["name"] == session.get(System, load_data["id64"]).name
+
+    # updated systems are written, but outdated stations are not
+    updated = deepcopy(load_data)
+    updated["name"] = "Updated System"
+    updated["date"] = "2023-06-13 05:05:24+00"
+    [station] = updated["stations"]
+    station["name"] = "Outdated Station"
+    station["market"]["commodities"].pop()
+    station["market"]["updateTime"] = "2023-06-14 05:05:24+00"
+    with mock_session.begin() as session:
+        assert 1 == upsert_systems(session, [outdated, updated])
+    with mock_session.begin() as session:
+        assert "Updated System" == session.get(System, load_data["id64"]).name
+        assert (
+            load_data["stations"][0]["name"] == session.get(Station, station["id"]).name
+        )
+        stmt = (
+            select(func.count())
+            .select_from(MarketOrder)
+            .where(MarketOrder.market_id == station["id"])
+        )
+        assert 2 == session.scalar(stmt)
+
+    # updated stations and markets are written
+    station["name"] = "Updated Station"
+    station["updateTime"] = "2023-06-14 05:05:24+00"
+    updated["date"] = "2023-06-14 05:05:24+00"
+    with mock_session.begin() as session:
+        assert 1 == upsert_systems(session, [updated])
+    with mock_session.begin() as session:
+        assert "Updated Station" == session.get(Station, station["id"]).name
+        assert 1 == session.scalar(stmt)
+
+
+def test_upsert_systems_deltas(mock_session, mock_galaxy_data_detailed):
+    [load_data, _] = mock_galaxy_data_detailed
+    with mock_session.begin() as session:
+        upsert_systems(session, [load_data])
+
+    # move one price, drop one commodity, and add another
+    updated = deepcopy(load_data)
+    updated["date"] = "2023-06-14 05:05:24+00"
+    [station] = updated["stations"]
+    station["updateTime"] = "2023-06-14 05:05:24+00"
+    station["market"]["updateTime"] = "2023-06-14 05:05:24+00"
+    palladium, gold = station["market"]["commodities"]
+    palladium["buyPrice"] += 100
+    silver = dict(gold, name="Silver", symbol="Silver", commodityId=128049154)
+    station["market"]["commodities"] = [palladium, silver]
+
+    # only the orders that differ get written, and the station's
+    # unchanged economies and services don't get written at all
+    writes = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        verb, _, rest = statement.lstrip().partition(" ")
+        if verb in ("INSERT", "UPDATE", "DELETE"):
+            table = rest.split()[1 if verb != "UPDATE" else 0]
+            rows = len(parameters) if executemany else 1
+            writes.append((verb, table, rows))
+
+    with mock_session.begin() as session:
+        connection = session.connection()
+        event.listen(connection, "before_cursor_execute", record)
+        assert 1 == upsert_systems(session, [updated])
+        event.remove(connection, "before_cursor_execute", record)
+    assert {("DELETE", "market_order", 1), ("INSERT", "market_order", 1)} <= set(writes)
+    assert ("UPDATE", "market_order", 1) in writes
+    assert not [w for w in writes if w[1] in ("station_economy", "station_service")]
+
+    with mock_session.begin() as session:
+        orders = {
+            order.symbol: order
+            for order in session.scalars(
+                select(MarketOrder).where(MarketOrder.market_id == station["id"])
+            )
+        }
+        assert {"Palladium", "Silver"} == set(orders)
+        assert palladium["buyPrice"] == orders["Palladium"].buyPrice
+
+
+def test_upsert_systems_unknown_field(mock_session, mock_galaxy_data_small):
+    load_data = deepcopy(mock_galaxy_data_small[0])
+    load_data["noSuchField"] = None
+    with raises(ValidationError, match="noSuchField"):
+        with mock_session.begin() as session:
+            upsert_systems(session, [load_data])
+
+
+@mark.parametrize("dialect", ["postgresql", "sqlite"])
+@mark.parametrize("name", list(GUARDED_TABLES))
+def test_guarded_upsert_null_guard(dialect, name):
+    # rows without a last update time can always be refreshed, since
+    # comparing anything with NULL is never true
+    _, guard = GUARDED_TABLES[name]
+    module = {"postgresql": postgresql, "sqlite": sqlite}[dialect]
+    sql = str(_guarded_upsert(dialect, name).compile(dialect=module.dialect()))
+    where = sql.split(" WHERE ")[-1]
+    assert guard in where and "IS NULL" in where